@@ -2,6 +2,7 @@
 
 import os
 import logging
+import multiprocessing
 from flask import Flask
 from flask_cors import CORS
 
@@ -66,4 +67,20 @@ def create_app(test_config=None):
         
         logging.info("Aplicación creada y blueprints registrados.")
 
+        # Con 'spawn' los workers del pool de render reimportan run.py y vuelven a llamar a
+        # create_app(): las tareas de arranque solo se hacen en el proceso principal
+        main_process = multiprocessing.parent_process() is None
+
+        # Compilación anticipada de plantillas DOCX (desactivable con DOCGEN_PRECOMPILE_ON_STARTUP=0)
+        if main_process and os.environ.get('DOCGEN_PRECOMPILE_ON_STARTUP', '1').lower() not in ('0', 'false', 'no'):
+            from .services.doc_generation.generation_service import doc_generator_service
+            doc_generator_service.precompile_templates()
+            # Con DOCGEN_RENDER_BACKEND=process arranca ya los workers (cada uno precompila las suyas)
+            doc_generator_service.warm_up_render_pool()
+
+        # Workers de la cola de documentos (trabajos pendientes sobreviven a reinicios)
+        if main_process and os.environ.get('DATABASE_URL'):
+            from .services.docgen_job_service import docgen_jobs
+            docgen_jobs.start(app)
+
     return app
\ No newline at end of file
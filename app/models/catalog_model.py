@@ -10,7 +10,8 @@ def get_catalog_data(conn, table_name, order_by_column="id", columns="*"):
         "inversores", "paneles_solares", "contadores", "baterias", 
         "tipos_vias", "distribuidoras", "categorias_instalador", "tipos_finca",
         "tipos_instalacion", # <-- AÑADIDO
-        "tipos_cubierta"   # <-- AÑADIDO
+        "tipos_cubierta",   # <-- AÑADIDO
+        "tipos_estructura"  # Usado por el índice en memoria de catálogos
     ]
     
     # Comprobación de seguridad para evitar inyección SQL en el nombre de la tabla.
@@ -30,15 +31,17 @@ def get_catalog_data(conn, table_name, order_by_column="id", columns="*"):
     sql = f"SELECT {columns} FROM {table_name} ORDER BY {order_by_column}"
     return _execute_select(conn, sql)
 
-# Funciones para obtener un ítem específico por nombre (útil para generar documentos)
+# Funciones para obtener un ítem específico por nombre.
+# NOTA: la generación de documentos ya no las usa; resuelve con el índice en memoria
+# (app/services/catalog_index_service.py). Se mantienen para usos puntuales.
 def get_panel_by_name(conn, nombre_panel):
-    sql = "SELECT * FROM paneles_solares WHERE nombre_panel = ?"
+    sql = "SELECT * FROM paneles_solares WHERE nombre_panel = %s"
     return _execute_select(conn, sql, (nombre_panel,), one=True)
 
 def get_inversor_by_name(conn, nombre_inversor):
-    sql = "SELECT * FROM inversores WHERE nombre_inversor = ?"
+    sql = "SELECT * FROM inversores WHERE nombre_inversor = %s"
     return _execute_select(conn, sql, (nombre_inversor,), one=True)
 
 def get_bateria_by_name(conn, nombre_bateria):
-    sql = "SELECT * FROM baterias WHERE nombre_bateria = ?"
+    sql = "SELECT * FROM baterias WHERE nombre_bateria = %s"
     return _execute_select(conn, sql, (nombre_bateria,), one=True)
\ No newline at end of file
@@ -0,0 +1,192 @@
+# app/models/docgen_job_model.py
+import json
+import uuid
+from .base_model import _execute_select
+
+# CTO: la tabla la crea el propio servicio al arrancar (CREATE ... IF NOT EXISTS), no hay migraciones.
+DOCGEN_JOBS_DDL = """
+    CREATE TABLE IF NOT EXISTS docgen_jobs (
+        id UUID PRIMARY KEY,
+        app_user_id TEXT NOT NULL,
+        instalacion_id INTEGER,
+        kind TEXT NOT NULL DEFAULT 'generate_docs',
+        payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        progress_done INTEGER NOT NULL DEFAULT 0,
+        progress_total INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        result_filename TEXT,
+        result_bytes BYTEA,
+        result_oid OID,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        started_at TIMESTAMPTZ,
+        heartbeat_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ
+    );
+    CREATE INDEX IF NOT EXISTS docgen_jobs_pending_idx ON docgen_jobs (created_at) WHERE status = 'pending';
+    CREATE INDEX IF NOT EXISTS docgen_jobs_user_idx ON docgen_jobs (app_user_id, created_at DESC);
+    ALTER TABLE docgen_jobs ADD COLUMN IF NOT EXISTS result_oid OID;
+    ALTER TABLE docgen_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ;
+"""
+
+# Resultados grandes (generación masiva): large object en lugar de BYTEA (límite de 1 GB y
+# sin cargar el fichero entero en memoria). Tamaño de los bloques al copiarlo.
+_LOBJECT_CHUNK = 1024 * 1024
+
+# Columnas visibles por la API (nunca el binario del resultado)
+_STATUS_COLUMNS = """
+    id, app_user_id, instalacion_id, kind, payload, status, attempts, progress_done, progress_total,
+    error, result_filename, created_at, started_at, finished_at,
+    (result_bytes IS NOT NULL OR result_oid IS NOT NULL) AS has_result
+"""
+
+
+def ensure_schema(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(DOCGEN_JOBS_DDL)
+
+
+def create_job(conn, app_user_id, instalacion_id, payload, kind='generate_docs', progress_total=0):
+    """Encola un trabajo en estado 'pending' y devuelve su id (str)."""
+    job_id = str(uuid.uuid4())
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO docgen_jobs (id, app_user_id, instalacion_id, kind, payload, progress_total) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (job_id, str(app_user_id), instalacion_id, kind, json.dumps(payload, default=str), progress_total),
+        )
+    return job_id
+
+
+def claim_next_job(conn, stale_seconds, max_attempts):
+    """
+    Reserva el trabajo pendiente más antiguo (o uno 'running' abandonado por un worker caído)
+    con FOR UPDATE SKIP LOCKED: varios workers, en este u otros procesos, nunca toman el mismo.
+    Un trabajo 'running' está abandonado si no da señales (heartbeat_at, que renueva
+    update_progress) en 'stale_seconds', no por su duración total.
+    """
+    sql = """
+        UPDATE docgen_jobs SET status = 'running', attempts = attempts + 1, started_at = now(),
+            heartbeat_at = now(), error = NULL
+        WHERE id = (
+            SELECT id FROM docgen_jobs
+            WHERE (status = 'pending'
+                   OR (status = 'running'
+                       AND COALESCE(heartbeat_at, started_at) < now() - make_interval(secs => %s)))
+              AND attempts < %s
+            ORDER BY created_at
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, app_user_id, instalacion_id, kind, payload, attempts
+    """
+    return _execute_select(conn, sql, (stale_seconds, max_attempts), one=True)
+
+
+def update_progress(conn, job_id, done, total=None):
+    """Progreso y latido: mientras avance, el trabajo no se considera abandonado."""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "UPDATE docgen_jobs SET progress_done = %s, progress_total = COALESCE(%s, progress_total), "
+            "heartbeat_at = now() WHERE id = %s",
+            (done, total, job_id),
+        )
+
+
+def mark_done(conn, job_id, filename, data, attempt=None):
+    """
+    'data' son bytes (se guardan en result_bytes) o un fichero binario, que se copia por
+    bloques a un large object (result_oid) en la misma transacción.
+    Con 'attempt' solo se marca si el trabajo sigue siendo de ese intento (otro worker no lo
+    ha reclamado); devuelve False si no, y el llamador debe deshacer la transacción.
+    """
+    result_bytes, result_oid = data, None
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        result_bytes, result_oid = None, _write_large_object(conn, data)
+    with conn.cursor() as cursor:
+        # Un resultado anterior (trabajo reintentado) no debe quedar huérfano
+        cursor.execute(
+            "SELECT lo_unlink(result_oid) FROM docgen_jobs WHERE id = %s AND result_oid IS NOT NULL "
+            "AND (%s IS NULL OR attempts = %s)",
+            (job_id, attempt, attempt),
+        )
+        cursor.execute(
+            "UPDATE docgen_jobs SET status = 'done', result_filename = %s, result_bytes = %s, result_oid = %s, "
+            "progress_done = GREATEST(progress_done, progress_total), finished_at = now() "
+            "WHERE id = %s AND (%s IS NULL OR attempts = %s)",
+            (filename, result_bytes, result_oid, job_id, attempt, attempt),
+        )
+        return cursor.rowcount == 1
+
+
+def _write_large_object(conn, fileobj):
+    fileobj.seek(0)
+    lobj = conn.lobject(0, 'wb')
+    try:
+        while True:
+            chunk = fileobj.read(_LOBJECT_CHUNK)
+            if not chunk:
+                break
+            lobj.write(chunk)
+        return lobj.oid
+    finally:
+        lobj.close()
+
+
+def copy_result_to(conn, oid, fileobj):
+    """Copia por bloques el large object de un resultado a 'fileobj' (en la transacción de 'conn')."""
+    lobj = conn.lobject(oid, 'rb')
+    try:
+        while True:
+            chunk = lobj.read(_LOBJECT_CHUNK)
+            if not chunk:
+                break
+            fileobj.write(chunk)
+    finally:
+        lobj.close()
+
+
+def mark_failed(conn, job_id, error, retry=False):
+    """Con retry=True vuelve a 'pending' (se reintentará hasta agotar los intentos)."""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "UPDATE docgen_jobs SET status = %s, error = %s, finished_at = CASE WHEN %s THEN NULL ELSE now() END "
+            "WHERE id = %s",
+            ('pending' if retry else 'failed', str(error)[:2000], retry, job_id),
+        )
+
+
+def expire_jobs(conn, retention_seconds, stale_seconds, max_attempts):
+    """Borra trabajos terminados antiguos y da por fallidos los abandonados sin intentos restantes."""
+    with conn.cursor() as cursor:
+        # lo_unlink es estricta: solo se llama para las filas con large object
+        cursor.execute(
+            "WITH expired AS ("
+            "  DELETE FROM docgen_jobs WHERE status IN ('done', 'failed') "
+            "  AND finished_at < now() - make_interval(secs => %s) RETURNING result_oid"
+            ") SELECT count(*) AS deleted, count(lo_unlink(result_oid)) AS unlinked FROM expired",
+            (retention_seconds,),
+        )
+        deleted = cursor.fetchone()['deleted']
+        cursor.execute(
+            "UPDATE docgen_jobs SET status = 'failed', error = COALESCE(error, 'Trabajo abandonado'), finished_at = now() "
+            "WHERE status = 'running' AND attempts >= %s "
+            "AND COALESCE(heartbeat_at, started_at) < now() - make_interval(secs => %s)",
+            (max_attempts, stale_seconds),
+        )
+        return deleted, cursor.rowcount
+
+
+def get_job(conn, job_id, app_user_id):
+    """Estado del trabajo (sin el binario). None si no existe o no pertenece al usuario."""
+    sql = f"SELECT {_STATUS_COLUMNS} FROM docgen_jobs WHERE id = %s AND app_user_id = %s"
+    return _execute_select(conn, sql, (job_id, str(app_user_id)), one=True)
+
+
+def get_job_result(conn, job_id, app_user_id):
+    sql = """
+        SELECT status, result_filename, result_bytes, result_oid FROM docgen_jobs
+        WHERE id = %s AND app_user_id = %s
+    """
+    return _execute_select(conn, sql, (job_id, str(app_user_id)), one=True)
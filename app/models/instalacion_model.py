@@ -40,14 +40,10 @@ def get_all_instalaciones(conn, app_user_id, ciudad=None):
     
     return _execute_select(conn, sql, tuple(params))
 
-def get_instalacion_completa(conn, instalacion_id, app_user_id):
-    """
-    Obtiene TODOS los datos de una instalación específica, incluyendo los nuevos campos
-    de cableado directamente, ya que la tabla de tramos ha sido eliminada.
-    """
-    # CTO: La consulta ahora es más simple. 'i.*' recogerá automáticamente los nuevos
-    # campos de cableado (longitud_cable_dc_m, etc.) porque están en la tabla 'instalaciones'.
-    sql_principal = """
+# CTO: SELECT completo de una instalación (sin WHERE), compartido por la consulta individual
+# y la masiva. 'i.*' recoge automáticamente los campos de cableado (longitud_cable_dc_m, etc.)
+# porque están en la tabla 'instalaciones'.
+INSTALACION_COMPLETA_SELECT = """
         SELECT
             i.*,
             -- Datos del Cliente
@@ -129,14 +125,30 @@ def get_instalacion_completa(conn, instalacion_id, app_user_id):
         LEFT JOIN tipos_instalacion ti ON i.tipo_instalacion_id = ti.id
         LEFT JOIN tipos_cubierta tc ON i.tipo_cubierta_id = tc.id
         LEFT JOIN tipos_estructura te ON i.tipo_estructura_id = te.id
-        WHERE i.id = %s AND i.app_user_id = %s;
+"""
+
+def get_instalacion_completa(conn, instalacion_id, app_user_id):
     """
+    Obtiene TODOS los datos de una instalación específica, incluyendo los nuevos campos
+    de cableado directamente, ya que la tabla de tramos ha sido eliminada.
+    """
+    sql_principal = INSTALACION_COMPLETA_SELECT + " WHERE i.id = %s AND i.app_user_id = %s;"
     
     # CTO: La segunda consulta para los tramos ha sido ELIMINADA. La función ahora es más simple.
     instalacion_data = _execute_select(conn, sql_principal, (instalacion_id, app_user_id), one=True)
     
     return instalacion_data
 
+def get_instalaciones_completas(conn, instalacion_ids, app_user_id):
+    """
+    Igual que get_instalacion_completa pero para muchas instalaciones en una sola consulta
+    (generación masiva). Solo devuelve las que pertenecen al usuario, ordenadas por id.
+    """
+    if not instalacion_ids:
+        return []
+    sql = INSTALACION_COMPLETA_SELECT + " WHERE i.id = ANY(%s) AND i.app_user_id = %s ORDER BY i.id;"
+    return _execute_select(conn, sql, ([int(x) for x in instalacion_ids], app_user_id))
+
 
 # --- ESCRITURA ---
 def add_instalacion(conn, data):
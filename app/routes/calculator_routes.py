@@ -4,6 +4,10 @@ from flask import Blueprint, jsonify, request, current_app
 from app.auth import token_required
 # CTO: Importamos la clase desde su nueva ubicación en 'services'
 from app.services.calculator_service import ElectricalCalculator
+from app.services.calculator_cache import calculator_cache
+from app.services.string_sizing_service import size_strings_for_request
+from app.services.shading_service import shading_analysis
+from app.services.circuit_tree_service import calculate_circuit_tree
 
 bp = Blueprint('calculator', __name__)
 
@@ -23,6 +27,21 @@ def calculate_voltage_drop_endpoint(conn):
         current_app.logger.error(f"Error en la calculadora: {e}", exc_info=True)
         return jsonify({"error": "Error interno"}), 500
 
+@bp.route('/voltage-drop/tolerance', methods=['POST'])
+@token_required
+def calculate_voltage_drop_tolerance_endpoint(conn):
+    """Análisis de tolerancias (Monte Carlo) de la caída de tensión."""
+    data = request.json or {}
+    calculator = ElectricalCalculator()
+    try:
+        result = calculator.calculate_voltage_drop_tolerance(data)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error en el análisis de tolerancias: {e}", exc_info=True)
+        return jsonify({"error": "Error interno"}), 500
+
 @bp.route('/wire-section', methods=['POST'])
 @token_required
 def calculate_wire_section_endpoint(conn): # Acepta 'conn'
@@ -56,6 +75,24 @@ def calculate_panel_separation_endpoint(conn): # Acepta 'conn'
         return jsonify(result), 200
     except (ValueError, TypeError) as e:
         return jsonify({"error": f"Datos de entrada inválidos: {e}"}), 400
+
+
+@bp.route('/panel-separation/shading', methods=['POST'])
+@token_required
+def calculate_shading_endpoint(conn):
+    """
+    Simulación anual de sombras entre filas: pérdida para un paso dado, paso mínimo para
+    una pérdida objetivo y barridos inclinación × paso × latitud para curvas de compromiso.
+    """
+    data = request.json or {}
+    try:
+        result = shading_analysis(data)
+        return jsonify(result), 200
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Datos de entrada inválidos: {e}"}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error en la simulación de sombras: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor en el cálculo."}), 500
         
 # Endpoints Placeholder para los cálculos complejos
 @bp.route('/current', methods=['POST'])
@@ -119,3 +156,92 @@ def calculate_protections_endpoint(conn): # <-- LA CORRECCIÓN CLAVE
     except Exception as e:
         current_app.logger.error(f"Error inesperado en cálculo de protecciones: {e}", exc_info=True)
         return jsonify({"error": "Error interno del servidor en el cálculo."}), 500
+
+
+
+@bp.route('/optimal-section', methods=['POST'])
+@token_required
+def calculate_optimal_section_endpoint(conn):
+    """
+    Dimensiona automáticamente la sección comercial y el magnetotérmico de un circuito.
+    Acepta 'conn' para cumplir con el contrato del decorador.
+    """
+    data = request.json or {}
+    current_app.logger.info(f"Dimensionado de sección solicitado con datos: {data}")
+
+    calculator = ElectricalCalculator()
+    try:
+        result = calculator.calculate_optimal_section(data)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error inesperado en el dimensionado de sección: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor en el cálculo."}), 500
+
+
+@bp.route('/string-sizing', methods=['POST'])
+@token_required
+def calculate_string_sizing_endpoint(conn):
+    """
+    Configuraciones serie/paralelo válidas para un panel e inversor del catálogo,
+    corregidas por temperatura y ordenadas por aprovechamiento de paneles.
+    """
+    data = request.json or {}
+    current_app.logger.info(f"Dimensionado de strings solicitado con datos: {data}")
+    try:
+        result = size_strings_for_request(conn, data)
+        return jsonify(result), 200
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error inesperado en el dimensionado de strings: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor en el cálculo."}), 500
+
+
+@bp.route('/circuit-tree', methods=['POST'])
+@token_required
+def calculate_circuit_tree_endpoint(conn):
+    """
+    Caída de tensión acumulada y corriente en todos los nodos de un árbol de circuitos
+    (strings -> inversor -> cuadro -> punto de conexión), con el peor camino señalado.
+    Cuerpo: {"source_voltage": {...}, "nodes": [{"id", "parent", "length", "wire_cross_section", ...}]}
+    """
+    data = request.json or {}
+    try:
+        result = calculate_circuit_tree(data)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error inesperado en el árbol de circuitos: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor en el cálculo."}), 500
+
+@bp.route('/batch', methods=['POST'])
+@token_required
+def calculate_batch_endpoint(conn):
+    """
+    Ejecuta varias operaciones de la calculadora en una sola petición.
+    Cuerpo: {"operations": [{"operation": "voltage-drop", "data": {...}}, ...]}
+    Devuelve los resultados en el mismo orden, con errores por elemento.
+    """
+    data = request.json or {}
+    operations = data.get('operations') if isinstance(data, dict) else data
+
+    calculator = ElectricalCalculator()
+    try:
+        results = calculator.run_batch(operations)
+        current_app.logger.info(f"Lote de cálculo: {len(results)} operaciones, {sum(1 for r in results if not r['ok'])} con error.")
+        return jsonify({"results": results}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error inesperado en el lote de cálculo: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor en el cálculo."}), 500
+
+
+@bp.route('/cache/stats', methods=['GET'])
+@token_required
+def calculator_cache_stats_endpoint(conn):
+    """Métricas de la caché de resultados de la calculadora (tamaño, aciertos, tasa de acierto)."""
+    return jsonify(calculator_cache.stats()), 200
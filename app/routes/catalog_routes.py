@@ -1,9 +1,11 @@
 # app/routes/catalog_routes.py
 
-from flask import Blueprint, jsonify, current_app
+from flask import Blueprint, jsonify, current_app, request
 from app.auth import db_connection_managed
 # CTO: Importamos la función desde el nuevo modelo de catálogos
 from app.models import catalog_model
+from app.services.catalog_search_service import catalog_search
+from app.services.catalog_compatibility_service import catalog_compatibility
 
 bp = Blueprint('catalog', __name__)
 
@@ -34,6 +36,40 @@ def get_catalog_data(conn, catalog_name):
     current_app.logger.info(f"Obtenidos {len(items)} items para el catálogo público '{catalog_name}'.")
     return jsonify(items)
 
+@bp.route('/catalogos/<string:catalog_name>/suggest', methods=['GET'])
+@db_connection_managed
+def suggest_catalog_items(conn, catalog_name):
+    """
+    Autocompletado para desplegables: devuelve solo los N primeros resultados.
+    Ej: /api/catalogos/paneles/suggest?q=jinko&limit=10
+    """
+    if catalog_name not in CATALOG_TABLE_MAP:
+        return jsonify({'error': f'Catálogo no válido: {catalog_name}'}), 404
+
+    config = CATALOG_TABLE_MAP[catalog_name]
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', None, type=int)
+    items = catalog_search.suggest(conn, catalog_name, config["table"], config["order_by"], query, limit)
+    return jsonify(items)
+
+@bp.route('/catalogos/paneles/<int:panel_id>/inversores-compatibles', methods=['GET'])
+@db_connection_managed
+def get_compatible_inversores(conn, panel_id):
+    """Ids de inversores que admiten un string razonable del panel (matriz precalculada)."""
+    ids = catalog_compatibility.compatible_inversores(conn, panel_id)
+    if ids is None:
+        return jsonify({'error': f'Panel no encontrado: {panel_id}'}), 404
+    return jsonify({'panel_id': panel_id, 'inversores': ids, 'total': len(ids)})
+
+@bp.route('/catalogos/inversores/<int:inversor_id>/paneles-compatibles', methods=['GET'])
+@db_connection_managed
+def get_compatible_paneles(conn, inversor_id):
+    """Ids de paneles con los que el inversor admite un string razonable (matriz precalculada)."""
+    ids = catalog_compatibility.compatible_paneles(conn, inversor_id)
+    if ids is None:
+        return jsonify({'error': f'Inversor no encontrado: {inversor_id}'}), 404
+    return jsonify({'inversor_id': inversor_id, 'paneles': ids, 'total': len(ids)})
+
 @bp.route('/tipos_estructura', methods=['GET'])
 def get_tipos_estructura(conn):
     items = catalog_model.get_public_catalog_items(conn, 'tipos_estructura')
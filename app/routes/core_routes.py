@@ -1,20 +1,29 @@
 # app/routes/core_routes.py
-from flask import Blueprint, jsonify, request, current_app, send_file, g, make_response
+from flask import Blueprint, jsonify, request, current_app, send_file, g, make_response, url_for, Response
 from decimal import Decimal
-import json, io, zipfile, os
+import json, io, os, uuid, itertools, time, tempfile
 import docxtpl
 import logging
 
 # CTO: 1. Importamos los módulos específicos, NO el antiguo 'database'
 from app.auth import token_required
 from app.services.doc_generation.generation_service import doc_generator_service 
+from app.services.doc_generation.template_cache import template_cache
+from app.services.doc_generation.template_variable_index import template_variable_index
+from app.services.doc_generation.render_cache import render_cache
+from app.services.electrical_report_service import build_electrical_report
+from app.services import bulk_docgen_service
+from app.services.docgen_job_service import (
+    docgen_jobs, load_dossier_context, prepare_dossier_context, iter_dossier_files, iter_zip_stored,
+    dossier_zip_filename
+)
 from app.utils import PROVINCE_TO_COMMUNITY_MAP, COMMUNITIES
 from app.models import (
     instalacion_model, 
     cliente_model, 
     promotor_model, 
     instalador_model,
-    catalog_model # Para las funciones get_..._by_name
+    docgen_job_model
 )
 # NOTA: las funciones get_..._by_name ahora estarán en el modelo de instalación por dependencia
 # from app.services import calculation_service # Placeholder para futura refactorización de `calc.py`
@@ -285,114 +294,254 @@ def generate_docs_api(conn, instalacion_id):
     if not community_slug:
         return jsonify({"error": "No se especificó la comunidad autónoma."}), 400
 
+    # --- Modo asíncrono: ?async=1 encola el trabajo y responde al momento con su id ---
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        try:
+            if not instalacion_model.get_instalacion_completa(conn, instalacion_id, user_id):
+                return jsonify({"error": "Instalación no encontrada o no pertenece a este usuario"}), 404
+            job_id = docgen_jobs.enqueue(
+                conn, user_id, instalacion_id,
+                {"community_slug": community_slug, "documentos": selected_doc_files},
+                progress_total=len(selected_doc_files),
+            )
+            docgen_jobs.start(current_app._get_current_object())
+            return jsonify({
+                "job_id": job_id,
+                "status": "pending",
+                "status_url": url_for('core.get_job_api', job_id=job_id),
+            }), 202
+        except Exception as e:
+            current_app.logger.error(f"Error encolando generate_docs para instalación {instalacion_id}: {e}", exc_info=True)
+            return jsonify({"error": "Error interno del servidor al encolar la generación de documentos."}), 500
+
     try:
-        instalacion_completa = instalacion_model.get_instalacion_completa(conn, instalacion_id, user_id)
-        if not instalacion_completa:
-            return jsonify({"error": "Instalación no encontrada o no pertenece a este usuario"}), 404
-
-        contexto_base = dict(instalacion_completa)
-        # Enriquecer contexto con datos de catálogo...
-        if nombre_panel := contexto_base.get('panel_solar'):
-            if panel_data := catalog_model.get_panel_by_name(conn, nombre_panel):
-                contexto_base.update(dict(panel_data))
-        if nombre_inversor := contexto_base.get('inversor'):
-            if inversor_data := catalog_model.get_inversor_by_name(conn, nombre_inversor):
-                contexto_base.update(dict(inversor_data))
-        if nombre_bateria := contexto_base.get('bateria'):
-             if bateria_data := catalog_model.get_bateria_by_name(conn, nombre_bateria):
-                 contexto_base.update(dict(bateria_data))
-        if nombre_tipo_instalacion := contexto_base.get('tipo_estructura'):
-             if estructura_data := catalog_model.get_bateria_by_name(conn, nombre_tipo_instalacion):
-                 contexto_base.update(dict(estructura_data))
-        
-        # ===== DEBUG opcional: ver el contexto que sale de BD + catálogo =====
-        # Actívalo con DOCGEN_DEBUG=1 (en local o en Render)
-        if os.getenv("DOCGEN_DEBUG", "").lower() in ("1", "true", "yes", "on"):
+        try:
+            contexto_base = load_dossier_context(conn, instalacion_id, user_id)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+
+        contexto_final = prepare_dossier_context(contexto_base, selected_doc_files, community_slug)
+
+        # Los documentos se renderizan bajo demanda mientras se envía el ZIP. El primero se
+        # genera antes de responder para poder devolver un error JSON si no sale ninguno.
+        # El generador no usa 'conn' (el decorador la devuelve al pool al salir de la vista).
+        files = iter_dossier_files(instalacion_id, contexto_final, community_slug, selected_doc_files)
+        first_file = next(files, None)
+        if first_file is None:
+            return jsonify({"error": "No se pudieron generar los documentos. Las plantillas podrían no existir para la comunidad seleccionada."}), 500
+
+        # Siempre empaquetamos la respuesta en un ZIP, sin importar cuántos archivos haya.
+        zip_filename = dossier_zip_filename(instalacion_id, first_file["name"], len(selected_doc_files))
+        current_app.logger.info(f"Enviando respuesta como ZIP en streaming: {zip_filename}")
+
+        def _stream():
             try:
-                current_app.logger.info("DOCGEN endpoint: TEMPLATES_ROOT=%s", os.getenv("TEMPLATES_ROOT"))
-                current_app.logger.info(
-                    "DOCGEN contexto_base (endpoint)\n%s",
-                    json.dumps(
-                        contexto_base,
-                        ensure_ascii=False,
-                        sort_keys=True,
-                        indent=2,
-                        default=str,   # para Decimals/fechas
-                    ),
-                )
+                yield from iter_zip_stored(itertools.chain([first_file], files))
             except Exception as e:
-                current_app.logger.info(
-                    "DOCGEN contexto_base (endpoint) keys=%d err=%s",
-                    len(contexto_base or {}),
-                    e,
-                )
-
-        logging.info(
-            ".............--------------........... contexto_base.emplazamiento_provincia: %s ------ selected_doc_files: %s",
-            contexto_base.get('emplazamiento_provincia'),
-            selected_doc_files,
-        )
-        contexto_final = doc_generator_service.prepare_document_context(contexto_base, str(contexto_base.get('emplazamiento_provincia')).lower(), selected_doc_files[0])
-        
-        generated_files_in_memory = []
-        templates_base_path = community_slug #os.path.join('templates', community_slug)
+                # Con la respuesta ya empezada solo podemos cortar el ZIP y dejar constancia
+                logging.error(f"Error en streaming de generate_docs para instalación {instalacion_id}: {e}", exc_info=True)
+                raise
+
+        # Sin Content-Length: transferencia chunked
+        response = Response(_stream(), mimetype='application/zip', direct_passthrough=True)
+        response.headers.set('Content-Disposition', 'attachment', filename=zip_filename)
+        response.headers['X-Accel-Buffering'] = 'no'  # que el proxy no acumule la respuesta
+        return response
+
+    except Exception as e:
+        current_app.logger.error(f"Error en generate_docs_api para instalación {instalacion_id}: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor al generar documentos."}), 500
+
+
+@core_bp.route('/instalaciones/<int:instalacion_id>/generate-docs/preflight', methods=['GET'])
+@token_required
+def generate_docs_preflight_api(conn, instalacion_id):
+    """
+    Validación previa sin renderizar: ?community_slug=...&documentos=A.docx&documentos=B.docx.
+    Prepara el contexto como generate-docs y lo compara con el índice de variables de cada
+    plantilla; devuelve, por documento, los campos que faltan (el render fallaría) y los vacíos.
+    """
+    user_id = g.user_id
+    community_slug = request.args.get('community_slug')
+    selected_doc_files = [doc for doc in request.args.getlist('documentos') if doc]
+    if not selected_doc_files:
+        return jsonify({"error": "No se seleccionaron documentos para generar."}), 400
+    if not community_slug:
+        return jsonify({"error": "No se especificó la comunidad autónoma."}), 400
 
-        for template_file_name in selected_doc_files:
-            template_path = os.path.join(templates_base_path, template_file_name)
+    try:
+        try:
+            contexto_base = load_dossier_context(conn, instalacion_id, user_id)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+
+        # Los 'requires' del YAML se validan al preparar: se informan sin cortar el preflight
+        context_error = None
+        try:
+            contexto = prepare_dossier_context(contexto_base, selected_doc_files, community_slug)
+        except ValueError as e:
+            context_error, contexto = str(e), contexto_base
+
+        t0 = time.perf_counter()
+        checks = doc_generator_service.preflight(
+            contexto, [os.path.join(community_slug, name) for name in selected_doc_files])
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        documents = [dict(check, template=name) for name, check in zip(selected_doc_files, checks)]
+        return jsonify({
+            "instalacion_id": instalacion_id,
+            "community_slug": community_slug,
+            "ok": context_error is None and all(d["ok"] for d in documents),
+            "context_error": context_error,
+            "documents": documents,
+            "check_ms": round(elapsed_ms, 3),
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error en generate_docs_preflight_api para instalación {instalacion_id}: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor en la validación previa."}), 500
+
+
+@core_bp.route('/instalaciones/generate-docs/bulk', methods=['POST'])
+@token_required
+def generate_docs_bulk_api(conn):
+    """
+    Mismos documentos para muchas instalaciones: {instalacion_ids, community_slug, documentos}.
+    Devuelve un ZIP en streaming con una carpeta por instalación y un manifest.json con el
+    resultado de cada una; con ?async=1 encola el trabajo (progreso por instalación).
+    """
+    user_id = g.user_id
+    data = request.get_json(silent=True) or {}
+    selected_doc_files = [doc for doc in data.get('documentos', []) if doc]
+    community_slug = data.get('community_slug')
+    try:
+        instalacion_ids = bulk_docgen_service.parse_instalacion_ids(data.get('instalacion_ids'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not selected_doc_files:
+        return jsonify({"error": "No se seleccionaron documentos para generar."}), 400
+    if not community_slug:
+        return jsonify({"error": "No se especificó la comunidad autónoma."}), 400
+    current_app.logger.info(f"Generación masiva: {len(instalacion_ids)} instalaciones, documentos {selected_doc_files}")
+
+    try:
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            job_id = docgen_jobs.enqueue(
+                conn, user_id, None,
+                {"instalacion_ids": instalacion_ids, "community_slug": community_slug, "documentos": selected_doc_files},
+                kind="bulk_generate_docs", progress_total=len(instalacion_ids),
+            )
+            docgen_jobs.start(current_app._get_current_object())
+            return jsonify({
+                "job_id": job_id,
+                "status": "pending",
+                "status_url": url_for('core.get_job_api', job_id=job_id),
+            }), 202
+
+        entries, failures = bulk_docgen_service.prepare_bulk(
+            conn, user_id, instalacion_ids, selected_doc_files, community_slug)
+        if not entries:
+            return jsonify({"error": "Ninguna de las instalaciones solicitadas se puede generar.", "failures": failures}), 404
+
+        zip_filename = bulk_docgen_service.bulk_zip_filename(len(instalacion_ids))
+
+        def _progress(done, total):
+            logging.info(f"[BULK] {zip_filename}: {done}/{total} instalaciones")
+
+        def _stream():
+            # Sin 'conn' ni current_app: todo lo que necesita la BD ya está en 'entries'
             try:
-                # La generación con docxtpl ya funciona.
-                file_bytes = doc_generator_service.generate_document(template_path, contexto_final)
-                
-                # Creamos un diccionario con toda la info necesaria para la respuesta.
-                base_name = os.path.splitext(template_file_name)[0].replace("_", " ").title()
-                output_filename = f"{base_name} - Inst {instalacion_id}.docx"
-                
-                generated_files_in_memory.append({
-                    "name": output_filename, 
-                    "bytes": file_bytes,
-                    "mimetype": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                })
-            except FileNotFoundError:
-                current_app.logger.warning(f"Plantilla no encontrada, se omite: {template_path}")
-                continue
+                yield from bulk_docgen_service.iter_bulk_archive(
+                    entries, failures, community_slug, selected_doc_files, _progress)
             except Exception as e:
-                current_app.logger.error(f"Error procesando plantilla {template_file_name}: {e}", exc_info=True)
-                continue
-        
-        # Logueamos cuántos documentos se generaron realmente.
-        current_app.logger.info(f"Generados {len(generated_files_in_memory)} documentos en memoria.")
+                logging.error(f"Error en streaming de la generación masiva ({zip_filename}): {e}", exc_info=True)
+                raise
 
+        response = Response(_stream(), mimetype='application/zip', direct_passthrough=True)
+        response.headers.set('Content-Disposition', 'attachment', filename=zip_filename)
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.headers['X-Bulk-Instalaciones'] = str(len(entries))
+        response.headers['X-Bulk-Fallidas'] = str(len(failures))
+        return response
 
-        if not generated_files_in_memory:
-            return jsonify({"error": "No se pudieron generar los documentos. Las plantillas podrían no existir para la comunidad seleccionada."}), 500
-        # Siempre empaquetamos la respuesta en un ZIP, sin importar cuántos archivos haya.
-        # Esto unifica el flujo y se apoya en el comportamiento que sabemos que funciona.
-        
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for file_info in generated_files_in_memory:
-                zf.writestr(file_info["name"], file_info["bytes"])
-        zip_buffer.seek(0)
-
-        # --- PASO 4: LÓGICA DE RESPUESTA CORREGIDA Y EXPLÍCITA ---
-        if len(generated_files_in_memory) == 1:
-            # Usamos el nombre del propio documento como nombre del zip (sin la extensión .docx).
-            zip_filename = f"{os.path.splitext(generated_files_in_memory[0]['name'])[0]}.zip"
-        else:
-            zip_filename = f"Documentacion Inst {instalacion_id}.zip"
+    except Exception as e:
+        current_app.logger.error(f"Error en generate_docs_bulk_api: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor en la generación masiva de documentos."}), 500
 
-        current_app.logger.info(f"Enviando respuesta como ZIP: {zip_filename}")
 
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=zip_filename
-        )
+def _job_id_or_none(job_id):
+    try:
+        return str(uuid.UUID(job_id))
+    except (ValueError, TypeError):
+        return None
 
+@core_bp.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_job_api(conn, job_id):
+    """Estado de un trabajo asíncrono de generación y enlace de descarga cuando termina."""
+    job_id = _job_id_or_none(job_id)
+    job = docgen_job_model.get_job(conn, job_id, g.user_id) if job_id else None
+    if not job:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    response = {
+        "job_id": str(job['id']),
+        "kind": job['kind'],
+        "status": job['status'],
+        "instalacion_id": job['instalacion_id'],
+        "attempts": job['attempts'],
+        "progress": {"done": job['progress_done'], "total": job['progress_total']},
+        "error": job['error'],
+        "created_at": job['created_at'].isoformat() if job['created_at'] else None,
+        "started_at": job['started_at'].isoformat() if job['started_at'] else None,
+        "finished_at": job['finished_at'].isoformat() if job['finished_at'] else None,
+    }
+    if job['status'] == 'done' and job['has_result']:
+        response["filename"] = job['result_filename']
+        response["download_url"] = url_for('core.download_job_api', job_id=job_id)
+    return jsonify(response), 200
+
+@core_bp.route('/jobs/<job_id>/download', methods=['GET'])
+@token_required
+def download_job_api(conn, job_id):
+    job_id = _job_id_or_none(job_id)
+    job = docgen_job_model.get_job_result(conn, job_id, g.user_id) if job_id else None
+    if not job:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    if job['status'] != 'done' or (job['result_bytes'] is None and job['result_oid'] is None):
+        return jsonify({"error": f"El trabajo no ha terminado (estado: {job['status']})"}), 409
+    if job['result_oid'] is not None:
+        # Resultado grande (large object): se copia por bloques a un temporal, no a memoria
+        result = tempfile.TemporaryFile()
+        docgen_job_model.copy_result_to(conn, job['result_oid'], result)
+        result.seek(0)
+    else:
+        result = io.BytesIO(bytes(job['result_bytes']))
+    return send_file(
+        result,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=job['result_filename']
+    )
+
+@core_bp.route('/instalaciones/<int:instalacion_id>/electrical-report', methods=['POST'])
+@token_required
+def electrical_report_api(conn, instalacion_id):
+    """
+    Informe eléctrico completo de la instalación: caída de tensión de cada string y de la
+    línea CA, comprobación de Iz' y protecciones recomendadas. El cuerpo (opcional) permite
+    sobrescribir los strings y las condiciones de instalación.
+    """
+    options = request.get_json(silent=True) or {}
+    instalacion = instalacion_model.get_instalacion_completa(conn, instalacion_id, g.user_id)
+    if not instalacion:
+        return jsonify({"error": "Instalación no encontrada o no pertenece a este usuario"}), 404
+    try:
+        report = build_electrical_report(conn, instalacion, options)
+        return jsonify(report), 200
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        current_app.logger.error(f"Error en generate_docs_api para instalación {instalacion_id}: {e}", exc_info=True)
-        return jsonify({"error": "Error interno del servidor al generar documentos."}), 500
+        current_app.logger.error(f"Error en electrical_report_api para instalación {instalacion_id}: {e}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor al calcular el informe eléctrico."}), 500
 
 @core_bp.route('/instalaciones/<int:instalacion_id>/document_options', methods=['GET'])
 @token_required
@@ -439,6 +588,17 @@ def get_docs_by_community(conn, community_slug):
     return jsonify({"available_docs": docs})
 
 
+@core_bp.route('/documentos/cache/stats', methods=['GET'])
+@token_required
+def docgen_cache_stats(conn):
+    """Métricas de las cachés de generación: plantillas parseadas/compiladas y documentos renderizados."""
+    return jsonify({
+        "templates": template_cache.stats(),
+        "variables": template_variable_index.stats(),
+        "renders": render_cache.stats(),
+    }), 200
+
+
 @core_bp.route('/clientes/<int:cliente_id>/usage', methods=['GET'])
 @token_required
 def get_cliente_usage(conn, cliente_id):
@@ -1,11 +1,13 @@
 # app/routes/utility_routes.py
 
 import os
-from flask import Blueprint, jsonify, current_app
+from flask import Blueprint, jsonify, current_app, request
 # CTO: Importamos solo la función de conexión.
 from app.database import get_conn, release_conn
 import logging
 from app.database import db_cursor
+from app.services.catalog_index_service import catalog_index
+from app.services.catalog_ingestion_service import import_catalog
 
 bp = Blueprint('utility', __name__)
 
@@ -86,6 +88,8 @@ def setup_populate_catalogs_endpoint(secret_key):
             _populate_data(cursor, 'baterias', ['nombre_bateria', 'capacidad_kwh'], CATALOG_DATA['baterias'])
         
         conn.commit()
+        # Los catálogos de equipos han cambiado: invalidamos el índice en memoria.
+        catalog_index.notify_changed()
         return jsonify({"status": "success", "message": "Todos los catálogos han sido poblados con datos de ejemplo."}), 200
 
     except Exception as e:
@@ -96,6 +100,36 @@ def setup_populate_catalogs_endpoint(secret_key):
         if conn: 
             release_conn(conn)
 
+@bp.route('/setup/import-catalog/<string:catalog>/<path:secret_key>', methods=['POST'])
+def setup_import_catalog_endpoint(catalog, secret_key):
+    """
+    Endpoint seguro para importar fichas técnicas de fabricantes (CSV/XLSX) en
+    'paneles' o 'inversores'. El fichero va en el campo multipart 'file'.
+    Con ?dry_run=1 solo valida y devuelve el informe de diferencias.
+    """
+    expected_key = os.environ.get('SETUP_SECRET_KEY')
+    if not expected_key or secret_key != expected_key:
+        return jsonify({"error": "Clave secreta no válida."}), 403
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({"error": "Falta el fichero (campo 'file')."}), 400
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+    conn = None
+    try:
+        conn = get_conn()
+        report = import_catalog(conn, catalog, upload.stream, upload.filename, dry_run=dry_run)
+        return jsonify({"status": "success", "report": report}), 200
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error al importar el catálogo {catalog}: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+    finally:
+        if conn:
+            release_conn(conn)
+
 @bp.route("/api/health/db", methods=["GET"])
 def db_health():
     try:
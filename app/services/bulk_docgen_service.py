@@ -0,0 +1,222 @@
+# app/services/bulk_docgen_service.py
+"""
+Generación masiva: los mismos documentos para muchas instalaciones en un único ZIP.
+
+Los contextos salen de una sola consulta (WHERE i.id = ANY(...)), los renders van por
+doc_generator_service.iter_render_jobs (pool de procesos si DOCGEN_RENDER_BACKEND=process)
+y el ZIP se emite en streaming con un 'manifest.json' final con el resultado por
+instalación. Uso desde línea de comandos:
+
+    python -m app.services.bulk_docgen_service --user <uid> --ids 12,13,14 \\
+        --community madrid --doc "DECLARACION RESPONSABLE.docx" --out mes.zip
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.models import instalacion_model
+from app.services.catalog_index_service import catalog_index
+from app.services.doc_generation.generation_service import doc_generator_service
+from app.services.docgen_job_service import (
+    DOCX_MIMETYPE, JOB_HANDLERS, dossier_file_name, iter_zip_stored, prepare_dossier_context,
+)
+
+# Máximo de instalaciones por petición
+DOCGEN_BULK_MAX_INSTALACIONES = int(os.getenv("DOCGEN_BULK_MAX_INSTALACIONES", "500"))
+MANIFEST_NAME = "manifest.json"
+
+ProgressFn = Callable[[int, int], None]
+
+
+def parse_instalacion_ids(raw) -> List[int]:
+    """Lista de ids sin duplicados (conserva el orden). ValueError si no es válida."""
+    if isinstance(raw, str):
+        raw = [x for x in raw.replace(";", ",").split(",") if x.strip()]
+    if not isinstance(raw, (list, tuple)) or not raw:
+        raise ValueError("'instalacion_ids' debe ser una lista no vacía.")
+    try:
+        ids = list(dict.fromkeys(int(x) for x in raw))
+    except (TypeError, ValueError):
+        raise ValueError("'instalacion_ids' solo puede contener números enteros.")
+    if len(ids) > DOCGEN_BULK_MAX_INSTALACIONES:
+        raise ValueError(f"Demasiadas instalaciones ({len(ids)}). Máximo: {DOCGEN_BULK_MAX_INSTALACIONES}.")
+    return ids
+
+
+def prepare_bulk(conn, user_id, instalacion_ids: List[int], documentos: List[str],
+                 community_slug: Optional[str] = None) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    Única parte que usa la BD (y el contexto de Flask): carga todas las instalaciones en una
+    consulta y prepara su contexto final. Devuelve ([(id, contexto_final)], fallos) en el
+    orden pedido; las instalaciones ajenas, inexistentes o con datos incompletos van a fallos.
+    """
+    rows = {int(row["id"]): row for row in instalacion_model.get_instalaciones_completas(conn, instalacion_ids, user_id)}
+    entries, failures = [], []
+    for instalacion_id in instalacion_ids:
+        row = rows.get(instalacion_id)
+        if row is None:
+            failures.append({"instalacion_id": instalacion_id, "error": "Instalación no encontrada o no pertenece a este usuario"})
+            continue
+        contexto_base = dict(row)
+        catalog_index.enrich_context(conn, contexto_base)
+        try:
+            entries.append((instalacion_id, prepare_dossier_context(contexto_base, documentos, community_slug)))
+        except (ValueError, KeyError) as e:
+            failures.append({"instalacion_id": instalacion_id, "error": str(e)})
+    logging.info(f"[BULK] {len(entries)} de {len(instalacion_ids)} instalaciones listas para generar.")
+    return entries, failures
+
+
+def bulk_zip_filename(count: int) -> str:
+    return f"Documentacion {count} instalaciones.zip"
+
+
+def iter_bulk_archive(entries: List[Tuple[int, Dict[str, Any]]], failures: List[Dict[str, Any]],
+                      community_slug: str, documentos: List[str],
+                      progress: Optional[ProgressFn] = None) -> Iterator[bytes]:
+    """
+    ZIP en streaming con una carpeta 'Inst <id>/' por instalación y un manifest.json al
+    final. No usa la BD ni el contexto de Flask. Un documento que falla se anota en el
+    manifest y no detiene al resto; 'progress(hechas, total)' se llama por instalación.
+    """
+    total = len(entries) + len(failures)
+    report = {inst_id: {"instalacion_id": inst_id, "status": "ok", "documentos": [], "errores": []}
+              for inst_id, _ in entries}
+
+    def jobs():
+        for _, contexto_final in entries:
+            for name in documentos:
+                yield os.path.join(community_slug, name), contexto_final
+
+    def files():
+        done = len(failures)
+        if progress:
+            progress(done, total)
+        order = ((inst_id, name) for inst_id, _ in entries for name in documentos)
+        for n, ((inst_id, name), (_, file_bytes, error)) in enumerate(
+                zip(order, doc_generator_service.iter_render_jobs(jobs())), start=1):
+            item = report[inst_id]
+            if error is not None:
+                if not isinstance(error, FileNotFoundError):
+                    logging.error(f"[BULK] Error generando {name} para instalación {inst_id}: {error}", exc_info=error)
+                item["errores"].append({"documento": name, "error": f"{error.__class__.__name__}: {error}"})
+            else:
+                member = f"Inst {inst_id}/{dossier_file_name(inst_id, name)}"
+                item["documentos"].append(member)
+                yield {"name": member, "bytes": file_bytes, "mimetype": DOCX_MIMETYPE}
+            if n % len(documentos) == 0:
+                # Última plantilla de esta instalación
+                if item["errores"]:
+                    item["status"] = "partial" if item["documentos"] else "error"
+                done += 1
+                if progress:
+                    progress(done, total)
+
+        items = list(report.values()) + [dict(f, status="error", documentos=[], errores=[]) for f in failures]
+        items.sort(key=lambda i: i["instalacion_id"])
+        manifest = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "community_slug": community_slug,
+            "documentos": documentos,
+            "summary": {
+                "instalaciones": total,
+                "ok": sum(1 for i in items if i["status"] == "ok"),
+                "partial": sum(1 for i in items if i["status"] == "partial"),
+                "error": sum(1 for i in items if i["status"] == "error"),
+                "documentos_generados": sum(len(i["documentos"]) for i in items),
+            },
+            "instalaciones": items,
+        }
+        logging.info(f"[BULK] Generación terminada: {manifest['summary']}")
+        yield {
+            "name": MANIFEST_NAME,
+            "bytes": json.dumps(manifest, ensure_ascii=False, indent=2, default=str).encode("utf-8"),
+            "mimetype": "application/json",
+        }
+
+    yield from iter_zip_stored(files())
+
+
+# =========================
+# Trabajo asíncrono (docgen_jobs)
+# =========================
+
+def _run_bulk_generate_docs(conn, job: Dict[str, Any], progress: ProgressFn) -> Tuple[str, Any]:
+    payload = job["payload"] or {}
+    documentos = payload.get("documentos") or []
+    if not documentos:
+        raise ValueError("No se seleccionaron documentos para generar.")
+    entries, failures = prepare_bulk(conn, job["app_user_id"], parse_instalacion_ids(payload.get("instalacion_ids")),
+                                   documentos, payload.get("community_slug"))
+    # Cerramos la transacción de lectura antes del render (idle_in_transaction_session_timeout)
+    conn.commit()
+    if not entries:
+        raise LookupError("Ninguna de las instalaciones solicitadas se puede generar.")
+    # El ZIP va a un fichero temporal (no a memoria) y mark_done lo copia a un large object
+    data = tempfile.TemporaryFile()
+    try:
+        for chunk in iter_bulk_archive(entries, failures, payload.get("community_slug"), documentos, progress):
+            data.write(chunk)
+    except BaseException:
+        data.close()
+        raise
+    return bulk_zip_filename(len(entries) + len(failures)), data
+
+
+JOB_HANDLERS["bulk_generate_docs"] = _run_bulk_generate_docs
+
+
+# =========================
+# Línea de comandos
+# =========================
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Genera los mismos documentos para varias instalaciones en un ZIP.")
+    parser.add_argument("--user", required=True, help="app_user_id propietario de las instalaciones")
+    parser.add_argument("--ids", required=True, help="ids de instalación separados por comas")
+    parser.add_argument("--community", required=True, help="slug de la comunidad (carpeta de plantillas)")
+    parser.add_argument("--doc", action="append", required=True, help="plantilla a generar (repetible)")
+    parser.add_argument("--out", required=True, help="fichero ZIP de salida")
+    args = parser.parse_args(argv)
+
+    from app import create_app, database
+    from app.services.docgen_job_service import docgen_jobs
+
+    docgen_jobs.workers = 0  # este proceso no consume la cola
+    app = create_app()
+    try:
+        ids = parse_instalacion_ids(args.ids)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def progress(done: int, total: int):
+        print(f"\r{done}/{total} instalaciones", end="", file=sys.stderr, flush=True)
+
+    with app.app_context():
+        conn = database.get_conn()
+        try:
+            entries, failures = prepare_bulk(conn, args.user, ids, args.doc, args.community)
+            conn.commit()
+        finally:
+            database.release_conn(conn)
+        if not entries:
+            print("Ninguna de las instalaciones solicitadas se puede generar.", file=sys.stderr)
+            return 1
+        with open(args.out, "wb") as fh:
+            for chunk in iter_bulk_archive(entries, failures, args.community, args.doc, progress):
+                fh.write(chunk)
+    print(file=sys.stderr)
+    for failure in failures:
+        print(f"Inst {failure['instalacion_id']}: {failure['error']}", file=sys.stderr)
+    print(f"{args.out}: {len(entries)}/{len(ids)} instalaciones (detalle en {MANIFEST_NAME})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
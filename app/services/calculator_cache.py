@@ -0,0 +1,148 @@
+# app/services/calculator_cache.py
+
+import os
+import threading
+import functools
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Union
+
+# Desactivable con CALC_CACHE_ENABLED=0 (por ejemplo para depurar cálculos)
+CALC_CACHE_ENABLED = os.getenv("CALC_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CALC_CACHE_MAX_ITEMS = int(os.getenv("CALC_CACHE_MAX_ITEMS", "4096"))
+# Cifras significativas con las que se redondean los números antes de formar la clave
+CALC_CACHE_SIGNIFICANT_DIGITS = int(os.getenv("CALC_CACHE_SIGNIFICANT_DIGITS", "9"))
+
+# Unidad (en minúsculas) -> nombre del método _normalize_* de ElectricalCalculator
+_UNIT_NORMALIZERS = {
+    'a': '_normalize_current', 'ma': '_normalize_current',
+    'm': '_normalize_length', 'ft': '_normalize_length',
+    'mm²': '_normalize_cross_section', 'awg': '_normalize_cross_section',
+    'v': '_normalize_voltage', 'kv': '_normalize_voltage',
+}
+
+
+class _Uncacheable(Exception):
+    """Entrada que no se puede convertir en clave; la llamada se ejecuta sin caché."""
+
+
+def _round(x: float) -> float:
+    return float(f"{x:.{CALC_CACHE_SIGNIFICANT_DIGITS}g}")
+
+
+def canonicalize(calculator, value: Any):
+    """
+    Convierte una entrada de la calculadora en una clave hashable y canónica:
+    - {"value", "unit"} se pasa a unidades base con los _normalize_* de la calculadora
+      (10 mA y 0.01 A dan la misma clave),
+    - los números se redondean y los enteros se tratan como float,
+    - los diccionarios se ordenan por clave.
+    """
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return _round(float(value))
+    if isinstance(value, dict):
+        if set(value) == {'value', 'unit'}:
+            normalizer = _UNIT_NORMALIZERS.get(str(value['unit']).lower())
+            if normalizer is not None:
+                try:
+                    return (normalizer, _round(getattr(calculator, normalizer)(value)))
+                except (ValueError, TypeError, KeyError):
+                    raise _Uncacheable()
+        return tuple(sorted((str(k), canonicalize(calculator, v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(canonicalize(calculator, v) for v in value)
+    raise _Uncacheable()
+
+
+def _copy_result(result):
+    # Los resultados son {clave: {"value", "unit", "info"}}: basta copiar dos niveles
+    if isinstance(result, dict):
+        return {k: (dict(v) if isinstance(v, dict) else v) for k, v in result.items()}
+    return result
+
+
+class CalculatorCache:
+    """
+    LRU acotada de resultados de la calculadora, compartida por todas las peticiones
+    del proceso. Solo se guardan resultados correctos; los errores se recalculan.
+    """
+
+    def __init__(self, max_items: int = CALC_CACHE_MAX_ITEMS, enabled: bool = CALC_CACHE_ENABLED):
+        self.max_items = max_items
+        self.enabled = enabled and max_items > 0
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get_or_compute(self, key, compute: Callable[[], Any]):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return _copy_result(self._data[key])
+            self.misses += 1
+        result = compute()
+        with self._lock:
+            self._data[key] = _copy_result(result)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+        return result
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.bypassed = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._data),
+                "max_items": self.max_items,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# instancia global compartida por todas las instancias de ElectricalCalculator
+calculator_cache = CalculatorCache()
+
+
+def memoized(operation: Optional[str] = None, enabled: Union[bool, Callable[..., bool]] = True):
+    """
+    Decorador para métodos de ElectricalCalculator: las llamadas repetidas con entradas
+    equivalentes devuelven el resultado guardado sin recalcular ni revalidar.
+    'enabled' desactiva la caché para la operación (False) o para una llamada: si es
+    una función, recibe los mismos argumentos que el método y con False no se cachea
+    (p. ej. un cálculo aleatorio sin semilla).
+    """
+    def decorator(method):
+        name = operation or method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not calculator_cache.enabled or enabled is False:
+                return method(self, *args, **kwargs)
+            if callable(enabled) and not enabled(self, *args, **kwargs):
+                calculator_cache.record_bypass()
+                return method(self, *args, **kwargs)
+            try:
+                key = (name, canonicalize(self, args), canonicalize(self, kwargs))
+                hash(key)
+            except (_Uncacheable, TypeError):
+                calculator_cache.record_bypass()
+                return method(self, *args, **kwargs)
+            return calculator_cache.get_or_compute(key, lambda: method(self, *args, **kwargs))
+        return wrapper
+    return decorator
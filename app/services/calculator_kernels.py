@@ -0,0 +1,181 @@
+# app/services/calculator_kernels.py
+"""
+Kernels vectorizados (NumPy) de la calculadora eléctrica.
+
+Cada kernel recibe columnas de entrada (escalares o arrays, se hace broadcasting) y
+calcula todos los casos en una sola pasada. Solo los usan los cálculos con muchos casos
+(informe eléctrico, árbol de circuitos, Monte Carlo, dimensionado sobre la tabla de
+secciones); los métodos de ElectricalCalculator para un solo caso usan math, porque
+para un escalar NumPy es mucho más lento.
+
+Los casos inválidos no lanzan excepción dentro del kernel: devuelven inf/nan y es
+responsabilidad del llamador validar.
+"""
+
+from bisect import bisect_right
+
+import numpy as np
+
+RESISTIVIDAD_COBRE = 0.0172  # Ω·mm²/m
+RESISTIVIDAD_ALUMINIO = 0.0282  # Ω·mm²/m
+# Coeficientes de temperatura de la resistividad (1/°C), referidos a 20 °C
+ALFA_COBRE = 0.00393
+ALFA_ALUMINIO = 0.00403
+SQRT3 = np.sqrt(3.0)
+
+
+def _f(x) -> np.ndarray:
+    return np.asarray(x, dtype=np.float64)
+
+
+def resistivity_for(materials) -> np.ndarray:
+    """Columna de materiales ('cobre'/'aluminio', cualquier capitalización) -> resistividad."""
+    m = np.char.lower(np.asarray(materials, dtype=str))
+    return np.where(m == "cobre", RESISTIVIDAD_COBRE, RESISTIVIDAD_ALUMINIO)
+
+
+def resistivity_at(materials, temp_c) -> np.ndarray:
+    """Resistividad corregida por temperatura del conductor: ρ(T) = ρ20 · (1 + α·(T − 20))."""
+    m = np.char.lower(np.asarray(materials, dtype=str))
+    alpha = np.where(m == "cobre", ALFA_COBRE, ALFA_ALUMINIO)
+    return resistivity_for(materials) * (1.0 + alpha * (_f(temp_c) - 20.0))
+
+
+def is_three_phase(system_types) -> np.ndarray:
+    """Columna de tipos de sistema -> True para trifásico (acepta 'trifasico', 'Trifásico'...)."""
+    s = np.char.lower(np.asarray(system_types, dtype=str))
+    return np.char.startswith(s, "tri")
+
+
+def voltage_drop_kernel(current, length, section, rho, three_phase, source_voltage, power_factor=1.0):
+    """
+    Caída de tensión por tramo.
+      monofásico: ΔU = 2·L·ρ·I / S
+      trifásico:  ΔU = √3·L·ρ·I·cosφ / S
+    Devuelve (caida_v, caida_pct, tension_en_carga_v).
+    """
+    current, length, section = _f(current), _f(length), _f(section)
+    rho, source_voltage, power_factor = _f(rho), _f(source_voltage), _f(power_factor)
+    factor = np.where(three_phase, SQRT3 * power_factor, 2.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drop_v = factor * length * rho * current / section
+        drop_pct = np.where(source_voltage > 0, drop_v / source_voltage * 100.0, np.inf)
+    return drop_v, drop_pct, source_voltage - drop_v
+
+
+def voltage_drop_monte_carlo(rng, samples, current, current_tol_pct, length, length_tol_pct, section,
+                             material, temp_min, temp_max, three_phase, source_voltage, power_factor=1.0):
+    """
+    Muestreo de la caída de tensión (%) con entradas inciertas:
+      longitud ~ Uniforme(L·(1 − tol), L·(1 + tol))
+      corriente ~ Normal(I, I·tol/2), truncada a >= 0 (tol ≈ 2σ)
+      temperatura del conductor ~ Uniforme(temp_min, temp_max) -> ρ(T)
+    Devuelve el array de 'samples' caídas en %.
+    """
+    length_s = rng.uniform(length * (1.0 - length_tol_pct / 100.0), length * (1.0 + length_tol_pct / 100.0), samples)
+    current_s = np.maximum(rng.normal(current, current * current_tol_pct / 200.0, samples), 0.0)
+    rho_s = resistivity_at(material, rng.uniform(temp_min, temp_max, samples))
+    _, drop_pct, _ = voltage_drop_kernel(current_s, length_s, section, rho_s, three_phase, source_voltage, power_factor)
+    return drop_pct
+
+
+class ProtectionTables:
+    """
+    Tablas de Iz (UNE), Kt y Ka compiladas una sola vez a arrays ordenados.
+
+    - Iz: clave (material, método, aislamiento, conductores) -> (secciones, iz), ambas
+      tuplas ordenadas por sección; la búsqueda es un bisect sin crear listas.
+    - Kt: aislamiento -> (temperaturas, kt) ordenadas; se toma el último escalón <= temperatura.
+      El aislamiento no distingue mayúsculas y uno desconocido es ValueError (nunca Kt = 1.0).
+    - Ka: tupla indexada por número de circuitos agrupados.
+    - Rejilla Iz' por clave con forma (n_kt, n_ka, n_secciones), para el dimensionado
+      vectorizado. El índice 0 de Kt (=1.0) y el último de Ka (=0.50) son los valores por defecto.
+    """
+
+    KT_DEFAULT = 1.0
+    KA_DEFAULT = 0.50
+
+    def __init__(self, iz_table, kt_table, ka_table):
+        self.iz = {}
+        for material, metodos in iz_table.items():
+            for metodo, aislamientos in metodos.items():
+                for aislamiento, conductores in aislamientos.items():
+                    for n, iz_map in conductores.items():
+                        secciones = tuple(sorted(iz_map))
+                        self.iz[(material, metodo, aislamiento, n)] = (secciones, tuple(iz_map[s] for s in secciones))
+
+        self.kt = {}
+        for aislamiento, kt_map in kt_table.items():
+            temps = tuple(sorted(kt_map))
+            self.kt[aislamiento] = (temps, tuple(kt_map[t] for t in temps))
+
+        self.ka_max = max(ka_table)
+        self.ka = tuple(ka_table.get(n, self.KA_DEFAULT) for n in range(self.ka_max + 1))
+        self.ka_values = _f(self.ka[1:] + (self.KA_DEFAULT,))
+
+        self._grids = {}
+        for key, (secciones, izs) in self.iz.items():
+            _, kts = self.kt.get(key[2], ((), ()))
+            kt_values = _f((self.KT_DEFAULT,) + kts)
+            grid = _f(izs)[None, None, :] * kt_values[:, None, None] * self.ka_values[None, :, None]
+            grid.setflags(write=False)
+            self._grids[key] = (_f(secciones), grid)
+
+    def iz_entry(self, material, metodo, aislamiento, num_conductores):
+        """(secciones, iz) para la combinación o None si no existe en la tabla."""
+        return self.iz.get((material, metodo, aislamiento, num_conductores))
+
+    def iz_for(self, seccion, material, metodo, aislamiento, num_conductores):
+        """Iz de la mayor sección tabulada <= seccion. None si la combinación no existe; 0 si no cabe."""
+        entry = self.iz.get((material, metodo, aislamiento, num_conductores))
+        if entry is None:
+            return None
+        secciones, izs = entry
+        pos = bisect_right(secciones, seccion)
+        return izs[pos - 1] if pos else 0
+
+    def _kt_entry(self, aislamiento):
+        entry = self.kt.get(str(aislamiento).upper())
+        if entry is None:
+            raise ValueError(f"Tipo de aislamiento no válido: {aislamiento}. Opciones: {', '.join(self.kt)}.")
+        return entry
+
+    def kt_index(self, aislamiento, temp) -> int:
+        """Índice de fila Kt en la rejilla (0 = por debajo de la tabla, Kt = 1.0)."""
+        temps, _ = self._kt_entry(aislamiento)
+        return bisect_right(temps, temp)
+
+    def kt_for(self, aislamiento, temp) -> float:
+        temps, kts = self._kt_entry(aislamiento)
+        pos = bisect_right(temps, temp)
+        return kts[pos - 1] if pos else self.KT_DEFAULT
+
+    def ka_index(self, num_circuitos) -> int:
+        """Índice de columna Ka en la rejilla (el último = valor por defecto 0.50)."""
+        return num_circuitos - 1 if 1 <= num_circuitos <= self.ka_max else self.ka_max
+
+    def ka_for(self, num_circuitos) -> float:
+        return self.ka[num_circuitos] if 0 <= num_circuitos <= self.ka_max else self.KA_DEFAULT
+
+    def iz_corrected_grid(self, material, metodo, aislamiento, num_conductores):
+        """(secciones, rejilla Iz') precalculada para la combinación, o None."""
+        return self._grids.get((material, metodo, aislamiento, num_conductores))
+
+
+def optimal_section_kernel(sections, iz_corrected, current, length, rho, three_phase, source_voltage,
+                           power_factor, max_drop_pct, breakers):
+    """
+    Evalúa todas las secciones comerciales de una vez.
+    Para cada sección: caída de tensión (%) y menor calibre In >= Ib de la lista ordenada
+    'breakers' (nan si Ib supera el mayor calibre). Una sección es válida si la caída no
+    supera el límite y Ib <= In <= Iz'.
+    Devuelve (indice_primera_valida o -1, caida_pct, calibre_in, valida_caida, valida_iz).
+    """
+    sections, iz_corrected, breakers = _f(sections), _f(iz_corrected), _f(breakers)
+    _, drop_pct, _ = voltage_drop_kernel(current, length, sections, rho, three_phase, source_voltage, power_factor)
+    pos = np.searchsorted(breakers, current, side="left")
+    breaker_in = breakers[pos] if pos < len(breakers) else np.nan
+    ok_drop = drop_pct <= max_drop_pct
+    ok_iz = iz_corrected >= breaker_in  # falso para todas si no hay calibre (nan)
+    valid = np.flatnonzero(ok_drop & ok_iz)
+    return (int(valid[0]) if valid.size else -1), drop_pct, breaker_in, ok_drop, ok_iz
@@ -1,8 +1,29 @@
 # app/calculator.py
 # app/calculator.py
 
+import os
 import math
-from typing import Dict, Union, Literal
+import logging
+import numpy as np
+from typing import Dict, List, Union, Literal
+
+from app.services import calculator_kernels as kernels
+from app.services.calculator_cache import memoized
+
+# Límite de operaciones por petición en /api/calculator/batch
+CALC_BATCH_MAX_ITEMS = int(os.getenv("CALC_BATCH_MAX_ITEMS", "500"))
+# Muestras del análisis de tolerancias (Monte Carlo) de la caída de tensión
+CALC_MC_DEFAULT_SAMPLES = int(os.getenv("CALC_MC_DEFAULT_SAMPLES", "20000"))
+CALC_MC_MAX_SAMPLES = int(os.getenv("CALC_MC_MAX_SAMPLES", "200000"))
+
+# Métodos de calculate_current (los mismos textos que envía el frontend)
+CURRENT_METHODS = (
+    "Potencia (P), Tensión L-N (U), cos φ",
+    "Potencia (P) y Resistencia (R)",
+    "Tensión L-N (U) y Impedancia (Z)",
+    "Potencia Aparente (S) y Tensión L-N (U)",
+    "Potencia Reactiva (Q), Tensión L-N (U), sen φ",
+)
 
 class ElectricalCalculator:
     """
@@ -10,8 +31,8 @@ class ElectricalCalculator:
     """
 
     # --- CONSTANTES INTERNAS ---
-    RESISTIVIDAD_COBRE = 0.0172  # Ω·mm²/m
-    RESISTIVIDAD_ALUMINIO = 0.0282 # Ω·mm²/m
+    RESISTIVIDAD_COBRE = kernels.RESISTIVIDAD_COBRE  # Ω·mm²/m
+    RESISTIVIDAD_ALUMINIO = kernels.RESISTIVIDAD_ALUMINIO # Ω·mm²/m
     AWG_TO_MM2_MAP = {
         '0000': 107.2, '4/0': 107.2,
         '000': 85.03, '3/0': 85.03,
@@ -59,6 +80,9 @@ class ElectricalCalculator:
         1: 1.00, 2: 0.80, 3: 0.70, 4: 0.65, 5: 0.60, 6: 0.57, 7: 0.54, 8: 0.52, 9: 0.50
     }
 
+    # Calibres comerciales de magnetotérmicos (A)
+    CALIBRES_MAGNETOTERMICO = [6, 10, 16, 20, 25, 32, 40, 50, 63, 80, 100, 125]
+
 
         # --- NUEVA FUNCIÓN DE BÚSQUEDA Iz ---
     def get_iz_from_table(
@@ -71,24 +95,15 @@ class ElectricalCalculator:
     ) -> float:
         """Busca la Intensidad Máxima Admisible (Iz) en la tabla UNE."""
         
-        # 1. Buscar el valor base para Cobre en la tabla
-        try:
-            # La ruta de búsqueda ahora es más directa y completa
-            material_data = self.IZ_TABLE_UNE_2020[material.lower()]
-            metodo_data = material_data[metodo_instalacion.upper()]
-            aislamiento_data = metodo_data[aislamiento.upper()]
-            iz_map = aislamiento_data[num_conductores]
-
-            secciones_disponibles = sorted([s for s in iz_map.keys() if s <= seccion], reverse=True)
-            if not secciones_disponibles:
-                raise ValueError(f"Sección {seccion}mm² demasiado pequeña para el método/material seleccionado.")
-            
-            seccion_a_usar = secciones_disponibles[0]
-            iz_base = iz_map[seccion_a_usar]
-            return iz_base
-
-        except KeyError:
+        # Búsqueda por bisect sobre las tablas precompiladas (ver PROTECTION_TABLES)
+        iz_base = PROTECTION_TABLES.iz_for(
+            seccion, material.lower(), metodo_instalacion.upper(), aislamiento.upper(), num_conductores
+        )
+        if iz_base is None:
             raise ValueError(f"Combinación inválida: {material}/{metodo_instalacion}/{aislamiento}/{num_conductores} conductores.")
+        if not iz_base:
+            raise ValueError(f"Sección {seccion}mm² demasiado pequeña para el método/material seleccionado.")
+        return iz_base
 
 
 
@@ -178,7 +193,15 @@ class ElectricalCalculator:
         except (ValueError, ZeroDivisionError) as e:
             raise ValueError(f"Error en el cálculo de tensión: {e}")
     
+    @staticmethod
+    def _design_current(three_phase: bool, voltage: float, power: float, cos_phi: float) -> float:
+        """Corriente de cálculo Ib = P / (V·cosφ), con √3 en el denominador si es trifásico."""
+        if three_phase:
+            return power / (math.sqrt(3) * voltage * cos_phi)
+        return power / (voltage * cos_phi)
+
         # --- CÁLCULO 2: SECCIÓN DE CABLE (NUEVO) ---
+    @memoized()
     def calculate_wire_section(
         self,
         system_type: Literal['monofasico', 'trifasico'],
@@ -196,25 +219,23 @@ class ElectricalCalculator:
         """
         if max_voltage_drop_percent <= 0:
             raise ValueError("El porcentaje de caída de tensión máxima debe ser mayor que cero.")
-            
-        max_voltage_drop_volts = voltage * (max_voltage_drop_percent / 100)
-        
         if voltage <= 0:
             raise ValueError("La tensión debe ser mayor que cero.")
-            
+        if system_type not in ('monofasico', 'trifasico'):
+            raise ValueError("Tipo de sistema no válido.")
+        if cos_phi == 0:
+            raise ValueError("El cos(φ) no puede ser cero.")
+
+        # Un solo caso: aritmética con math (los kernels NumPy son para lotes y vectores)
+        rho = self.RESISTIVIDAD_COBRE if material == 'cobre' else self.RESISTIVIDAD_ALUMINIO
+        max_voltage_drop_volts = voltage * (max_voltage_drop_percent / 100)
+        current = self._design_current(system_type == 'trifasico', voltage, power, cos_phi)
         if system_type == 'monofasico':
-            current = power / (voltage * cos_phi)
-            rho = self.RESISTIVIDAD_COBRE if material == 'cobre' else self.RESISTIVIDAD_ALUMINIO
             section_mm2 = (2 * length * rho * current) / max_voltage_drop_volts
-        elif system_type == 'trifasico':
-            current = power / (math.sqrt(3) * voltage * cos_phi)
-            rho = self.RESISTIVIDAD_COBRE if material == 'cobre' else self.RESISTIVIDAD_ALUMINIO
-            section_mm2 = (math.sqrt(3) * length * rho * current) / max_voltage_drop_volts
         else:
-            raise ValueError("Tipo de sistema no válido.")
+            section_mm2 = (math.sqrt(3) * length * rho * current) / max_voltage_drop_volts
 
-        # Aquí iría la lógica para encontrar la sección comercial superior
-        # Por ahora, devolvemos el valor teórico.
+        # Sección teórica; para la sección comercial verificada con Iz ver el motor de dimensionado.
         
         return {
             "required_section": {
@@ -233,6 +254,7 @@ class ElectricalCalculator:
     # Estos cálculos son más complejos y dependen de tablas normativas (Iz, Kt, Ka).
     # Por ahora, creamos funciones placeholder que devuelven resultados de ejemplo.
     
+    @memoized()
     def calculate_current(self, method: str, params: Dict) -> Dict:
         """Calcula la corriente (I) en Amperios, basado en diferentes métodos."""
         
@@ -256,19 +278,20 @@ class ElectricalCalculator:
         I = 0.0 # Valor por defecto
 
         try:
-            if method == "Potencia (P), Tensión L-N (U), cos φ":
+            if method == CURRENT_METHODS[0]:
                 if U * cos_phi == 0: raise ZeroDivisionError("La tensión o el cos(φ) no pueden ser cero.")
                 I = P / (U * cos_phi)
-            elif method == "Potencia (P) y Resistencia (R)":
+            elif method == CURRENT_METHODS[1]:
                 if R == 0: raise ZeroDivisionError("La resistencia no puede ser cero.")
+                if P / R < 0: raise ValueError("La potencia y la resistencia deben tener el mismo signo.")
                 I = math.sqrt(P / R)
-            elif method == "Tensión L-N (U) y Impedancia (Z)":
+            elif method == CURRENT_METHODS[2]:
                 if Z == 0: raise ZeroDivisionError("La impedancia no puede ser cero.")
                 I = U / Z
-            elif method == "Potencia Aparente (S) y Tensión L-N (U)":
+            elif method == CURRENT_METHODS[3]:
                 if U == 0: raise ZeroDivisionError("La tensión no puede ser cero.")
                 I = S / U
-            elif method == "Potencia Reactiva (Q), Tensión L-N (U), sen φ":
+            elif method == CURRENT_METHODS[4]:
                 if U * sin_phi == 0: raise ZeroDivisionError("La tensión o el sen(φ) no pueden ser cero.")
                 I = Q / (U * sin_phi)
             else:
@@ -285,6 +308,7 @@ class ElectricalCalculator:
             raise ValueError(f"Error en el cálculo de corriente: {e}")
 
     # --- REEMPLAZO DE LA FUNCIÓN calculate_voltage ---
+    @memoized()
     def calculate_voltage(self, method: str, params: Dict) -> Dict:
         """Calcula la tensión (U) en Voltios, basado en diferentes métodos."""
         
@@ -320,6 +344,7 @@ class ElectricalCalculator:
         except (ValueError, ZeroDivisionError) as e:
             raise ValueError(f"Error en el cálculo de tensión: {e}")
 
+    @memoized()
     def calculate_protections(self, params: Dict) -> Dict:
         """
         Calcula las protecciones eléctricas adecuadas basándose en Iz y factores de corrección.
@@ -340,17 +365,15 @@ class ElectricalCalculator:
 
             # 2. Obtener factores de corrección (Kt y Ka)
             # Búsqueda de Kt (Temperatura)
-            kt_map = self.KT_TABLE_TEMP.get(aislamiento, {})
-            temp_a_usar = max([t for t in kt_map.keys() if t <= temp_ambiente], default=None)
-            kt = kt_map.get(temp_a_usar, 1.0) 
-            ka = self.KA_TABLE_AGRUPACION.get(num_circuitos_agrupados, 0.50)
+            kt = PROTECTION_TABLES.kt_for(aislamiento, temp_ambiente)
+            ka = PROTECTION_TABLES.ka_for(num_circuitos_agrupados)
 
             # 3. Calcular Iz' (Iz corregida)
             iz_tabla = self.get_iz_from_table(seccion, material, metodo_instalacion, aislamiento, num_conductores_cargados)
             iz_corregida = iz_tabla * kt * ka
             
             # 4. Criterios de selección del magnetotérmico (In)
-            calibres_comerciales = [6, 10, 16, 20, 25, 32, 40, 50, 63, 80, 100, 125]
+            calibres_comerciales = self.CALIBRES_MAGNETOTERMICO
             magnetotermico_in = None
             for calibre in calibres_comerciales:
                 if calibre >= ib and calibre <= iz_corregida:
@@ -376,7 +399,97 @@ class ElectricalCalculator:
         except (ValueError, TypeError, KeyError, AttributeError) as e:
             raise ValueError(f"Error en los datos de entrada para el cálculo de protecciones: {e}")
 
+    # --- CÁLCULO 5b: DIMENSIONADO ÓPTIMO DE SECCIÓN ---
+    @memoized()
+    def calculate_optimal_section(self, params: Dict) -> Dict:
+        """
+        Busca la menor sección comercial (de la tabla UNE para el material, método y
+        aislamiento dados) que cumple a la vez la caída de tensión máxima y Ib <= In <= Iz'
+        tras aplicar Kt y Ka. Devuelve la sección, el magnetotérmico y los valores comprobados.
+        La corriente de empleo se toma de 'corriente_empleo_ib' o se calcula desde 'power'.
+        """
+        try:
+            system_type = params.get('system_type', 'monofasico')
+            if system_type not in ('monofasico', 'trifasico'):
+                raise ValueError("Tipo de sistema no válido.")
+            trifasico = system_type == 'trifasico'
+            voltage = float(params.get('voltage'))
+            cos_phi = float(params.get('cos_phi', 1.0))
+            length = float(params.get('length'))
+            max_drop = float(params.get('max_voltage_drop_percent'))
+            material = params.get('conductor', params.get('material', 'cobre'))
+            aislamiento = params.get('aislamiento')
+            metodo_instalacion = params.get('metodo_instalacion')
+            temp_ambiente = int(params.get('temp_ambiente', 30))
+            num_circuitos_agrupados = int(params.get('circuitos_agrupados', 1))
+            num_conductores_cargados = int(params.get('conductores_cargados', 3 if trifasico else 2))
+
+            if voltage <= 0:
+                raise ValueError("La tensión debe ser mayor que cero.")
+            if max_drop <= 0:
+                raise ValueError("El porcentaje de caída de tensión máxima debe ser mayor que cero.")
+            if length < 0:
+                raise ValueError("La longitud no puede ser negativa.")
+            if cos_phi <= 0 or cos_phi > 1:
+                raise ValueError("El cos(φ) debe estar entre 0 (excluido) y 1.")
+            if num_circuitos_agrupados < 1:
+                raise ValueError("El número de circuitos agrupados debe ser 1 o mayor.")
+
+            if params.get('corriente_empleo_ib') not in (None, ''):
+                ib = float(params.get('corriente_empleo_ib'))
+            else:
+                ib = self._design_current(trifasico, voltage, float(params.get('power')), cos_phi)
+            if ib <= 0:
+                raise ValueError("La corriente de empleo debe ser mayor que cero.")
+
+            entry = PROTECTION_TABLES.iz_corrected_grid(
+                material.lower(), metodo_instalacion.upper(), aislamiento.upper(), num_conductores_cargados
+            )
+            if entry is None:
+                raise ValueError(f"Combinación inválida: {material}/{metodo_instalacion}/{aislamiento}/{num_conductores_cargados} conductores.")
+            secciones, grid = entry
+            iz_corregida = grid[PROTECTION_TABLES.kt_index(aislamiento, temp_ambiente),
+                                PROTECTION_TABLES.ka_index(num_circuitos_agrupados)]
+            rho = self.RESISTIVIDAD_COBRE if material.lower() == 'cobre' else self.RESISTIVIDAD_ALUMINIO
+
+            idx, drop_pct, calibre, ok_caida, ok_iz = kernels.optimal_section_kernel(
+                secciones, iz_corregida, ib, length, rho, trifasico, voltage, cos_phi, max_drop,
+                self.CALIBRES_MAGNETOTERMICO,
+            )
+        except (TypeError, KeyError, AttributeError) as e:
+            raise ValueError(f"Error en los datos de entrada para el dimensionado de sección: {e}")
+
+        if idx < 0:
+            if math.isnan(calibre):
+                motivo = f"la corriente de empleo ({round(ib, 2)}A) supera el mayor calibre comercial"
+            elif not ok_caida.any():
+                motivo = "ninguna sección cumple la caída de tensión máxima"
+            elif not ok_iz.any():
+                motivo = "ninguna sección admite el calibre necesario (Iz' insuficiente)"
+            else:
+                motivo = "ninguna sección cumple a la vez caída de tensión e Iz'"
+            raise ValueError(f"No hay sección comercial válida en la tabla para estos datos: {motivo}.")
+
+        # Criterio que fija la sección: el que descarta la sección inmediatamente inferior
+        if idx == 0:
+            criterio = "sección mínima de la tabla"
+        elif not ok_caida[idx - 1]:
+            criterio = "caída de tensión"
+        else:
+            criterio = "intensidad admisible (Iz')"
+
+        curva = params.get('curva_magnetotermico', 'C')
+        seccion = float(secciones[idx])
+        return {
+            "seccion_comercial": {"value": seccion, "unit": "mm²", "info": f"Menor sección comercial válida. Criterio determinante: {criterio}."},
+            "magnetotermico": {"value": f"{curva}{int(calibre)}", "unit": "A", "info": f"Ib={round(ib, 2)}A <= In={int(calibre)}A <= Iz'={round(float(iz_corregida[idx]), 2)}A."},
+            "iz_corregida": {"value": round(float(iz_corregida[idx]), 2), "unit": "A", "info": "Intensidad admisible corregida por temperatura (Kt) y agrupación (Ka)."},
+            "caida_tension": {"value": round(float(drop_pct[idx]), 3), "unit": "%", "info": f"Caída de tensión con la sección elegida (máximo {max_drop}%)."},
+            "corriente_empleo": {"value": round(ib, 2), "unit": "A", "info": "Corriente de empleo (Ib) usada en el dimensionado."},
+        }
+
     # --- CÁLCULO 6: SEPARACIÓN DE PANELES (NUEVO) ---
+    @memoized()
     def calculate_panel_separation(
         self,
         # CTO: Estos son los nombres de parámetros que la función SIEMPRE ha esperado.
@@ -393,27 +506,28 @@ class ElectricalCalculator:
         beta = math.radians(panel_inclination_deg)
         phi = math.radians(latitude_deg)
         declinacion_invierno = math.radians(-23.45)
-        
-        altura_solar_mediodia_rad = math.asin(
-            math.sin(declinacion_invierno) * math.sin(phi) + 
+
+        # El seno puede pasar de 1 por redondeo cuando φ = δ
+        altura_solar_mediodia_rad = math.asin(min(1.0, max(-1.0,
+            math.sin(declinacion_invierno) * math.sin(phi) +
             math.cos(declinacion_invierno) * math.cos(phi)
-        )
-        
+        )))
+
         if altura_solar_mediodia_rad <= 0:
             return { "d1_distance_m": {"value": float('inf')}, "d2_distance_m": {"value": float('inf')} }
 
         h_panel = panel_vertical_side_m * math.sin(beta)
         x_panel = panel_vertical_side_m * math.cos(beta)
         longitud_sombra = h_panel / math.tan(altura_solar_mediodia_rad)
-        d1 = longitud_sombra - x_panel
-        if d1 < 0: d1 = 0 
+        d1 = max(longitud_sombra - x_panel, 0.0)
         d2 = d1 + x_panel
-        
+
         return {
             "d1_distance_m": { "value": round(d1, 2), "unit": "m" },
             "d2_distance_m": { "value": round(d2, 2), "unit": "m" }
         }
     
+    @memoized()
     def calculate_voltage_drop(self, current: dict, length: dict, wire_cross_section: dict, material: str, system_type: str, source_voltage: dict, power_factor: float = 1.0) -> dict:
         """
         Calcula la caída de tensión y devuelve la estructura de respuesta COMPLETA
@@ -428,11 +542,12 @@ class ElectricalCalculator:
         
         rho = self.RESISTIVIDAD_COBRE if material.lower() == 'cobre' else self.RESISTIVIDAD_ALUMINIO
 
+        # Un solo caso: aritmética con math (voltage_drop_kernel es para lotes y vectores)
         if system_type.lower() == 'monofasico':
             voltage_drop_v = (2 * L * rho * I) / S
         else:
             voltage_drop_v = (math.sqrt(3) * L * rho * I * power_factor) / S
-        
+
         voltage_at_load_v = V_source - voltage_drop_v
         voltage_drop_pct = (voltage_drop_v / V_source) * 100 if V_source > 0 else float('inf')
 
@@ -455,3 +570,114 @@ class ElectricalCalculator:
             }
         }
 
+    # Con "seed": null cada llamada es una muestra nueva: no se cachea
+    @memoized(enabled=lambda self, params: not isinstance(params, dict) or params.get('seed', 0) is not None)
+    def calculate_voltage_drop_tolerance(self, params: Dict) -> Dict:
+        """
+        Análisis de tolerancias de la caída de tensión por Monte Carlo: muestrea longitud,
+        corriente y temperatura del conductor (corrección de ρ) y devuelve percentiles de
+        la caída y la probabilidad de superar el límite. Con 'seed' fija (por defecto 0)
+        el resultado es reproducible (y se cachea); con 'seed' null es aleatorio.
+        """
+        try:
+            I = self._normalize_current(params['current'])
+            L = self._normalize_length(params['length'])
+            S = self._normalize_cross_section(params['wire_cross_section'])
+            V_source = self._normalize_voltage(params['source_voltage'])
+            material = str(params.get('material', 'cobre')).lower()
+            three_phase = str(params.get('system_type', 'monofasico')).lower() != 'monofasico'
+            power_factor = float(params.get('power_factor', 1.0))
+            max_drop = float(params.get('max_voltage_drop_percent', 3.0))
+            length_tol = float(params.get('length_tolerance_percent', 5.0))
+            current_tol = float(params.get('current_tolerance_percent', 10.0))
+            temp_min = float(params.get('conductor_temp_min', 20.0))
+            temp_max = float(params.get('conductor_temp_max', 70.0))
+            samples = int(params.get('samples', CALC_MC_DEFAULT_SAMPLES))
+            seed = params.get('seed', 0)
+        except KeyError as e:
+            raise ValueError(f"Falta el dato {e}.")
+        except TypeError as e:
+            raise ValueError(f"Datos de entrada inválidos: {e}")
+
+        if S == 0:
+            raise ValueError("La sección del cable no puede ser cero.")
+        if V_source <= 0:
+            raise ValueError("La tensión de origen debe ser mayor que cero.")
+        if not 1 <= samples <= CALC_MC_MAX_SAMPLES:
+            raise ValueError(f"El número de muestras debe estar entre 1 y {CALC_MC_MAX_SAMPLES}.")
+        if length_tol < 0 or current_tol < 0 or temp_min > temp_max:
+            raise ValueError("Las tolerancias no pueden ser negativas y la temperatura mínima no puede superar la máxima.")
+
+        rng = np.random.default_rng(None if seed is None else int(seed))
+        drops = kernels.voltage_drop_monte_carlo(
+            rng, samples, I, current_tol, L, length_tol, S, material, temp_min, temp_max,
+            three_phase, V_source, power_factor,
+        )
+        p5, p50, p95, p99 = (float(v) for v in np.percentile(drops, [5, 50, 95, 99]))
+        exceed = float(np.count_nonzero(drops > max_drop)) / samples * 100.0
+
+        return {
+            "voltage_drop_percent_p50": {"value": round(p50, 3), "unit": "%", "info": "Caída de tensión mediana."},
+            "voltage_drop_percent_p95": {"value": round(p95, 3), "unit": "%", "info": "Caída de tensión que no se supera en el 95 % de los casos."},
+            "voltage_drop_percent_p99": {"value": round(p99, 3), "unit": "%", "info": "Caída de tensión que no se supera en el 99 % de los casos."},
+            "voltage_drop_percent_p5": {"value": round(p5, 3), "unit": "%", "info": "Caída de tensión en el 5 % de casos más favorables."},
+            "voltage_drop_percent_mean": {"value": round(float(drops.mean()), 3), "unit": "%", "info": "Caída de tensión media."},
+            "probability_exceeding": {"value": round(exceed, 2), "unit": "%", "info": f"Probabilidad de superar el límite de {max_drop}%."},
+            "samples": {"value": samples, "unit": "", "info": "Número de muestras simuladas."},
+        }
+
+    # --- CÁLCULO POR LOTES ---
+    # operación -> función que recibe (calculadora, data) con el mismo cuerpo que el endpoint individual
+    BATCH_OPERATIONS = {
+        'voltage-drop': lambda calc, data: calc.calculate_voltage_drop(**data),
+        'wire-section': lambda calc, data: calc.calculate_wire_section(**data),
+        'protections': lambda calc, data: calc.calculate_protections(data),
+        'panel-separation': lambda calc, data: calc.calculate_panel_separation(**data),
+        'current': lambda calc, data: calc.calculate_current(data.get('method'), data.get('params', {})),
+        'voltage': lambda calc, data: calc.calculate_voltage(data.get('method'), data.get('params', {})),
+        'optimal-section': lambda calc, data: calc.calculate_optimal_section(data),
+        'voltage-drop-tolerance': lambda calc, data: calc.calculate_voltage_drop_tolerance(data),
+    }
+
+    def run_batch(self, operations: List[Dict]) -> List[Dict]:
+        """
+        Ejecuta una lista de operaciones heterogéneas y devuelve los resultados en el mismo orden.
+        Cada operación: {"operation": "voltage-drop", "data": {...}, "id": opcional}.
+        Los errores se informan por elemento; un fallo no interrumpe el resto del lote.
+        """
+        if not isinstance(operations, list):
+            raise ValueError("'operations' debe ser una lista.")
+        if len(operations) > CALC_BATCH_MAX_ITEMS:
+            raise ValueError(f"Demasiadas operaciones en el lote ({len(operations)}). Máximo: {CALC_BATCH_MAX_ITEMS}.")
+
+        results = []
+        for index, item in enumerate(operations):
+            entry = {"index": index}
+            if isinstance(item, dict) and "id" in item:
+                entry["id"] = item["id"]
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Cada operación debe ser un objeto.")
+                operation = item.get("operation")
+                handler = self.BATCH_OPERATIONS.get(operation)
+                if handler is None:
+                    raise ValueError(f"Operación no reconocida: '{operation}'. Opciones: {', '.join(self.BATCH_OPERATIONS)}")
+                data = item.get("data") or {}
+                if not isinstance(data, dict):
+                    raise ValueError("'data' debe ser un objeto.")
+                entry.update({"operation": operation, "ok": True, "result": handler(self, data)})
+            except (ValueError, TypeError, KeyError) as e:
+                entry.update({"ok": False, "error": f"Datos de entrada inválidos: {e}"})
+            except Exception as e:
+                logging.error(f"Error inesperado en la operación {index} del lote: {e}", exc_info=True)
+                entry.update({"ok": False, "error": "Error interno en el cálculo."})
+            results.append(entry)
+        return results
+
+
+# Tablas de protección compiladas una sola vez al importar el módulo
+PROTECTION_TABLES = kernels.ProtectionTables(
+    ElectricalCalculator.IZ_TABLE_UNE_2020,
+    ElectricalCalculator.KT_TABLE_TEMP,
+    ElectricalCalculator.KA_TABLE_AGRUPACION,
+)
@@ -0,0 +1,128 @@
+# app/services/catalog_compatibility_service.py
+
+import os
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.catalog_index_service import catalog_index
+from app.services.string_sizing_service import voc_at, COEF_VOC_PCT_DEFAULT, RATIO_DC_AC_MAX
+
+# Un panel es compatible con un inversor si cabe un string de al menos este número de paneles
+MIN_PANELES_SERIE = int(os.getenv("COMPAT_MIN_PANELES_SERIE", "3"))
+# Temperatura mínima de diseño para la Voc en frío (°C)
+COMPAT_TEMP_MIN = float(os.getenv("COMPAT_TEMP_MIN", "-10"))
+# Filas de paneles evaluadas por bloque (acota la memoria del producto paneles × inversores)
+_CHUNK_ROWS = 1024
+
+
+def _column(records: List[Dict[str, Any]], key: str, fallback: Optional[str] = None, factor: float = 1.0) -> np.ndarray:
+    values = []
+    for r in records:
+        v = r.get(key)
+        if v in (None, '') and fallback:
+            v = r.get(fallback)
+            v = float(v) * factor if v not in (None, '') else None
+        values.append(float(v) if v not in (None, '') else np.nan)
+    return np.asarray(values, dtype=np.float64)
+
+
+class CompatibilityMatrix:
+    """
+    Matriz paneles × inversores guardada como bitsets (np.packbits): una fila de
+    ceil(n_inversores / 8) bytes por panel y la traspuesta por inversor.
+    """
+
+    def __init__(self, paneles: List[Dict[str, Any]], inversores: List[Dict[str, Any]]):
+        self.panel_ids = np.asarray([int(p['id']) for p in paneles], dtype=np.int64)
+        self.inversor_ids = np.asarray([int(i['id']) for i in inversores], dtype=np.int64)
+        self._panel_row = {int(pid): n for n, pid in enumerate(self.panel_ids)}
+        self._inversor_row = {int(iid): n for n, iid in enumerate(self.inversor_ids)}
+
+        voc_frio = voc_at(_column(paneles, 'tension_circuito_abierto_voc'), COMPAT_TEMP_MIN, COEF_VOC_PCT_DEFAULT)
+        pmax = _column(paneles, 'potencia_pico_w')
+        v_max = _column(inversores, 'tension_max_entrada_v')
+        p_inv = _column(inversores, 'potencia_max_paneles_w', fallback='potencia_salida_va', factor=RATIO_DC_AC_MAX)
+
+        n_p, n_i = len(self.panel_ids), len(self.inversor_ids)
+        self.by_panel = np.zeros((n_p, (n_i + 7) // 8), dtype=np.uint8)
+        dense_t = np.zeros((n_i, n_p), dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for start in range(0, n_p, _CHUNK_ROWS):
+                stop = min(start + _CHUNK_ROWS, n_p)
+                # Máximo de paneles en serie por tensión y por potencia; NaN (dato ausente) -> incompatible
+                serie_v = np.floor(v_max[None, :] / voc_frio[start:stop, None])
+                serie_p = np.floor(p_inv[None, :] / pmax[start:stop, None])
+                block = np.minimum(serie_v, serie_p) >= MIN_PANELES_SERIE
+                self.by_panel[start:stop] = np.packbits(block, axis=1)
+                dense_t[:, start:stop] = block.T
+        self.by_inversor = np.packbits(dense_t, axis=1)
+
+    def inversores_for_panel(self, panel_id: int) -> Optional[List[int]]:
+        row = self._panel_row.get(int(panel_id))
+        if row is None:
+            return None
+        mask = np.unpackbits(self.by_panel[row], count=len(self.inversor_ids)).astype(bool)
+        return self.inversor_ids[mask].tolist()
+
+    def paneles_for_inversor(self, inversor_id: int) -> Optional[List[int]]:
+        row = self._inversor_row.get(int(inversor_id))
+        if row is None:
+            return None
+        mask = np.unpackbits(self.by_inversor[row], count=len(self.panel_ids)).astype(bool)
+        return self.panel_ids[mask].tolist()
+
+    def is_compatible(self, panel_id: int, inversor_id: int) -> bool:
+        row, col = self._panel_row.get(int(panel_id)), self._inversor_row.get(int(inversor_id))
+        if row is None or col is None:
+            return False
+        return bool(self.by_panel[row, col >> 3] & (0x80 >> (col & 7)))
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.by_panel.nbytes + self.by_inversor.nbytes)
+
+
+class CatalogCompatibilityService:
+    """
+    Mantiene la matriz de compatibilidad. Se reconstruye al recargar el catálogo con datos
+    distintos (catalog_index.on_reload), no en la petición que la consulta; una recarga
+    por TTL sin cambios conserva la matriz.
+    """
+
+    def __init__(self):
+        self._matrix: Optional[CompatibilityMatrix] = None
+        self._version = None
+        self._lock = threading.Lock()
+        catalog_index.on_reload(self.get_matrix)
+
+    def invalidate(self):
+        with self._lock:
+            self._matrix, self._version = None, None
+
+    def get_matrix(self, conn) -> CompatibilityMatrix:
+        catalog_index.ensure_loaded(conn)
+        if self._matrix is not None and self._version == catalog_index.version:
+            return self._matrix
+        with self._lock:
+            if self._matrix is None or self._version != catalog_index.version:
+                version = catalog_index.version
+                matrix = CompatibilityMatrix(catalog_index.get_all(conn, 'paneles'), catalog_index.get_all(conn, 'inversores'))
+                self._matrix, self._version = matrix, version
+                logging.info(
+                    f"Matriz de compatibilidad construida (v{version}): {len(matrix.panel_ids)} paneles × "
+                    f"{len(matrix.inversor_ids)} inversores, {matrix.nbytes} bytes."
+                )
+            return self._matrix
+
+    def compatible_inversores(self, conn, panel_id: int) -> Optional[List[int]]:
+        return self.get_matrix(conn).inversores_for_panel(panel_id)
+
+    def compatible_paneles(self, conn, inversor_id: int) -> Optional[List[int]]:
+        return self.get_matrix(conn).paneles_for_inversor(inversor_id)
+
+
+# instancia global compartida por las rutas de catálogo
+catalog_compatibility = CatalogCompatibilityService()
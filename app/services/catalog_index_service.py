@@ -0,0 +1,208 @@
+# app/services/catalog_index_service.py
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.models import catalog_model
+
+# Tablas de equipos que indexamos en memoria.
+# Formato: clave_lógica -> (tabla, columna con el nombre comercial)
+INDEXED_CATALOGS = {
+    "paneles": ("paneles_solares", "nombre_panel"),
+    "inversores": ("inversores", "nombre_inversor"),
+    "baterias": ("baterias", "nombre_bateria"),
+    "tipos_estructura": ("tipos_estructura", "nombre"),
+}
+
+# Segundos tras los que el índice se considera caducado y se recarga en la siguiente consulta.
+# Cubre el caso de varios workers de gunicorn: la invalidación local solo afecta a un proceso.
+CATALOG_INDEX_TTL_S = float(os.getenv("CATALOG_INDEX_TTL_S", "300"))
+
+
+def _normalize_name(name: Any) -> str:
+    return " ".join(str(name).split()).lower()
+
+
+class _CatalogTable:
+    """
+    Copia compacta de una tabla de catálogo: una única tupla de columnas compartida
+    y una tupla de valores por fila, indexadas por id y por nombre normalizado.
+    """
+    __slots__ = ("table", "name_column", "columns", "by_id", "by_name")
+
+    def __init__(self, table: str, name_column: str, rows: List[Dict[str, Any]]):
+        self.table = table
+        self.name_column = name_column
+        self.columns: Tuple[str, ...] = tuple(rows[0].keys()) if rows else ()
+        self.by_id: Dict[int, tuple] = {}
+        self.by_name: Dict[str, tuple] = {}
+        for row in rows:
+            record = tuple(row[c] for c in self.columns)
+            if row.get("id") is not None:
+                self.by_id[int(row["id"])] = record
+            if row.get(name_column):
+                self.by_name[_normalize_name(row[name_column])] = record
+
+    def as_dict(self, record: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        return dict(zip(self.columns, record)) if record is not None else None
+
+    def records(self) -> List[Dict[str, Any]]:
+        return [dict(zip(self.columns, r)) for r in self.by_id.values()]
+
+
+class CatalogIndexService:
+    """
+    Índice en memoria de los catálogos de equipos (paneles, inversores, baterías y
+    tipos de estructura). Se carga con una consulta por tabla y después resuelve
+    cualquier búsqueda por id o por nombre sin volver a la base de datos.
+    """
+
+    def __init__(self, ttl_s: float = CATALOG_INDEX_TTL_S):
+        self.ttl_s = ttl_s
+        self._tables: Dict[str, _CatalogTable] = {}
+        self._loaded_at: Optional[float] = None
+        self._version = 0
+        self._content_hash: Optional[str] = None
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        self._reload_listeners: List[Callable[[Any], None]] = []
+
+    # ---- Carga e invalidación ----
+
+    @property
+    def version(self) -> int:
+        """
+        Se incrementa cuando una recarga trae datos distintos (hash del contenido): las
+        recargas por TTL sin cambios no invalidan los índices derivados (búsqueda, compatibilidad).
+        """
+        return self._version
+
+    def _is_stale(self) -> bool:
+        return self._loaded_at is None or (time.monotonic() - self._loaded_at) > self.ttl_s
+
+    def ensure_loaded(self, conn) -> None:
+        """Carga (o recarga si caducó) el índice usando la conexión de la petición."""
+        if not self._is_stale():
+            return
+        with self._lock:
+            if not self._is_stale():
+                return
+            tables = {}
+            digest = hashlib.blake2b(digest_size=16)
+            for key, (table, name_column) in INDEXED_CATALOGS.items():
+                rows = [dict(r) for r in catalog_model.get_catalog_data(conn, table, order_by_column="id")]
+                tables[key] = _CatalogTable(table, name_column, rows)
+                digest.update(key.encode())
+                for row in rows:
+                    digest.update(repr(sorted(row.items())).encode())
+            self._loaded_at = time.monotonic()
+            content_hash = digest.hexdigest()
+            changed = content_hash != self._content_hash
+            if changed:
+                self._tables = tables
+                self._content_hash = content_hash
+                self._version += 1
+                logging.info(
+                    "Índice de catálogos cargado (v%s): %s", self._version,
+                    {k: len(t.by_id) for k, t in tables.items()},
+                )
+        if changed:
+            # Fuera del lock: los listeners vuelven a leer el índice (get_all)
+            for callback in list(self._reload_listeners):
+                try:
+                    callback(conn)
+                except Exception as e:
+                    logging.warning(f"Error en listener de recarga de catálogo: {e}", exc_info=True)
+
+    def invalidate(self) -> None:
+        """Marca el índice como caducado; se recargará en la siguiente consulta."""
+        with self._lock:
+            self._loaded_at = None
+
+    def subscribe(self, callback: Callable[[], None]) -> None:
+        """Registra un callback que se ejecuta cada vez que cambian los catálogos."""
+        self._listeners.append(callback)
+
+    def on_reload(self, callback: Callable[[Any], None]) -> None:
+        """
+        Registra un callback(conn) que se ejecuta tras cada recarga con datos distintos, para
+        reconstruir ahí los índices derivados en lugar de en la primera consulta que los pida.
+        """
+        self._reload_listeners.append(callback)
+
+    def notify_changed(self) -> None:
+        """
+        Notificación de cambio de catálogo: invalida el índice y avisa a los
+        índices derivados. Llamar tras cualquier escritura en las tablas de equipos.
+        """
+        self.invalidate()
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception as e:
+                logging.warning(f"Error en listener de cambio de catálogo: {e}", exc_info=True)
+
+    # ---- Consultas ----
+
+    def _lookup(self, conn, catalog: str, item_id=None, name=None) -> Optional[Dict[str, Any]]:
+        self.ensure_loaded(conn)
+        table = self._tables.get(catalog)
+        if table is None:
+            return None
+        record = None
+        if item_id not in (None, ""):
+            try:
+                record = table.by_id.get(int(item_id))
+            except (TypeError, ValueError):
+                record = None
+        if record is None and name:
+            record = table.by_name.get(_normalize_name(name))
+        return table.as_dict(record)
+
+    def get_panel(self, conn, panel_id=None, name=None) -> Optional[Dict[str, Any]]:
+        return self._lookup(conn, "paneles", panel_id, name)
+
+    def get_inversor(self, conn, inversor_id=None, name=None) -> Optional[Dict[str, Any]]:
+        return self._lookup(conn, "inversores", inversor_id, name)
+
+    def get_bateria(self, conn, bateria_id=None, name=None) -> Optional[Dict[str, Any]]:
+        return self._lookup(conn, "baterias", bateria_id, name)
+
+    def get_tipo_estructura(self, conn, estructura_id=None, name=None) -> Optional[Dict[str, Any]]:
+        return self._lookup(conn, "tipos_estructura", estructura_id, name)
+
+    def get_all(self, conn, catalog: str) -> List[Dict[str, Any]]:
+        """Devuelve todas las filas indexadas de un catálogo (orden por id)."""
+        self.ensure_loaded(conn)
+        table = self._tables.get(catalog)
+        return table.records() if table else []
+
+    def enrich_context(self, conn, contexto: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Completa el contexto de una instalación con los datos de catálogo de su panel,
+        inversor, batería y tipo de estructura. Resuelve por id y, si no hay id, por nombre.
+        Nunca pisa valores ya presentes (en particular el 'id' de la instalación).
+        """
+        lookups = (
+            (self.get_panel, 'panel_solar_id', ('panel_solar', 'panel_solar_nombre')),
+            (self.get_inversor, 'inversor_id', ('inversor', 'inversor_nombre')),
+            (self.get_bateria, 'bateria_id', ('bateria', 'bateria_nombre')),
+            (self.get_tipo_estructura, 'tipo_estructura_id', ('tipo_estructura', 'tipo_estructura_nombre')),
+        )
+        for getter, id_key, name_keys in lookups:
+            name = next((contexto.get(k) for k in name_keys if isinstance(contexto.get(k), str) and contexto.get(k)), None)
+            record = getter(conn, contexto.get(id_key), name)
+            if not record:
+                continue
+            for k, v in record.items():
+                if k != 'id' and contexto.get(k) is None:
+                    contexto[k] = v
+        return contexto
+
+
+# instancia global compartida por rutas y servicios
+catalog_index = CatalogIndexService()
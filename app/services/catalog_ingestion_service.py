@@ -0,0 +1,355 @@
+# app/services/catalog_ingestion_service.py
+"""
+Ingesta masiva de fichas técnicas de fabricantes (CSV/XLSX) en los catálogos de equipos.
+
+Flujo: lectura en streaming -> validación por lotes -> COPY a una tabla staging temporal
+-> cálculo de diferencias -> UPDATE ... FROM staging + INSERT ... WHERE NOT EXISTS ->
+notificación de cambio de catálogo.
+
+La columna clave (nombre_panel, nombre_inversor) no necesita restricción UNIQUE en el
+esquema: el upsert se hace por comparación y la tabla se bloquea frente a otras
+escrituras durante la importación para que dos importaciones no dupliquen claves.
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import logging
+import argparse
+from typing import Any, Dict, Iterator, List, Tuple
+
+from app.services.catalog_index_service import catalog_index
+
+INGESTION_BATCH_SIZE = int(os.getenv("CATALOG_INGESTION_BATCH_SIZE", "1000"))
+# Máximo de entradas detalladas (rechazos/cambios) que se devuelven en el informe
+REPORT_DETAIL_LIMIT = 200
+
+# Especificación de cada catálogo importable.
+# columns: columna -> (tipo python, tipo SQL de staging, (mínimo, máximo) o None)
+INGESTION_SPECS = {
+    "paneles": {
+        "table": "paneles_solares",
+        "key": "nombre_panel",
+        "required": ["nombre_panel", "potencia_pico_w"],
+        "columns": {
+            "nombre_panel": (str, "text", None),
+            "potencia_pico_w": (int, "integer", (1, 1000)),
+            "tension_circuito_abierto_voc": (float, "numeric", (1, 1500)),
+            "largo_mm": (int, "integer", (100, 5000)),
+            "ancho_mm": (int, "integer", (100, 3000)),
+            "profundidad_mm": (int, "integer", (1, 200)),
+            "peso_kg": (float, "numeric", (0.1, 100)),
+            "eficiencia_panel_porcentaje": (float, "numeric", (1, 100)),
+            "tecnologia": (str, "text", None),
+            "numero_celulas": (int, "integer", (1, 500)),
+        },
+        "aliases": {
+            "nombre": "nombre_panel", "modelo": "nombre_panel",
+            "pmax": "potencia_pico_w", "potencia_w": "potencia_pico_w",
+            "voc": "tension_circuito_abierto_voc",
+            "largo": "largo_mm", "ancho": "ancho_mm", "profundidad": "profundidad_mm",
+            "peso": "peso_kg", "eficiencia": "eficiencia_panel_porcentaje",
+            "celulas": "numero_celulas",
+        },
+    },
+    "inversores": {
+        "table": "inversores",
+        "key": "nombre_inversor",
+        "required": ["nombre_inversor"],
+        "columns": {
+            "nombre_inversor": (str, "text", None),
+            "monofasico_trifasico": (str, "text", None),
+            "potencia_salida_va": (float, "numeric", (1, 1_000_000)),
+            "potencia_max_paneles_w": (float, "numeric", (1, 2_000_000)),
+            "tension_max_entrada_v": (float, "numeric", (1, 1500)),
+            "tecnologia": (str, "text", None),
+            "largo_mm": (int, "integer", (1, 5000)),
+            "ancho_mm": (int, "integer", (1, 5000)),
+            "profundo_mm": (int, "integer", (1, 5000)),
+            "peso_kg": (float, "numeric", (0.1, 5000)),
+            "proteccion_ip": (str, "text", None),
+        },
+        "aliases": {
+            "nombre": "nombre_inversor", "modelo": "nombre_inversor",
+            "fases": "monofasico_trifasico",
+            "potencia_va": "potencia_salida_va", "potencia_ac": "potencia_salida_va",
+            "potencia_max_dc_w": "potencia_max_paneles_w",
+            "vmax": "tension_max_entrada_v", "tension_max_dc_v": "tension_max_entrada_v",
+            "ip": "proteccion_ip",
+        },
+    },
+}
+
+
+# ==================
+# Lectura en streaming
+# ==================
+
+def _iter_csv_rows(stream) -> Iterator[List[Any]]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="") if not isinstance(stream, io.TextIOBase) else stream
+    sample = text.read(4096)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(_chain_sample(sample, text), dialect)
+    yield from reader
+
+
+def _chain_sample(sample: str, text) -> Iterator[str]:
+    # Reinyecta la muestra leída para detectar el separador sin rebobinar el stream
+    buffered = io.StringIO(sample + text.readline())
+    yield from buffered
+    yield from text
+
+
+def _iter_xlsx_rows(stream) -> Iterator[List[Any]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("La importación de ficheros XLSX requiere el paquete 'openpyxl'.")
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def iter_rows(stream, filename: str) -> Iterator[List[Any]]:
+    """Devuelve las filas (incluida la cabecera) de un CSV o XLSX sin cargarlo entero."""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return _iter_xlsx_rows(stream)
+    return _iter_csv_rows(stream)
+
+
+# ==========
+# Validación
+# ==========
+
+def _map_header(header: List[Any], spec: Dict[str, Any]) -> Dict[int, str]:
+    mapping = {}
+    for pos, raw in enumerate(header):
+        name = str(raw or "").strip().lower().replace(" ", "_")
+        column = name if name in spec["columns"] else spec["aliases"].get(name)
+        if column:
+            mapping[pos] = column
+    missing = [c for c in spec["required"] if c not in mapping.values()]
+    if missing:
+        raise ValueError(f"Faltan columnas obligatorias en la cabecera: {', '.join(missing)}")
+    return mapping
+
+
+def _coerce(value: Any, py_type, bounds) -> Any:
+    if value is None or str(value).strip() == "":
+        return None
+    if py_type is str:
+        return str(value).strip()
+    try:
+        number = float(str(value).strip().replace(",", "."))
+    except ValueError:
+        raise ValueError(f"'{value}' no es un número")
+    if py_type is int:
+        if not number.is_integer():
+            raise ValueError(f"'{value}' no es un entero")
+        number = int(number)
+    if bounds and not (bounds[0] <= number <= bounds[1]):
+        raise ValueError(f"{number} fuera de rango [{bounds[0]}, {bounds[1]}]")
+    return number
+
+
+def validate_batch(batch: List[Tuple[int, List[Any]]], mapping: Dict[int, str], spec: Dict[str, Any]):
+    """Valida un lote de filas. Devuelve (filas_válidas, rechazos)."""
+    valid, rejected = [], []
+    for line_no, raw in batch:
+        record, errors = {}, []
+        for pos, column in mapping.items():
+            py_type, _, bounds = spec["columns"][column]
+            try:
+                record[column] = _coerce(raw[pos] if pos < len(raw) else None, py_type, bounds)
+            except (TypeError, ValueError) as e:
+                errors.append(f"{column}: {e}")
+        for column in spec["required"]:
+            if record.get(column) is None and not any(e.startswith(column) for e in errors):
+                errors.append(f"{column}: obligatorio")
+        if errors:
+            rejected.append({"line": line_no, "errors": errors})
+        else:
+            valid.append((line_no, record))
+    return valid, rejected
+
+
+# =====================
+# Staging, diff y upsert
+# =====================
+
+def _create_staging(cursor, staging: str, columns: List[str], spec: Dict[str, Any]):
+    cols_sql = ", ".join(f"{c} {spec['columns'][c][1]}" for c in columns)
+    cursor.execute(f"CREATE TEMP TABLE {staging} (_line integer, {cols_sql}) ON COMMIT DROP")
+
+
+def _copy_batch(cursor, staging: str, columns: List[str], rows: List[Tuple[int, Dict[str, Any]]]):
+    buff = io.StringIO()
+    writer = csv.writer(buff)
+    for line_no, record in rows:
+        writer.writerow([line_no] + ["" if record.get(c) is None else record[c] for c in columns])
+    buff.seek(0)
+    cursor.copy_expert(f"COPY {staging} (_line, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buff)
+
+
+def _diff_and_upsert(cursor, staging: str, columns: List[str], spec: Dict[str, Any], dry_run: bool) -> Dict[str, Any]:
+    table, key = spec["table"], spec["key"]
+    data_cols = [c for c in columns if c != key]
+    deduped = f"SELECT DISTINCT ON ({key}) * FROM {staging} ORDER BY {key}, _line DESC"
+
+    changed_expr = ", ".join(
+        f"CASE WHEN t.{c} IS DISTINCT FROM s.{c} THEN '{c}' END" for c in data_cols
+    ) or "NULL"
+    cursor.execute(f"""
+        SELECT s.{key} AS key, t.{key} IS NULL AS is_new,
+               ARRAY_REMOVE(ARRAY[{changed_expr}]::text[], NULL) AS changed
+        FROM ({deduped}) s
+        LEFT JOIN {table} t ON t.{key} = s.{key}
+    """)
+    inserted, updated, unchanged = [], [], 0
+    for row in cursor.fetchall():
+        if row["is_new"]:
+            inserted.append(row["key"])
+        elif row["changed"]:
+            updated.append({"key": row["key"], "changed": row["changed"]})
+        else:
+            unchanged += 1
+
+    if not dry_run and (inserted or updated):
+        # Sin UNIQUE en la clave no hay ON CONFLICT: se excluyen otras escrituras hasta el commit
+        cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+        if updated and data_cols:
+            set_sql = ", ".join(f"{c} = s.{c}" for c in data_cols)
+            distinct_sql = (f"({', '.join(f't.{c}' for c in data_cols)}) IS DISTINCT FROM "
+                            f"({', '.join(f's.{c}' for c in data_cols)})")
+            cursor.execute(f"""
+                UPDATE {table} t SET {set_sql}
+                FROM ({deduped}) s
+                WHERE t.{key} = s.{key} AND {distinct_sql}
+            """)
+        if inserted:
+            cols_sql = ", ".join(columns)
+            cursor.execute(f"""
+                INSERT INTO {table} ({cols_sql})
+                SELECT {', '.join(f's.{c}' for c in columns)} FROM ({deduped}) s
+                WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key} = s.{key})
+            """)
+
+    return {
+        "inserted": len(inserted),
+        "updated": len(updated),
+        "unchanged": unchanged,
+        "inserted_keys": inserted[:REPORT_DETAIL_LIMIT],
+        "updated_detail": updated[:REPORT_DETAIL_LIMIT],
+    }
+
+
+def ingest_catalog_file(conn, catalog: str, stream, filename: str, dry_run: bool = False,
+                        batch_size: int = INGESTION_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Importa un fichero CSV/XLSX de fichas técnicas en el catálogo indicado
+    ('paneles' o 'inversores') y devuelve un informe de diferencias.
+    No hace commit: la transacción la gestiona quien llama.
+    """
+    spec = INGESTION_SPECS.get(catalog)
+    if not spec:
+        raise ValueError(f"Catálogo no importable: {catalog}. Opciones: {', '.join(INGESTION_SPECS)}")
+
+    rows = iter_rows(stream, filename)
+    try:
+        header = next(rows)
+    except StopIteration:
+        raise ValueError("El fichero está vacío.")
+    mapping = _map_header(header, spec)
+    columns = list(dict.fromkeys(mapping.values()))
+    staging = f"stg_{spec['table']}"
+
+    report: Dict[str, Any] = {"catalog": catalog, "dry_run": dry_run, "rows_read": 0,
+                              "rows_valid": 0, "rejected": 0, "rejected_detail": []}
+    with conn.cursor() as cursor:
+        _create_staging(cursor, staging, columns, spec)
+
+        def flush(batch):
+            valid, rejected = validate_batch(batch, mapping, spec)
+            report["rows_valid"] += len(valid)
+            report["rejected"] += len(rejected)
+            room = REPORT_DETAIL_LIMIT - len(report["rejected_detail"])
+            report["rejected_detail"].extend(rejected[:max(room, 0)])
+            if valid:
+                _copy_batch(cursor, staging, columns, valid)
+
+        batch: List[Tuple[int, List[Any]]] = []
+        for line_no, raw in enumerate(rows, start=2):
+            if not raw or all(v is None or str(v).strip() == "" for v in raw):
+                continue
+            batch.append((line_no, raw))
+            report["rows_read"] += 1
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        report.update(_diff_and_upsert(cursor, staging, columns, spec, dry_run))
+
+    logging.info(
+        "Ingesta de catálogo '%s' (%s): leídas=%s válidas=%s rechazadas=%s nuevas=%s actualizadas=%s sin cambios=%s",
+        catalog, filename, report["rows_read"], report["rows_valid"], report["rejected"],
+        report["inserted"], report["updated"], report["unchanged"],
+    )
+    return report
+
+
+def import_catalog(conn, catalog: str, stream, filename: str, dry_run: bool = False) -> Dict[str, Any]:
+    """Ingesta completa en una transacción: commit (o rollback si dry_run) y notificación de cambio."""
+    try:
+        report = ingest_catalog_file(conn, catalog, stream, filename, dry_run=dry_run)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+            if report["inserted"] or report["updated"]:
+                catalog_index.notify_changed()
+        return report
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# =========================
+# Línea de comandos
+# =========================
+
+def main(argv=None) -> int:
+    """python -m app.services.catalog_ingestion_service paneles fichas.csv [--dry-run]"""
+    parser = argparse.ArgumentParser(description="Importa fichas técnicas (CSV/XLSX) en un catálogo de equipos.")
+    parser.add_argument("catalog", choices=sorted(INGESTION_SPECS), help="catálogo de destino")
+    parser.add_argument("path", help="fichero .csv o .xlsx")
+    parser.add_argument("--dry-run", action="store_true", help="calcula el informe sin escribir en la BD")
+    args = parser.parse_args(argv)
+
+    from app.database import get_conn, release_conn
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s')
+    connection = get_conn()
+    try:
+        with open(args.path, "rb") as fh:
+            result = import_catalog(connection, args.catalog, fh, os.path.basename(args.path), dry_run=args.dry_run)
+    except ValueError as e:
+        logging.error(f"Importación rechazada: {e}")
+        return 1
+    finally:
+        release_conn(connection)
+    sys.stdout.write(json.dumps(result, ensure_ascii=False, indent=2, default=str) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# app/services/catalog_search_service.py
+
+import time
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models import catalog_model
+from app.services.catalog_index_service import catalog_index, INDEXED_CATALOGS, CATALOG_INDEX_TTL_S
+
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+# Similitud mínima (Jaccard de trigramas) para aceptar una coincidencia difusa
+MIN_TRIGRAM_SCORE = 0.2
+# Máximo de candidatos que se puntúan en la búsqueda difusa (acota su coste con catálogos grandes)
+MAX_FUZZY_CANDIDATES = 2000
+
+
+def normalize_search_text(text: Any) -> str:
+    """Minúsculas, sin tildes y con espacios colapsados."""
+    decomposed = unicodedata.normalize("NFKD", str(text or ""))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.lower().split())
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PrefixIndex:
+    """
+    Índice de autocompletado para un catálogo:
+    - Dos arrays ordenados (nombres completos y sufijos que empiezan en palabra) recorridos
+      con bisect: una consulta cuesta O(log n + limit).
+    - Índice invertido de trigramas como alternativa difusa (erratas, orden de palabras).
+    """
+
+    def __init__(self, items: List[Tuple[Any, str]]):
+        self.items = items  # [(id, nombre)]
+        self._norm = [normalize_search_text(name) for _, name in items]
+
+        self._full = sorted((norm, idx) for idx, norm in enumerate(self._norm))
+        self._full_keys = [k for k, _ in self._full]
+        words = []
+        for idx, norm in enumerate(self._norm):
+            parts = norm.split(" ")
+            words.extend((" ".join(parts[w:]), idx) for w in range(1, len(parts)))
+        words.sort()
+        self._words = words
+        self._word_keys = [k for k, _ in words]
+
+        self._trigram_index: Dict[str, List[int]] = defaultdict(list)
+        self._item_trigrams: List[frozenset] = []
+        for idx, norm in enumerate(self._norm):
+            tris = frozenset(_trigrams(norm))
+            self._item_trigrams.append(tris)
+            for t in tris:
+                self._trigram_index[t].append(idx)
+
+    def __len__(self):
+        return len(self.items)
+
+    @staticmethod
+    def _scan(keys: List[str], pairs: List[Tuple[str, int]], q: str, limit: int, found: Dict[int, str]):
+        pos = bisect_left(keys, q)
+        while pos < len(keys) and len(found) < limit and keys[pos].startswith(q):
+            found.setdefault(pairs[pos][1], "prefix")
+            pos += 1
+
+    def _fuzzy_candidates(self, postings: List[List[int]]) -> set:
+        """
+        Candidatos a puntuar, como mucho MAX_FUZZY_CANDIDATES: la unión de los trigramas más
+        raros mientras quepa; si ya el más raro es demasiado común, la intersección de los
+        más raros (un nombre parecido comparte casi todos los trigramas de la consulta).
+        """
+        postings = sorted(postings, key=len)
+        if len(postings[0]) <= MAX_FUZZY_CANDIDATES:
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if len(candidates) + len(posting) > MAX_FUZZY_CANDIDATES:
+                    break
+                candidates.update(posting)
+            return candidates
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if len(candidates) <= MAX_FUZZY_CANDIDATES:
+                break
+            narrowed = candidates.intersection(posting)
+            if not narrowed:
+                break
+            candidates = narrowed
+        if len(candidates) > MAX_FUZZY_CANDIDATES:
+            candidates = set(sorted(candidates)[:MAX_FUZZY_CANDIDATES])
+        return candidates
+
+    def _trigram_matches(self, q: str, exclude: Dict[int, str]) -> List[Tuple[float, int]]:
+        q_tris = frozenset(_trigrams(q))
+        postings = [self._trigram_index[t] for t in q_tris if t in self._trigram_index]
+        if not postings:
+            return []
+        scored = []
+        for idx in self._fuzzy_candidates(postings):
+            if idx in exclude:
+                continue
+            tris = self._item_trigrams[idx]
+            n = len(q_tris & tris)
+            score = n / (len(q_tris) + len(tris) - n)
+            if score >= MIN_TRIGRAM_SCORE:
+                scored.append((score, idx))
+        scored.sort(key=lambda s: (-s[0], self._norm[s[1]]))
+        return scored
+
+    def suggest(self, query: str, limit: int = DEFAULT_SUGGEST_LIMIT) -> List[Dict[str, Any]]:
+        q = normalize_search_text(query)
+        found: Dict[int, str] = {}
+        # 1) prefijo del nombre completo, 2) prefijo de cualquier palabra interna
+        self._scan(self._full_keys, self._full, q, limit, found)
+        if q:
+            self._scan(self._word_keys, self._words, q, limit, found)
+            # 3) alternativa difusa por trigramas si no se llenó el cupo
+            if len(found) < limit:
+                for _, idx in self._trigram_matches(q, found)[:limit - len(found)]:
+                    found[idx] = "fuzzy"
+        return [{"id": self.items[i][0], "name": self.items[i][1], "match": m} for i, m in found.items()]
+
+
+class CatalogSearchService:
+    """
+    Mantiene un PrefixIndex por catálogo. Los catálogos de equipos se construyen desde
+    el índice en memoria (y se reconstruyen cuando cambia su versión); el resto de
+    catálogos se cargan con una consulta y caducan con el mismo TTL.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[str, Tuple[Any, float, PrefixIndex]] = {}
+        self._lock = threading.Lock()
+        catalog_index.subscribe(self.invalidate)
+
+    def invalidate(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def _build(self, conn, catalog_name: str, table: str, name_column: str) -> Tuple[Any, PrefixIndex]:
+        if catalog_name in INDEXED_CATALOGS:
+            rows = catalog_index.get_all(conn, catalog_name)
+            version = catalog_index.version
+        else:
+            rows = catalog_model.get_catalog_data(conn, table, order_by_column=name_column)
+            version = None
+        items = [(r.get("id"), r.get(name_column)) for r in rows if r.get(name_column)]
+        logging.info(f"Índice de autocompletado '{catalog_name}' construido con {len(items)} elementos.")
+        return version, PrefixIndex(items)
+
+    def get_index(self, conn, catalog_name: str, table: str, name_column: str) -> PrefixIndex:
+        if catalog_name in INDEXED_CATALOGS:
+            # Garantiza que la versión del índice base está al día antes de compararla
+            catalog_index.ensure_loaded(conn)
+        entry = self._indexes.get(catalog_name)
+        now = time.monotonic()
+        if entry is not None:
+            version, built_at, index = entry
+            fresh = (version == catalog_index.version) if catalog_name in INDEXED_CATALOGS \
+                else (now - built_at) <= CATALOG_INDEX_TTL_S
+            if fresh:
+                return index
+        with self._lock:
+            version, index = self._build(conn, catalog_name, table, name_column)
+            self._indexes[catalog_name] = (version, now, index)
+            return index
+
+    def suggest(self, conn, catalog_name: str, table: str, name_column: str,
+                query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        limit = max(1, min(int(limit or DEFAULT_SUGGEST_LIMIT), MAX_SUGGEST_LIMIT))
+        return self.get_index(conn, catalog_name, table, name_column).suggest(query, limit)
+
+
+# instancia global compartida por las rutas de catálogo
+catalog_search = CatalogSearchService()
@@ -0,0 +1,175 @@
+# app/services/circuit_tree_service.py
+
+import os
+from collections import deque
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services import calculator_kernels as kernels
+from app.services.calculator_service import ElectricalCalculator
+
+CIRCUIT_TREE_MAX_NODES = int(os.getenv("CIRCUIT_TREE_MAX_NODES", "5000"))
+DEFAULT_MAX_DROP_PCT = 3.0
+
+
+def _value(calc: ElectricalCalculator, raw, name: str, normalizer: str, default=None) -> float:
+    """Acepta {"value", "unit"} (se normaliza con la calculadora) o un número en unidades base."""
+    if raw is None or raw == '':
+        if default is None:
+            raise ValueError(f"falta el dato '{name}'")
+        return default
+    if isinstance(raw, dict):
+        return float(getattr(calc, normalizer)(raw))
+    return float(raw)
+
+
+def calculate_circuit_tree(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Caída de tensión acumulada en un árbol de circuitos (p. ej. punto de conexión ->
+    cuadro CA -> inversor -> strings).
+
+    Cada nodo describe el tramo de cable que lo une con su padre ('parent'; el nodo raíz
+    no tiene tramo) y su carga propia ('load_power_w' o 'load_current'). La tensión del
+    nodo ('voltage') se hereda del padre si no se indica, lo que permite mezclar niveles
+    (CC de strings y CA). En una sola pasada:
+      1. post-orden: potencia acumulada del subárbol y corriente de cada tramo,
+      2. un único voltage_drop_kernel para todos los tramos,
+      3. pre-orden: caída acumulada desde la raíz y comprobación de límites.
+    Devuelve los nodos en orden de recorrido y el camino con mayor caída.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("El cuerpo de la petición debe ser un objeto JSON.")
+    calc = ElectricalCalculator()
+    nodes = data.get('nodes')
+    if not isinstance(nodes, list) or not nodes:
+        raise ValueError("'nodes' debe ser una lista no vacía.")
+    if len(nodes) > CIRCUIT_TREE_MAX_NODES:
+        raise ValueError(f"Demasiados nodos ({len(nodes)}). Máximo: {CIRCUIT_TREE_MAX_NODES}.")
+    default_max = float(data.get('max_voltage_drop_percent', DEFAULT_MAX_DROP_PCT))
+
+    for i, n in enumerate(nodes):
+        if not isinstance(n, dict):
+            raise ValueError(f"Nodo {i + 1}: debe ser un objeto JSON.")
+    ids = [str(n.get('id')) for n in nodes]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Los ids de los nodos deben ser únicos.")
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    parent = [-1] * len(nodes)
+    children: List[List[int]] = [[] for _ in nodes]
+    for i, n in enumerate(nodes):
+        p = n.get('parent')
+        if p is not None:
+            if str(p) not in index:
+                raise ValueError(f"Nodo '{ids[i]}': padre desconocido '{p}'.")
+            parent[i] = index[str(p)]
+            children[parent[i]].append(i)
+    roots = [i for i in range(len(nodes)) if parent[i] < 0]
+    if not roots:
+        raise ValueError("El árbol no tiene nodo raíz (sin 'parent').")
+
+    # Orden de recorrido en anchura desde las raíces: los padres siempre antes que los hijos
+    order: List[int] = []
+    queue = deque(roots)
+    while queue:
+        i = queue.popleft()
+        order.append(i)
+        queue.extend(children[i])
+    if len(order) != len(nodes):
+        raise ValueError("El árbol contiene ciclos.")
+
+    # Tensiones (heredadas), parámetros de tramo y cargas propias; listas y luego arrays
+    n_nodes = len(nodes)
+    voltage, length, section, cos_phi, rho, power = ([0.0] * n_nodes for _ in range(6))
+    three_phase = [False] * n_nodes
+    max_drop = [default_max] * n_nodes
+    system_types: List[str] = [''] * len(nodes)
+    for i in order:
+        n = nodes[i]
+        try:
+            inherited = voltage[parent[i]] if parent[i] >= 0 else None
+            voltage[i] = _value(calc, n.get('voltage', data.get('source_voltage') if inherited is None else None),
+                                'voltage', '_normalize_voltage', inherited)
+            # El tipo de sistema también se hereda del padre
+            system_type = n.get('system_type') or (system_types[parent[i]] if parent[i] >= 0 else data.get('system_type', 'monofasico'))
+            system_types[i] = system_type
+            three_phase[i] = str(system_type).lower() != 'monofasico'
+            cos_phi[i] = float(n.get('power_factor', 1.0))
+            if not 0 < cos_phi[i] <= 1:
+                raise ValueError("el factor de potencia debe estar entre 0 (excluido) y 1")
+            if parent[i] >= 0:
+                length[i] = _value(calc, n.get('length'), 'length', '_normalize_length')
+                section[i] = _value(calc, n.get('wire_cross_section'), 'wire_cross_section', '_normalize_cross_section')
+                if section[i] <= 0:
+                    raise ValueError("la sección del cable debe ser mayor que cero")
+                rho[i] = kernels.RESISTIVIDAD_COBRE if str(n.get('material', 'cobre')).lower() == 'cobre' \
+                    else kernels.RESISTIVIDAD_ALUMINIO
+            if n.get('load_power_w') not in (None, ''):
+                power[i] = float(n['load_power_w'])
+            elif n.get('load_current') not in (None, ''):
+                current = _value(calc, n['load_current'], 'load_current', '_normalize_current')
+                power[i] = current * voltage[i] * cos_phi[i] * (kernels.SQRT3 if three_phase[i] else 1.0)
+            if n.get('max_voltage_drop_percent') not in (None, ''):
+                max_drop[i] = float(n['max_voltage_drop_percent'])
+        except (ValueError, TypeError, KeyError) as e:
+            raise ValueError(f"Nodo '{ids[i]}': {e}")
+        if voltage[i] <= 0:
+            raise ValueError(f"Nodo '{ids[i]}': la tensión debe ser mayor que cero.")
+
+    # 1. Post-orden: potencia del subárbol (balance de potencias entre niveles de tensión)
+    for i in reversed(order):
+        if parent[i] >= 0:
+            power[parent[i]] += power[i]
+    voltage, length, section, cos_phi, rho, power, max_drop = (
+        np.asarray(a, dtype=np.float64) for a in (voltage, length, section, cos_phi, rho, power, max_drop)
+    )
+    three_phase = np.asarray(three_phase, dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        current = power / (voltage * cos_phi * np.where(three_phase, kernels.SQRT3, 1.0))
+
+    # 2. Todos los tramos en una llamada (las raíces no tienen tramo: longitud 0)
+    drop_v, drop_pct, _ = kernels.voltage_drop_kernel(
+        current, length, np.where(section > 0, section, 1.0), rho, three_phase, voltage, cos_phi
+    )
+
+    # 3. Pre-orden: caída acumulada desde la raíz
+    segment_pct = drop_pct.tolist()
+    cumulative = [0.0] * n_nodes
+    for i in order:
+        cumulative[i] = segment_pct[i] + (cumulative[parent[i]] if parent[i] >= 0 else 0.0)
+
+    leaves = [i for i in order if not children[i]]
+    worst_leaf = max(leaves, key=lambda i: cumulative[i])
+    worst_path = []
+    i = worst_leaf
+    while i >= 0:
+        worst_path.append(ids[i])
+        i = parent[i]
+    worst_path.reverse()
+
+    voltage_l, power_l, current_l, drop_v_l, max_drop_l = (
+        a.tolist() for a in (voltage, power, current, drop_v, max_drop)
+    )
+    result_nodes = []
+    for i in order:
+        result_nodes.append({
+            "id": ids[i],
+            "parent": ids[parent[i]] if parent[i] >= 0 else None,
+            "voltage_v": round(voltage_l[i], 2),
+            "power_w": round(power_l[i], 2),
+            "current_a": round(current_l[i], 3),
+            "segment_drop_v": round(drop_v_l[i], 3),
+            "segment_drop_percent": round(segment_pct[i], 3),
+            "cumulative_drop_percent": round(cumulative[i], 3),
+            "exceeds_limit": cumulative[i] > max_drop_l[i],
+        })
+
+    return {
+        "nodes": result_nodes,
+        "worst_path": {
+            "nodes": worst_path,
+            "cumulative_drop_percent": round(cumulative[worst_leaf], 3),
+            "exceeds_limit": cumulative[worst_leaf] > max_drop_l[worst_leaf],
+        },
+        "nodes_exceeding_limit": [r["id"] for r in result_nodes if r["exceeds_limit"]],
+    }
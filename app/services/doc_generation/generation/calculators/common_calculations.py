@@ -2,6 +2,10 @@ import datetime
 import logging
 from typing import Dict, Any
 
+from app.services.doc_generation.generation.calculators.registry import calculator
+
+MESES_PRODUCCION = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+
 def _fmt_dir(nombre_via, numero_via, piso_puerta, localidad, provincia) -> str:
     dir_parts = [nombre_via or '', numero_via or '', piso_puerta or '']
     direccion_str = ' '.join(filter(None, dir_parts)).strip()
@@ -12,6 +16,16 @@ def _fmt_dir(nombre_via, numero_via, piso_puerta, localidad, provincia) -> str:
     return provincia or "No especificada"
 
 
+@calculator(
+    inputs=["fecha_finalizacion", "emplazamiento", "promotor", "instalador", "hospital_cercano", "bateria"],
+    outputs=[
+        "dia_actual", "mes_actual", "anio_actual", "fecha_finalizacion_formateada",
+        "direccion_emplazamiento_completa", "promotor_direccion_completa", "instalador_direccion_completa",
+        "instalador_tecnico_nombre", "instalador_tecnico_dni", "instalador_tecnico_competencia",
+        "instalador_cif_empresa", "instalador_numero_colegiado", "hospital_direccion_completa",
+        "textoBaterias", "textoDisposiciónModulos",
+    ],
+)
 def calculate_format_addresses(ctx: Dict[str, Any]) -> Dict[str, Any]:
     """Formatea direcciones completas para emplazamiento, promotor e instalador."""
     logging.debug(f"........[format_addresses] Calculando direcciones con contexto: {ctx}")
@@ -105,6 +119,10 @@ def calculate_format_addresses(ctx: Dict[str, Any]) -> Dict[str, Any]:
 
     return calculated_data
 
+@calculator(
+    inputs=["numero_paneles", "paneles"],
+    outputs=["potenciaPicoW", *MESES_PRODUCCION, "produccionAnual"],
+)
 def calculate_pvgis_production(ctx: Dict[str, Any]) -> Dict[str, Any]:
     """Calcula la producción estimada (placeholder para PVGIS)."""
     logging.debug(f"........[calculate_pvgis_production] Calculando direcciones con contexto: {ctx}")
@@ -134,7 +152,7 @@ def calculate_pvgis_production(ctx: Dict[str, Any]) -> Dict[str, Any]:
     calculated_data['Noviembre'] = round(potencia_pico_total_w * 0.07, 2)
     calculated_data['Diciembre'] = round(potencia_pico_total_w * 0.05, 2)
     
-    produccion_anual_total = sum(calculated_data[mes] for mes in ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'])
+    produccion_anual_total = sum(calculated_data[mes] for mes in MESES_PRODUCCION)
     calculated_data['produccionAnual'] = round(produccion_anual_total, 2)
 
     return calculated_data
\ No newline at end of file
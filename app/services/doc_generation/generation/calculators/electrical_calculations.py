@@ -1,9 +1,20 @@
 import logging
 from typing import Dict, Any
 
+from app.services.doc_generation.generation.calculators.registry import calculator
+
 RHO_COBRE = 0.0172  # Ohm * mm^2 / m
 RHO_ALUMINIO = 0.0282 # Ohm * mm^2 / m
 
+@calculator(
+    inputs=["cableado", "protecciones", "inversor", "paneles"],
+    outputs=[
+        "fusible_cc_a", "protector_sobretensiones_v", "magnetotermico_a", "diferencialA", "sensibilidadMa",
+        "cable_dc_material", "cable_dc_seccion", "cable_dc_longitud",
+        "cable_ac_material", "cable_ac_seccion", "cable_ac_longitud",
+        "caidaTensionCCString1", "caidaTensionCA", "polosCA",
+    ],
+)
 def calculate_electrical_data(ctx: Dict[str, Any]) -> Dict[str, Any]:
     """Calcula caídas de tensión y datos de protecciones."""
     calculated_data = {}
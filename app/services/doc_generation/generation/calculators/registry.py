@@ -0,0 +1,173 @@
+# app/services/doc_generation/generation/calculators/registry.py
+"""
+Registro de calculadoras de contexto para la generación de documentos.
+
+Cada calculadora declara las claves del contexto que lee ('inputs') y las que
+produce ('outputs'):
+
+    @calculator(inputs=["numero_paneles", "paneles"], outputs=["potenciaPicoW"])
+    def calculate_potencia(ctx): ...
+
+Con eso se construye el grafo de dependencias (una entrada que es salida de otra
+calculadora es una arista) y, dadas las variables que usan las plantillas, solo se
+ejecuta lo necesario, en orden topológico. El grupo ('common', 'electrical',
+'structural') es el nombre del módulo sin '_calculations', igual que en
+doc_definitions.json ('required_calcs').
+"""
+
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from importlib import import_module
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+CALCULATORS_PACKAGE = "app.services.doc_generation.generation.calculators"
+CALCULATORS_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass(frozen=True)
+class Calculator:
+    name: str
+    group: str
+    func: Callable[[Dict[str, Any]], Dict[str, Any]]
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+
+
+def _group_from_module(module_name: str) -> str:
+    return module_name.rsplit(".", 1)[-1].replace("_calculations", "")
+
+
+def _fingerprint(values: List[Any]) -> str:
+    return json.dumps(values, sort_keys=True, default=str)
+
+
+class CalculatorRegistry:
+
+    def __init__(self):
+        self._calculators: Dict[str, Calculator] = {}
+        self._producers: Dict[str, str] = {}   # clave de salida -> calculadora
+        # (wanted, groups) -> plan; se vacía al registrar una calculadora
+        self._plans: Dict[Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]]], Tuple[Calculator, ...]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def register(self, inputs: Iterable[str] = (), outputs: Iterable[str] = (), group: Optional[str] = None):
+        """Decorador: registra la función con sus entradas y salidas declaradas."""
+        def decorator(func):
+            calc = Calculator(
+                name=f"{func.__module__}.{func.__name__}",
+                group=group or _group_from_module(func.__module__),
+                func=func,
+                inputs=tuple(inputs),
+                outputs=tuple(outputs),
+            )
+            with self._lock:
+                for key in calc.outputs:
+                    other = self._producers.get(key)
+                    if other and other != calc.name:
+                        raise ValueError(f"La salida '{key}' ya la produce {other} (no puede producirla {calc.name}).")
+                self._calculators[calc.name] = calc
+                for key in calc.outputs:
+                    self._producers[key] = calc.name
+                self._plans.clear()
+            return func
+        return decorator
+
+    def ensure_loaded(self):
+        """Importa todos los módulos *_calculations del paquete (cada uno registra las suyas)."""
+        if self._loaded:
+            return
+        for filename in sorted(os.listdir(CALCULATORS_ROOT)):
+            if filename.endswith("_calculations.py") and not filename.startswith("__"):
+                try:
+                    import_module(f"{CALCULATORS_PACKAGE}.{filename[:-3]}")
+                except Exception as e:
+                    logging.error(f"Error al cargar el módulo de cálculo {filename}: {e}")
+        self._loaded = True
+
+    def groups(self) -> List[str]:
+        self.ensure_loaded()
+        return sorted({c.group for c in self._calculators.values()})
+
+    def outputs(self, groups: Optional[Iterable[str]] = None) -> List[str]:
+        self.ensure_loaded()
+        groups = set(groups) if groups is not None else None
+        return sorted(k for c in self._calculators.values() if groups is None or c.group in groups for k in c.outputs)
+
+    def plan(self, wanted: Optional[Iterable[str]] = None, groups: Optional[Iterable[str]] = None) -> List[Calculator]:
+        """
+        Calculadoras a ejecutar, en orden de dependencias: las de 'groups' (todas si es None)
+        que producen alguna clave de 'wanted' (todas si es None), más las que producen sus
+        entradas aunque sean de otro grupo. ValueError si hay un ciclo.
+        """
+        return list(self._plan(wanted, groups))
+
+    def _plan(self, wanted: Optional[Iterable[str]], groups: Optional[Iterable[str]]) -> Tuple[Calculator, ...]:
+        # Memoizado por (wanted, groups): el registro no cambia tras la carga
+        self.ensure_loaded()
+        groups = frozenset(groups) if groups is not None else None
+        wanted = frozenset(wanted) if wanted is not None else None
+        cached = self._plans.get((wanted, groups))
+        if cached is not None:
+            return cached
+        roots = [
+            c for c in self._calculators.values()
+            if (groups is None or c.group in groups) and (wanted is None or wanted.intersection(c.outputs))
+        ]
+
+        order: List[Calculator] = []
+        state: Dict[str, int] = {}   # 1 = en curso, 2 = hecho
+
+        def visit(calc: Calculator):
+            mark = state.get(calc.name)
+            if mark == 2:
+                return
+            if mark == 1:
+                raise ValueError(f"Dependencia circular entre calculadoras en {calc.name}.")
+            state[calc.name] = 1
+            for key in calc.inputs:
+                producer = self._producers.get(key)
+                if producer and producer != calc.name:
+                    visit(self._calculators[producer])
+            state[calc.name] = 2
+            order.append(calc)
+
+        for calc in sorted(roots, key=lambda c: c.name):
+            visit(calc)
+        plan = tuple(order)
+        self._plans[(wanted, groups)] = plan
+        return plan
+
+    def run(self, ctx: Dict[str, Any], wanted: Optional[Iterable[str]] = None,
+            groups: Optional[Iterable[str]] = None, memo: Optional[Dict[Tuple[str, str], Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta el plan sobre 'ctx' (sin modificarlo) y devuelve las claves calculadas.
+        Cada calculadora ve el contexto con las salidas de las anteriores por encima.
+        Con 'memo' (un dict por petición) una calculadora con las mismas entradas no se
+        vuelve a ejecutar, p. ej. al preparar varios documentos de la misma instalación.
+        """
+        results: Dict[str, Any] = {}
+        # Copia plana del contexto (más rápida de consultar que un ChainMap)
+        scope = dict(ctx)
+        for calc in self._plan(wanted, groups):
+            key = None
+            if memo is not None:
+                key = (calc.name, _fingerprint([scope.get(k) for k in calc.inputs]))
+                if key in memo:
+                    results.update(memo[key])
+                    scope.update(memo[key])
+                    continue
+            new_calcs = calc.func(scope)
+            if key is not None:
+                memo[key] = new_calcs
+            results.update(new_calcs)
+            scope.update(new_calcs)
+        return results
+
+
+# instancia global: la usan los módulos *_calculations (registro) y los generadores (ejecución)
+calculator_registry = CalculatorRegistry()
+calculator = calculator_registry.register
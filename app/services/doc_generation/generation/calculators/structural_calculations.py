@@ -1,65 +1,77 @@
 import logging
 from typing import Dict, Any, Optional
 
+from app.services.doc_generation.generation.calculators.registry import calculator, calculator_registry
+
 def _to_float(x) -> Optional[float]:
     try:
         if x is None or x == "":
             return None
+        if type(x) in (int, float):
+            # Salidas de otras calculadoras y datos de catálogo: sin pasar por str
+            return float(x)
         s = str(x).strip().replace(",", ".")
         return float(s)
     except Exception:
         return None
 
-def calculate_structural_data(ctx: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Calcula superficieConstruidaM2, pesoEstructuraKg (paneles + estructura) y
-    densidades (kg/m2 y kN/m2) de forma tolerante a None/cadenas.
-    """
-    calculated: Dict[str, Any] = {}
-
-    # nº paneles
+def _numero_paneles(ctx: Dict[str, Any]) -> int:
     n_pan = _to_float(ctx.get("numero_paneles")) or 0.0
-    n_pan = int(n_pan) if n_pan > 0 else 0
+    return int(n_pan) if n_pan > 0 else 0
+
 
+def _dato_panel(ctx: Dict[str, Any], key: str) -> float:
     # fuente de datos de panel: ctx['paneles'][0] o campos planos
     p0 = (ctx.get("paneles") or [{}])[0] or {}
-    largo_mm  = _to_float(p0.get("largo_mm")  or ctx.get("largo_mm"))    or 0.0
-    ancho_mm  = _to_float(p0.get("ancho_mm")  or ctx.get("ancho_mm"))    or 0.0
-    peso_kg   = _to_float(p0.get("peso_kg")   or ctx.get("peso_kg"))     or 0.0
-    ppk_w     = _to_float(p0.get("potencia_pico_w") or ctx.get("potencia_pico_w")) or 0.0
+    return _to_float(p0.get(key) or ctx.get(key)) or 0.0
 
-    logging.info("--- INICIO CÁLCULOS ESTRUCTURALES ---")
-    logging.info("Entrada: n_paneles=%s, largo_mm=%s, ancho_mm=%s, peso_panel_kg=%s, ppk_w=%s",
-                 n_pan, largo_mm, ancho_mm, peso_kg, ppk_w)
 
-    # Superficie total (m2)
+@calculator(inputs=["numero_paneles", "paneles", "largo_mm", "ancho_mm"], outputs=["superficieConstruidaM2"])
+def calculate_superficie_construida(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Superficie total de paneles (m2)."""
+    n_pan = _numero_paneles(ctx)
+    largo_mm, ancho_mm = _dato_panel(ctx, "largo_mm"), _dato_panel(ctx, "ancho_mm")
     superficieConstruidaM2 = 0.0
     if n_pan > 0 and largo_mm > 0 and ancho_mm > 0:
         superficie_panel_m2 = (largo_mm / 1000.0) * (ancho_mm / 1000.0)
         superficieConstruidaM2 = round(n_pan * superficie_panel_m2, 2)
-    calculated["superficieConstruidaM2"] = superficieConstruidaM2
-    logging.info("Superficie: %s m^2", superficieConstruidaM2)
+    logging.info("Superficie: %s m^2 (n_paneles=%s, largo_mm=%s, ancho_mm=%s)", superficieConstruidaM2, n_pan, largo_mm, ancho_mm)
+    return {"superficieConstruidaM2": superficieConstruidaM2}
 
-    # Peso total = paneles + estructura (2 kg/panel por defecto)
+
+@calculator(inputs=["numero_paneles", "paneles", "peso_kg", "extra_kg_por_panel"], outputs=["pesoEstructuraKg"])
+def calculate_peso_estructura(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Peso total = paneles + estructura (2 kg/panel por defecto)."""
+    n_pan = _numero_paneles(ctx)
+    peso_kg = _dato_panel(ctx, "peso_kg")
     extra_kg = _to_float(ctx.get("extra_kg_por_panel")) or 2.0
-    peso_total_paneles = n_pan * peso_kg
-    peso_total_estructura = n_pan * extra_kg
-    pesoEstructuraKg = round(peso_total_paneles + peso_total_estructura, 2)
-    calculated["pesoEstructuraKg"] = pesoEstructuraKg
+    pesoEstructuraKg = round(n_pan * peso_kg + n_pan * extra_kg, 2)
+    logging.info("Peso: %s kg (n_paneles=%s, peso_panel_kg=%s, extra_kg=%s)", pesoEstructuraKg, n_pan, peso_kg, extra_kg)
+    return {"pesoEstructuraKg": pesoEstructuraKg}
+
 
-    # Densidades
+@calculator(inputs=["superficieConstruidaM2", "pesoEstructuraKg"], outputs=["densidadDeCarga", "densidadDeCargaKNm2"])
+def calculate_densidad_carga(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Densidades de carga (kg/m2 y kN/m2)."""
+    superficie = _to_float(ctx.get("superficieConstruidaM2")) or 0.0
+    peso = _to_float(ctx.get("pesoEstructuraKg")) or 0.0
     densidadDeCarga = 0.0
     densidadDeCargaKNm2 = 0.0
-    if superficieConstruidaM2 > 0:
-        densidadDeCarga = round(pesoEstructuraKg / superficieConstruidaM2, 2)
+    if superficie > 0:
+        densidadDeCarga = round(peso / superficie, 2)
         if densidadDeCarga > 0:
             densidadDeCargaKNm2 = round((densidadDeCarga * 9.807) / 1000.0, 2)
+    logging.info("Carga: densidad=%s kg/m2, densidad_kNm2=%s kN/m2", densidadDeCarga, densidadDeCargaKNm2)
+    return {
+        "densidadDeCarga": densidadDeCarga,
+        "densidadDeCargaKNm2": densidadDeCargaKNm2 if densidadDeCargaKNm2 > 0 else "",
+    }
 
-    calculated["densidadDeCarga"] = densidadDeCarga
-    calculated["densidadDeCargaKNm2"] = densidadDeCargaKNm2 if densidadDeCargaKNm2 > 0 else ""
 
-    logging.info("Carga: pesoEstructuraKg=%s kg, densidad=%s kg/m2, densidad_kNm2=%s kN/m2",
-                 pesoEstructuraKg, densidadDeCarga, densidadDeCargaKNm2)
-    logging.info("--- FIN CÁLCULOS ESTRUCTURALES ---")
-
-    return calculated
+def calculate_structural_data(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Calcula superficieConstruidaM2, pesoEstructuraKg (paneles + estructura) y
+    densidades (kg/m2 y kN/m2) de forma tolerante a None/cadenas.
+    Todo el grupo 'structural' del registro (compatibilidad con llamadas directas).
+    """
+    return calculator_registry.run(ctx, groups=["structural"])
@@ -2,11 +2,13 @@ import datetime
 import logging
 import os, io, zipfile
 import json
-from typing import Dict, Any, List, Type
-from docxtpl import DocxTemplate
+from typing import Dict, Any, List, Optional, Type
 from pydantic import ValidationError, BaseModel
 from importlib import import_module
 from decimal import Decimal
+from app.services.doc_generation.template_cache import template_cache
+from app.services.doc_generation.generation_service import doc_registry, doc_generator_service
+from app.services.doc_generation.generation.calculators.registry import calculator_registry
 
 
 # --- Configuración de rutas ---
@@ -16,19 +18,15 @@ CONFIG_ROOT = os.path.join(BASE_DIR, '..', 'config')
 CALCULATORS_ROOT = os.path.join(BASE_DIR, 'calculators')
 DOCUMENT_SCHEMAS_ROOT = os.path.join(CONFIG_ROOT, 'document_schemas')
 
-# --- Cargar definiciones de documentos ---
+# --- Definiciones de documentos ---
+# Las carga (y recarga si cambian) el registro compartido con generation_service;
+# DOCUMENT_DEFINITIONS queda como foto al importar para quien lo lea directamente.
 DOCUMENT_DEFINITIONS_PATH = os.path.join(CONFIG_ROOT, 'doc_definitions.json')
-try:
-    with open(DOCUMENT_DEFINITIONS_PATH, 'r', encoding='utf-8') as f:
-        DOCUMENT_DEFINITIONS = json.load(f)
-except FileNotFoundError:
-    logging.error(f"Archivo de definiciones de documentos no encontrado: {DOCUMENT_DEFINITIONS_PATH}")
-    DOCUMENT_DEFINITIONS = {}
-except json.JSONDecodeError:
-    logging.error(f"Error al parsear el archivo JSON de definiciones de documentos: {DOCUMENT_DEFINITIONS_PATH}")
-    DOCUMENT_DEFINITIONS = {}
+DOCUMENT_DEFINITIONS = doc_registry.legacy_definitions()
 
 # --- Cargar módulos de cálculo dinámicamente ---
+# Cada módulo registra sus calculadoras (entradas/salidas) en calculator_registry al importarse;
+# CALCULATOR_MODULES queda como índice de grupos disponibles.
 CALCULATOR_MODULES: Dict[str, Any] = {}
 def load_calculators():
     for filename in os.listdir(CALCULATORS_ROOT):
@@ -79,8 +77,23 @@ def load_document_schema(schema_name: str) -> Type[BaseModel]:
         logging.error(f"No se pudo cargar el esquema Pydantic '{schema_name}': {e}")
         raise ValueError(f"Esquema de documento '{schema_name}' no encontrado o inválido.")
 
-def prepare_document_context(raw_context: Dict[str, Any], community_slug: str, document_id: str) -> Dict[str, Any]:
-    community_docs = DOCUMENT_DEFINITIONS.get(community_slug)
+def template_variables(template_full_path: str) -> Optional[frozenset]:
+    """Variables que usa la plantilla (None si no se pueden extraer: entonces se calcula todo)."""
+    try:
+        return template_cache.variables(template_full_path, doc_generator_service.docx_engine.env)
+    except Exception as e:
+        logging.warning(f"No se pudieron extraer las variables de {template_full_path}: {e}")
+        return None
+
+
+def prepare_document_context(raw_context: Dict[str, Any], community_slug: str, document_id: str,
+                             wanted: Optional[frozenset] = None, memo: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Valida el contexto con el esquema del documento y añade los cálculos de sus grupos
+    'required_calcs'. Con 'wanted' solo se calculan esas variables (y sus dependencias);
+    con 'memo' se reutilizan los resultados entre documentos de la misma petición.
+    """
+    community_docs = doc_registry.legacy_definitions().get(community_slug)
     if not community_docs:
         raise ValueError(f"Comunidad '{community_slug}' no tiene documentos definidos.")
     doc_info = community_docs.get(document_id)
@@ -114,17 +127,11 @@ def prepare_document_context(raw_context: Dict[str, Any], community_slug: str, d
         raise ValueError(f"Datos de entrada incompletos o incorrectos para '{document_id}': {e.errors()}")
 
     # 2) Cálculos requeridos
-    calculated_data = {}
+    known_groups = calculator_registry.groups()
     for calc_group_name in required_calcs_groups:
-        calculator_module = CALCULATOR_MODULES.get(calc_group_name)
-        if not calculator_module:
+        if calc_group_name not in known_groups:
             logging.warning(f"Grupo de cálculo '{calc_group_name}' no encontrado para '{document_id}'.")
-            continue
-        for attr_name in dir(calculator_module):
-            if attr_name.startswith('calculate_') and callable(getattr(calculator_module, attr_name)):
-                calc_func = getattr(calculator_module, attr_name)
-                new_calcs = calc_func(ctx_dict)
-                calculated_data.update(new_calcs)
+    calculated_data = calculator_registry.run(ctx_dict, wanted=wanted, groups=required_calcs_groups, memo=memo)
 
     # 3) Mezcla final (cálculos pisan origen si hay colisión)
     ctx_dict.update(calculated_data)
@@ -133,9 +140,9 @@ def prepare_document_context(raw_context: Dict[str, Any], community_slug: str, d
 
 def get_available_docs_for_community(community_slug: str) -> List[Dict[str, str]]:
     """
-    Devuelve los documentos disponibles para una comunidad basándose en DOCUMENT_DEFINITIONS.
+    Devuelve los documentos disponibles para una comunidad basándose en doc_definitions.json.
     """
-    community_docs = DOCUMENT_DEFINITIONS.get(community_slug)
+    community_docs = doc_registry.legacy_definitions().get(community_slug)
     if not community_docs:
         logging.warning(f"No se encontraron definiciones de documentos para la comunidad: {community_slug}")
         return []
@@ -157,7 +164,7 @@ def generate_document_from_template(template_full_path: str, context: Dict[str,
         raise FileNotFoundError(f"La plantilla no fue encontrada en la ruta: {template_full_path}")
 
     file_stream = io.BytesIO()
-    doc = DocxTemplate(template_full_path)
+    doc = template_cache.load(template_full_path)
     
     try:
         doc.render(context)
@@ -180,9 +187,10 @@ def generate_documents_for_project(
     Devuelve un diccionario con el nombre del archivo como clave y los bytes del documento como valor.
     """
     generated_files = {}
+    memo: Dict = {}  # resultados de cálculo compartidos entre los documentos de la petición
     
     # Obtener las definiciones de documentos para la comunidad
-    community_docs_definitions = DOCUMENT_DEFINITIONS.get(community_slug)
+    community_docs_definitions = doc_registry.legacy_definitions().get(community_slug)
     if not community_docs_definitions:
         raise ValueError(f"No hay documentos definidos para la comunidad: {community_slug}")
 
@@ -197,7 +205,8 @@ def generate_documents_for_project(
         
         try:
             # Prepara y valida el contexto con los cálculos
-            final_context = prepare_document_context(project_data, community_slug, doc_id)
+            final_context = prepare_document_context(
+                project_data, community_slug, doc_id, wanted=template_variables(template_full_path), memo=memo)
             
             # Genera el documento
             doc_bytes = generate_document_from_template(template_full_path, final_context)
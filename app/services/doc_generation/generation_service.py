@@ -1,18 +1,25 @@
 # app/services/doc_generation/generation_service.py
 from __future__ import annotations
 
-import io, os, re, json
+import io, os, re, json, time, threading
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from flask import current_app
 
 import yaml
 from jinja2 import Environment, StrictUndefined
-from docxtpl import DocxTemplate, InlineImage  # inline if someday needed
+from docxtpl import InlineImage  # inline if someday needed
 from datetime import datetime
 from decimal import Decimal
-from app.services.doc_generation.generation.calculators.structural_calculations import calculate_structural_data
+from app.services.doc_generation.generation.calculators.registry import calculator_registry
+from app.services.doc_generation.template_cache import template_cache
+from app.services.doc_generation.template_variable_index import template_variable_index
+from app.services.doc_generation.render_cache import render_cache
 
 import logging
 LOGGER = logging.getLogger("docgen")
@@ -27,6 +34,17 @@ import  logging
 
 TEMPLATES_ROOT = Path(os.environ.get("TEMPLATES_ROOT", "app/services/doc_generation/templates")).resolve()
 DOCS_INDEX_FILENAME = os.environ.get("DOCS_INDEX_FILENAME", "documents.yml")
+# Definiciones del generador legado (generation/doc_generator_service.py)
+DOC_DEFINITIONS_PATH = Path(os.environ.get(
+    "DOC_DEFINITIONS_PATH", str(Path(__file__).parent / "config" / "doc_definitions.json"))).resolve()
+# Cada cuántos segundos se revisan los mtime de los índices (0 = sin recarga en caliente)
+DOCGEN_REGISTRY_RELOAD_SECONDS = float(os.environ.get("DOCGEN_REGISTRY_RELOAD_SECONDS", "5"))
+# Backend de render de varios documentos: 'serial' (en el hilo de la petición) o 'process'
+DOCGEN_RENDER_BACKEND = os.environ.get("DOCGEN_RENDER_BACKEND", "serial").lower()
+DOCGEN_RENDER_WORKERS = int(os.environ.get("DOCGEN_RENDER_WORKERS", str(os.cpu_count() or 2)))
+DOCGEN_RENDER_TIMEOUT = float(os.environ.get("DOCGEN_RENDER_TIMEOUT", "120"))
+# Documentos enviados al pool y aún no entregados (acota la memoria en generación masiva)
+DOCGEN_RENDER_MAX_INFLIGHT = int(os.environ.get("DOCGEN_RENDER_MAX_INFLIGHT", str(2 * DOCGEN_RENDER_WORKERS)))
 
 # -------------------------
 # Helpers de logging seguro
@@ -142,6 +160,123 @@ class DocIndex:
             raise ValueError(f"Documento no declarado en {self.index_path.name}: {filename}")
         return self.docs[filename]
 
+
+class DocRegistry:
+    """
+    Índices de documentos de todas las comunidades bajo TEMPLATES_ROOT (documents.yml)
+    y definiciones del generador legado (doc_definitions.json), cargados una sola vez y
+    servidos desde memoria: las rutas de listado no tocan el disco.
+
+    Un hilo en segundo plano revisa los mtime cada DOCGEN_REGISTRY_RELOAD_SECONDS y
+    recarga solo los ficheros que han cambiado. Si un fichero editado no se puede
+    parsear se conserva la versión anterior.
+    """
+
+    def __init__(self, reload_seconds: float = DOCGEN_REGISTRY_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._stamps: Dict[Path, int] = {}
+        self._indexes: Dict[str, DocIndex] = {}
+        self._listings: Dict[str, List[Dict[str, str]]] = {}
+        self._legacy: Dict[str, Any] = {}
+        self._watcher_pid: Optional[int] = None
+        self.reload()
+
+    @staticmethod
+    def _scan() -> Dict[Path, int]:
+        stamps = {}
+        paths = list(TEMPLATES_ROOT.glob(f"*/{DOCS_INDEX_FILENAME}")) if TEMPLATES_ROOT.is_dir() else []
+        paths.append(DOC_DEFINITIONS_PATH)
+        for p in paths:
+            try:
+                stamps[p] = p.stat().st_mtime_ns
+            except OSError:
+                pass
+        return stamps
+
+    def reload(self) -> bool:
+        """Recarga lo que haya cambiado en disco. Devuelve True si hubo cambios."""
+        stamps = self._scan()
+        if stamps == self._stamps:
+            return False
+        with self._lock:
+            indexes, listings, legacy = dict(self._indexes), dict(self._listings), self._legacy
+            # Comunidades cuyo documents.yml ha desaparecido
+            for slug in [s for s in indexes if _safe_join(TEMPLATES_ROOT, s, DOCS_INDEX_FILENAME) not in stamps]:
+                indexes.pop(slug)
+                listings.pop(slug, None)
+            for p, mtime in stamps.items():
+                if self._stamps.get(p) == mtime:
+                    continue
+                try:
+                    if p == DOC_DEFINITIONS_PATH:
+                        with p.open("r", encoding="utf-8") as f:
+                            legacy = json.load(f)
+                    else:
+                        idx = DocIndex(p.parent.name)
+                        indexes[idx.community_slug] = idx
+                        listings[idx.community_slug] = idx.list_available()
+                except Exception as e:
+                    LOGGER.error("DOCGEN registry: no se pudo cargar '%s' (%s); se mantiene la versión anterior", p, e)
+            if DOC_DEFINITIONS_PATH not in stamps:
+                legacy = {}
+            # Sustitución atómica: los lectores ven el estado anterior o el nuevo, nunca uno a medias
+            self._indexes, self._listings, self._legacy = indexes, listings, legacy
+            self._stamps = stamps
+        LOGGER.info("DOCGEN registry: %d comunidades con índice, %d en doc_definitions.json",
+                    len(indexes), len(legacy))
+        return True
+
+    def _ensure_watcher(self):
+        # Por PID: tras un fork (workers de gunicorn) el hilo del padre no existe en el hijo
+        if self.reload_seconds <= 0 or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            threading.Thread(target=self._watch, name="docgen-registry", daemon=True).start()
+            self._watcher_pid = os.getpid()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_seconds)
+            try:
+                self.reload()
+            except Exception as e:
+                LOGGER.warning("DOCGEN registry: fallo al revisar cambios (%s)", e)
+
+    def get_index(self, community_slug: str) -> DocIndex:
+        self._ensure_watcher()
+        idx = self._indexes.get(community_slug)
+        if idx is None:
+            raise FileNotFoundError(f"No hay {DOCS_INDEX_FILENAME} para la comunidad '{community_slug}'")
+        return idx
+
+    def list_available(self, community_slug: str) -> List[Dict[str, str]]:
+        self._ensure_watcher()
+        listing = self._listings.get(community_slug)
+        if listing is None:
+            raise FileNotFoundError(f"No hay {DOCS_INDEX_FILENAME} para la comunidad '{community_slug}'")
+        return [dict(d) for d in listing]
+
+    def get_doc_def(self, community_slug: str, filename: str) -> Optional[DocDef]:
+        self._ensure_watcher()
+        idx = self._indexes.get(community_slug)
+        return idx.docs.get(filename) if idx else None
+
+    def legacy_definitions(self) -> Dict[str, Any]:
+        """Contenido de doc_definitions.json (solo lectura)."""
+        self._ensure_watcher()
+        return self._legacy
+
+    @property
+    def communities(self) -> List[str]:
+        return sorted(self._indexes)
+
+
+# registro global, construido al importar el servicio
+doc_registry = DocRegistry()
+
 # =========================
 # Motor de generación DOCX
 # =========================
@@ -157,7 +292,8 @@ class _DocxEngine:
                         str(tpl_path.relative_to(TEMPLATES_ROOT)) if str(tpl_path).startswith(str(TEMPLATES_ROOT)) else str(tpl_path),
                         str(tpl_path), str(TEMPLATES_ROOT), len(context or {}))
 
-        doc = DocxTemplate(str(tpl_path))
+        # Plantilla parseada y compilada desde la caché (copia aislada por render)
+        doc = template_cache.load(tpl_path, jinja_env=self.env)
         # Si algún valor es Decimal, conviene serializar a str/float
         normalized = {}
         for k, v in context.items():
@@ -170,29 +306,192 @@ class _DocxEngine:
         doc.save(buff)
         return buff.getvalue()
 
+    def precompile(self, tpl_paths) -> List[Dict[str, Any]]:
+        return template_cache.precompile(tpl_paths, self.env)
+
+# ==================================
+# Render en paralelo (pool de procesos)
+# ==================================
+
+def _warm_render_worker():
+    # Initializer de cada proceso: deja parseadas y compiladas todas las plantillas
+    try:
+        doc_generator_service.precompile_templates()
+    except Exception as e:
+        LOGGER.warning("DOCGEN worker: precompilación fallida (%s)", e)
+
+
+def _render_in_worker(template_path: str, context: Dict[str, Any]) -> bytes:
+    # La caché de render la consulta y la rellena el proceso padre
+    return doc_generator_service.generate_document(template_path, context, use_cache=False)
+
+
+def _ping_worker() -> int:
+    return os.getpid()
+
+
+class _ProcessRenderPool:
+    """
+    ProcessPoolExecutor con 'spawn' (el proceso web tiene hilos, fork no es seguro),
+    creado bajo demanda por PID. Cada worker tiene su propia caché de plantillas
+    calentada por el initializer; si un worker muere el pool se recrea.
+    """
+
+    def __init__(self, workers: int = DOCGEN_RENDER_WORKERS):
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_render_worker,
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        """Arranca todos los workers (y su precompilación) antes de la primera petición."""
+        executor = self._get()
+        for f in [executor.submit(_ping_worker) for _ in range(self.workers)]:
+            f.result(timeout=DOCGEN_RENDER_TIMEOUT)
+
+    def iter_render(self, items: Iterable[Tuple[str, Dict[str, Any], Optional[bytes]]]) -> Iterator[Tuple[Optional[bytes], Optional[Exception]]]:
+        """
+        Recibe (template_path, contexto, bytes ya disponibles o None) y entrega (bytes, error)
+        en el mismo orden. Solo se envían al pool los que no traen bytes, con como mucho
+        DOCGEN_RENDER_MAX_INFLIGHT pendientes: la entrada puede ser un generador largo.
+        """
+        executor = self._get()
+        window = max(1, DOCGEN_RENDER_MAX_INFLIGHT)
+        pending: "deque" = deque()
+        broken = False
+
+        def resolve(entry):
+            nonlocal broken
+            ready, future = entry
+            if future is None:
+                return ready, None
+            try:
+                return future.result(timeout=DOCGEN_RENDER_TIMEOUT), None
+            except Exception as e:
+                # Errores por documento: el resto de documentos sigue su curso
+                broken = broken or isinstance(e, (BrokenProcessPool, FutureTimeoutError))
+                return None, e
+
+        try:
+            for path, context, ready in items:
+                future = None if ready is not None else executor.submit(_render_in_worker, path, context)
+                pending.append((ready, future))
+                while len(pending) >= window:
+                    yield resolve(pending.popleft())
+            while pending:
+                yield resolve(pending.popleft())
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()  # consumidor que abandona (p. ej. cliente desconectado en streaming)
+            if broken:
+                # Timeout o worker caído: no reutilizamos un pool en estado dudoso
+                self.reset()
+
+
 # =========================
 # Servicio principal (API)
 # =========================
 
 class DocGeneratorService:
 
-    def __init__(self):
+    def __init__(self, render_backend: str = DOCGEN_RENDER_BACKEND):
         self.docx_engine = _DocxEngine()
+        self.render_backend = render_backend
+        self._render_pool = _ProcessRenderPool() if render_backend == "process" else None
 
     # ---- API visible desde tus rutas (mantén la firma) ----
 
+    def precompile_templates(self, template_paths: Optional[List[Path]] = None) -> List[Dict[str, Any]]:
+        """
+        Compilación anticipada (CLI y arranque): parsea y compila con el Environment del
+        motor las plantillas indicadas o todas las .docx bajo TEMPLATES_ROOT.
+        """
+        if template_paths is None:
+            template_paths = sorted(TEMPLATES_ROOT.rglob("*.docx"))
+        report = self.docx_engine.precompile(template_paths)
+        template_variable_index.index((item["template"] for item in report if item["ok"]), self.docx_engine.env)
+        for item in report:
+            if not item["ok"]:
+                LOGGER.warning("DOCGEN precompile: %s -> %s", item["template"], item["error"])
+        LOGGER.info("DOCGEN precompile: %d/%d plantillas compiladas",
+                    sum(1 for item in report if item["ok"]), len(report))
+        return report
+
     def get_available_docs_for_community(self, community_slug: str) -> List[Dict[str, str]]:
 
-        idx = DocIndex(community_slug)
+        docs = doc_registry.list_available(community_slug)
         if DOCGEN_DEBUG:
-            LOGGER.info("DOCGEN list_available: community='%s' base='%s' index='%s' docs=%d",
-                        community_slug, idx.base_dir, idx.index_path, len(idx.docs))
-        return idx.list_available()
+            LOGGER.info("DOCGEN list_available: community='%s' docs=%d (registro en memoria)",
+                        community_slug, len(docs))
+        return docs
+
+    def template_variables(self, template_path: str) -> frozenset:
+        """Variables que usa la plantilla (relativa a TEMPLATES_ROOT), extraídas al compilarla."""
+        return template_variable_index.variables(self._template_file(template_path), self.docx_engine.env)
 
-    def prepare_document_context(self, contexto_base: Dict[str, Any], community_province: str, selected_template_filename: str) -> Dict[str, Any]:
+    def preflight(self, context: Dict[str, Any], template_paths: List[str]) -> List[Dict[str, Any]]:
+        """
+        Comprueba el contexto contra el índice de variables de cada plantilla, sin renderizar:
+        por documento, las variables que faltan (el render fallaría) y las vacías.
+        """
+        results = []
+        for template_path in template_paths:
+            item: Dict[str, Any] = {"template": template_path}
+            try:
+                item.update(template_variable_index.check(context, self._template_file(template_path), self.docx_engine.env))
+            except FileNotFoundError:
+                item.update(ok=False, error="Plantilla no encontrada")
+            except Exception as e:
+                # p. ej. TemplateSyntaxError: la plantilla no se puede generar con ningún contexto
+                item.update(ok=False, error=f"{type(e).__name__}: {e}")
+            results.append(item)
+        return results
+
+    def _wanted_variables(self, template_paths: Optional[List[str]], docdef: Optional[DocDef]) -> Optional[set]:
+        """Unión de las variables de las plantillas de la petición; None = no se sabe (se calcula todo)."""
+        if template_paths is None:
+            return None
+        wanted = set()
+        for template_path in template_paths:
+            try:
+                wanted |= self.template_variables(template_path)
+            except FileNotFoundError:
+                continue  # se informa al generar
+            except Exception as e:
+                LOGGER.warning("DOCGEN variables de %s no disponibles (%s): se calcula todo", template_path, e)
+                return None
+        if docdef:
+            wanted.update(docdef.requires)
+            for rule in (docdef.computed or {}).values():
+                if rule.startswith("formula:"):
+                    wanted.update(s.strip() for s in rule.removeprefix("formula:").split("/"))
+        return wanted
+
+    def prepare_document_context(self, contexto_base: Dict[str, Any], community_province: str, selected_template_filename: str,
+                                 template_paths: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Lee el índice YAML de la comunidad, encuentra el doc de filename 'selected_template_filename',
         valida 'requires', calcula 'computed' y devuelve un contexto listo para render.
+        Con 'template_paths' (todas las plantillas de la petición) solo se ejecutan los cálculos
+        cuyas salidas usa alguna de ellas; el contexto resultante vale para todas.
         """
         # El YAML se busca con la comunidad que llega en la API (community_slug en la ruta),
         # no con la provincia en minúsculas. La provincia la conservamos por si quieres reglas regionales.
@@ -207,12 +506,9 @@ class DocGeneratorService:
             LOGGER.info("DOCGEN prepare: default_slug='%s' province='%s' selected_tpl='%s' TEMPLATES_ROOT='%s'",
                         default_slug, community_province, selected_template_filename, str(TEMPLATES_ROOT))
             _log_context("contexto_base (in)", contexto_base)
-        try:
-            idx = DocIndex(default_slug)
-            # Si existe el doc pedido en ese índice, úsalo. Si no, igualmente validaremos después al generar.
-            docdef = idx.docs.get(selected_template_filename, None)
-        except Exception:
-            docdef = None
+        # Si existe el doc pedido en ese índice, úsalo. Si no, igualmente validaremos después al generar.
+        docdef = doc_registry.get_doc_def(default_slug, selected_template_filename)
+        wanted = self._wanted_variables(template_paths, docdef)
 
         # Base
         ctx = dict(contexto_base or {})
@@ -228,9 +524,8 @@ class DocGeneratorService:
                 }
                 ctx['paneles'] = [synthetic_panel]
 
-            # Calcula
-
-            struct_calc = calculate_structural_data(ctx)  # {'superficieConstruidaM2', 'densidadDeCarga', 'densidadDeCargaKNm2'}
+            # Calcula solo lo que usan las plantillas (superficie, peso, densidades y sus dependencias)
+            struct_calc = calculator_registry.run(ctx, wanted=wanted, groups=["structural"])
 
             # Fusión con prioridad controlada por env var
             def _should_overwrite(k, v):
@@ -328,10 +623,7 @@ class DocGeneratorService:
         _log_context("contexto_final (out)", ctx)
         return ctx
 
-    def generate_document(self, template_path: str, context: Dict[str, Any]) -> bytes:
-        """
-        Renderiza una plantilla DOCX con docxtpl y devuelve bytes del archivo resultante.
-        """
+    def _template_file(self, template_path: str) -> Path:
         # Validación de ruta segura (dentro de TEMPLATES_ROOT)
         p = _safe_join(TEMPLATES_ROOT, template_path)
         if not p.exists() or not p.is_file():
@@ -340,18 +632,89 @@ class DocGeneratorService:
         # Solo admitimos .docx en este servicio inicial
         if p.suffix.lower() != ".docx":
             raise ValueError("Tipo de plantilla no soportado (sólo .docx)")
+        return p
+
+    def _cached_render(self, template_path: str, context: Dict[str, Any]) -> Tuple[Optional[str], Optional[bytes]]:
+        """(clave, bytes) de la caché de render; (None, None) si la ruta no es válida o el contexto no es cacheable."""
+        try:
+            key = render_cache.key_for(self._template_file(template_path), context)
+        except (OSError, ValueError):
+            return None, None  # generate_document dará el error con su mensaje habitual
+        return key, (render_cache.get(key) if key else None)
+
+    def generate_document(self, template_path: str, context: Dict[str, Any], use_cache: bool = True) -> bytes:
+        """
+        Renderiza una plantilla DOCX con docxtpl y devuelve bytes del archivo resultante.
+        Si el mismo contexto ya se renderizó con esa versión de la plantilla, devuelve el
+        documento guardado en la caché de render sin volver a renderizar.
+        """
+        p = self._template_file(template_path)
+        key, cached = self._cached_render(template_path, context) if use_cache else (None, None)
+        if cached is not None:
+            return cached
 
         try:
             if DOCGEN_DEBUG:
                 LOGGER.info("DOCGEN generate_document: rel='%s' abs='%s' size_ctx=%d",
                             template_path, str(p), len(context or {}))
-            return self.docx_engine.render(p, context)
+            data = self.docx_engine.render(p, context)
         except Exception as e:
             # Mejoramos el mensaje si era por variable ausente
             msg = str(e)
             if "is undefined" in msg or "UndefinedError" in msg:
                 raise ValueError(f"Faltan variables en el contexto para la plantilla: {msg}")
             raise
+        if key:
+            render_cache.put(key, data)
+        return data
+
+    def iter_render_jobs(self, jobs: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Tuple[str, Optional[bytes], Optional[Exception]]]:
+        """
+        Renderiza pares (template_path, contexto) y entrega (template_path, bytes, error) en el
+        orden recibido según se completa cada uno; un documento que falla no interrumpe a los
+        demás. Con DOCGEN_RENDER_BACKEND=process los renders van a los workers del pool.
+        """
+        if self._render_pool is None:
+            for path, context in jobs:
+                try:
+                    yield path, self.generate_document(path, context), None
+                except Exception as e:
+                    yield path, None, e
+            return
+
+        # Los aciertos de la caché de render no pasan por el pool
+        lookups: "deque" = deque()
+
+        def items():
+            for path, context in jobs:
+                key, cached = self._cached_render(path, context)
+                lookups.append((path, key, cached))
+                yield path, context, cached
+
+        for data, error in self._render_pool.iter_render(items()):
+            path, key, cached = lookups.popleft()
+            if cached is None and key and data is not None:
+                render_cache.put(key, data)
+            yield path, data, error
+
+    def iter_generate_documents(self, template_paths: List[str], context: Dict[str, Any]) -> Iterator[Tuple[str, Optional[bytes], Optional[Exception]]]:
+        """Varias plantillas con el mismo contexto (ver iter_render_jobs)."""
+        if len(template_paths) == 1 and self._render_pool is not None:
+            # Un único documento: sin ida y vuelta al pool
+            try:
+                yield template_paths[0], self.generate_document(template_paths[0], context), None
+            except Exception as e:
+                yield template_paths[0], None, e
+            return
+        yield from self.iter_render_jobs((path, context) for path in template_paths)
+
+    def generate_documents(self, template_paths: List[str], context: Dict[str, Any]) -> List[Tuple[str, Optional[bytes], Optional[Exception]]]:
+        return list(self.iter_generate_documents(template_paths, context))
+
+    def warm_up_render_pool(self):
+        # Nunca desde un worker: con 'spawn' el hijo reimporta el módulo principal (p. ej. run.py)
+        if self._render_pool is not None and multiprocessing.parent_process() is None:
+            self._render_pool.warm_up()
 
 # instancia global esperada por tus rutas
 doc_generator_service = DocGeneratorService()
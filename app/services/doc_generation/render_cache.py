@@ -0,0 +1,205 @@
+# app/services/doc_generation/render_cache.py
+"""
+Caché en disco de documentos ya renderizados, direccionada por contenido.
+
+Clave = sha256(hash del fichero de plantilla, versión del motor, contexto final canónico).
+Si la plantilla, las librerías de render o cualquier dato del contexto cambian, la clave
+cambia: no hay invalidación explícita, las entradas viejas salen por LRU de tamaño.
+Varios procesos pueden compartir el directorio (escritura atómica con os.replace).
+"""
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import docx
+import docxtpl
+import jinja2
+
+DOCGEN_RENDER_CACHE_ENABLED = os.getenv("DOCGEN_RENDER_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+DOCGEN_RENDER_CACHE_DIR = os.getenv("DOCGEN_RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "docgen-render-cache"))
+DOCGEN_RENDER_CACHE_MAX_BYTES = int(os.getenv("DOCGEN_RENDER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Al desalojar se baja hasta esta fracción del máximo para no desalojar en cada escritura
+_EVICT_TARGET = 0.9
+
+# Súbela si cambia cómo se prepara o se renderiza un documento (Decimal->float, compilación, etc.)
+RENDER_PIPELINE_VERSION = "1"
+ENGINE_VERSION = "|".join((
+    RENDER_PIPELINE_VERSION,
+    f"docxtpl={docxtpl.__version__}",
+    f"jinja2={jinja2.__version__}",
+    f"python-docx={getattr(docx, '__version__', '?')}",
+))
+
+
+class _Uncacheable(Exception):
+    """Contexto con objetos que no se pueden canonicalizar (p. ej. InlineImage)."""
+
+
+def _canonical(value: Any):
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if isinstance(value, (datetime, date, dt_time)):
+        return {"__dt__": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__bytes__": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    raise _Uncacheable(type(value).__name__)
+
+
+def canonical_context(context: Dict[str, Any]) -> str:
+    """JSON determinista del contexto: claves ordenadas y tipos no JSON con etiqueta de tipo."""
+    return json.dumps(context, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=_canonical)
+
+
+class RenderCache:
+    def __init__(self, directory: str = DOCGEN_RENDER_CACHE_DIR, max_bytes: int = DOCGEN_RENDER_CACHE_MAX_BYTES,
+                 enabled: bool = DOCGEN_RENDER_CACHE_ENABLED):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.enabled = enabled and max_bytes > 0
+        self._lock = threading.Lock()
+        self._template_hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._approx_bytes: Optional[int] = None  # estimación local; la verdad es el directorio
+        self.hits = self.misses = self.bypassed = self.stores = self.evictions = 0
+        self.bytes_served = 0
+
+    # ---- Claves ----
+
+    def template_hash(self, path: Path) -> str:
+        """sha256 del fichero de plantilla, recalculado solo si cambian mtime o tamaño."""
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._template_hashes.get(str(path))
+        if cached and cached[0] == stamp:
+            return cached[1]
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        self._template_hashes[str(path)] = (stamp, digest)
+        return digest
+
+    def key_for(self, template_path: Path, context: Dict[str, Any]) -> Optional[str]:
+        """Clave de la caché, o None si el contexto no es canonicalizable (se renderiza sin caché)."""
+        if not self.enabled:
+            return None
+        try:
+            ctx = canonical_context(context)
+        except (_Uncacheable, TypeError, ValueError):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        h = hashlib.sha256()
+        for part in (self.template_hash(template_path), ENGINE_VERSION, ctx):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.docx"
+
+    # ---- Lectura / escritura ----
+
+    def get(self, key: str) -> Optional[bytes]:
+        p = self._path(key)
+        try:
+            data = p.read_bytes()
+            os.utime(p)  # LRU: el mtime marca el último uso
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.bytes_served += len(data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        p = self._path(key)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        except OSError:
+            # La caché es opcional: un disco lleno o sin permisos no debe romper la generación
+            return
+        with self._lock:
+            self.stores += 1
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_bytes()
+            else:
+                self._approx_bytes += len(data)
+            over = self._approx_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        for p in self.directory.glob("*/*.docx"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            yield st.st_mtime, st.st_size, p
+
+    def _scan_bytes(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Borra las entradas usadas hace más tiempo hasta quedar por debajo del objetivo."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * _EVICT_TARGET
+        evicted = 0
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+                evicted += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._approx_bytes = total
+            self.evictions += evicted
+
+    def clear(self):
+        for _, _, p in list(self._entries()):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+        with self._lock:
+            self._approx_bytes = 0
+            self.hits = self.misses = self.bypassed = self.stores = self.evictions = 0
+            self.bytes_served = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "directory": str(self.directory),
+                "engine_version": ENGINE_VERSION,
+                "size_bytes": self._approx_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "bytes_served": self.bytes_served,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# instancia global (por proceso; el directorio puede ser compartido)
+render_cache = RenderCache()
@@ -0,0 +1,133 @@
+# app/services/doc_generation/template_cache.py
+from __future__ import annotations
+
+import os
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+
+from docx import Document
+from docxtpl import DocxTemplate
+
+from app.services.doc_generation.template_compiler import CompiledDocxTemplate, compile_document
+
+# Desactivable con DOCGEN_TEMPLATE_CACHE_ENABLED=0 (p. ej. al editar plantillas en caliente)
+DOCGEN_TEMPLATE_CACHE_ENABLED = os.getenv("DOCGEN_TEMPLATE_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+DOCGEN_TEMPLATE_CACHE_MAX_ITEMS = int(os.getenv("DOCGEN_TEMPLATE_CACHE_MAX_ITEMS", "64"))
+
+
+def _stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class TemplateCache:
+    """
+    LRU acotada de plantillas DOCX ya parseadas (python-docx Document), por ruta absoluta.
+    Cada entrada guarda (mtime_ns, tamaño): si el fichero cambia en disco se vuelve a parsear.
+    El Document cacheado nunca se renderiza; cada render recibe una copia profunda
+    (árboles lxml y partes del paquete), bastante más barata que descomprimir y parsear.
+    Junto al documento se guardan sus partes compiladas por cada Environment de Jinja
+    (template_compiler), de modo que se invalidan y se desalojan a la vez.
+    """
+
+    def __init__(self, max_items: int = DOCGEN_TEMPLATE_CACHE_MAX_ITEMS, enabled: bool = DOCGEN_TEMPLATE_CACHE_ENABLED):
+        self.max_items = max_items
+        self.enabled = enabled and max_items > 0
+        # ruta -> (stamp, Document, {Environment: CompiledParts})
+        self._data: "OrderedDict[str, Tuple[Tuple[int, int], Any, Dict[Any, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _entry(self, path: str):
+        stamp = _stamp(path)
+        with self._lock:
+            entry = self._data.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._data.move_to_end(path)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self.reloads += 1
+            self.misses += 1
+        # El parseo va fuera del lock: dos hilos pueden parsear a la vez la misma plantilla, no pasa nada
+        entry = (stamp, Document(path), {})
+        with self._lock:
+            self._data[path] = entry
+            self._data.move_to_end(path)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+        return entry
+
+    def _compiled(self, entry, path: str, jinja_env):
+        compiled = entry[2].get(jinja_env)
+        if compiled is None:
+            # Los errores de sintaxis no se cachean: se relanzan en cada intento, como sin caché
+            compiled = compile_document(path, entry[1], jinja_env)
+            with self._lock:
+                entry[2][jinja_env] = compiled
+        return compiled
+
+    def load(self, template_path, jinja_env=None) -> DocxTemplate:
+        """
+        DocxTemplate listo para render(), con su propia copia del documento parseado.
+        Con 'jinja_env' devuelve un CompiledDocxTemplate que reutiliza las partes compiladas
+        con ese Environment (hay que renderizarlo con el mismo).
+        """
+        path = os.path.abspath(str(template_path))
+        if not self.enabled:
+            return DocxTemplate(path)
+        entry = self._entry(path)
+        if jinja_env is not None:
+            compiled = self._compiled(entry, path, jinja_env)
+            return CompiledDocxTemplate(path, copy.deepcopy(entry[1]), compiled)
+        tpl = DocxTemplate(path)
+        # render_init() solo carga el fichero si tpl.docx está vacío
+        tpl.docx = copy.deepcopy(entry[1])
+        return tpl
+
+    def variables(self, template_path, jinja_env) -> FrozenSet[str]:
+        """Variables que referencia la plantilla (se extraen al compilarla; sin render)."""
+        path = os.path.abspath(str(template_path))
+        if not self.enabled:
+            return compile_document(path, Document(path), jinja_env).variables
+        return self._compiled(self._entry(path), path, jinja_env).variables
+
+    def precompile(self, template_paths: Iterable, jinja_env) -> List[Dict[str, Any]]:
+        """Parsea y compila por adelantado; devuelve un informe por plantilla (no lanza)."""
+        report = []
+        for template_path in template_paths:
+            path = os.path.abspath(str(template_path))
+            item: Dict[str, Any] = {"template": path, "ok": True, "error": None, "compile_ms": 0.0}
+            try:
+                item["compile_ms"] = round(self._compiled(self._entry(path), path, jinja_env).compile_ms, 1)
+            except Exception as e:
+                item.update(ok=False, error=f"{type(e).__name__}: {e}")
+            report.append(item)
+        return report
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.reloads = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._data),
+                "compiled": sum(len(entry[2]) for entry in self._data.values()),
+                "max_items": self.max_items,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# instancia global compartida por el motor DOCX y el generador legado
+template_cache = TemplateCache()
@@ -0,0 +1,157 @@
+# app/services/doc_generation/template_compiler.py
+"""
+Compilación anticipada de plantillas DOCX.
+
+docxtpl, en cada render(), vuelve a serializar el XML de cada parte (cuerpo,
+cabeceras, pies, notas al pie), le aplica patch_xml() y compila el resultado con
+Jinja. Para una misma versión de la plantilla todo eso da siempre lo mismo, así que
+se hace una vez (compile_document) y en cada petición solo se ejecutan las plantillas
+Jinja ya compiladas (CompiledDocxTemplate).
+
+Uso como CLI (compila todas las plantillas y muestra errores de sintaxis y tiempos):
+    python -m app.services.doc_generation.template_compiler [plantilla.docx ...]
+"""
+from __future__ import annotations
+
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from docxtpl import DocxTemplate
+from jinja2 import Environment, Template, TemplateError, meta
+
+_FOOTNOTES_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"
+# Propiedades del documento que docxtpl renderiza (DocxTemplate.render_properties)
+_CORE_PROPERTIES = ("author", "comments", "identifier", "language", "subject", "title")
+
+# (xml fuente ya parcheado, plantilla compilada); la fuente se guarda para los mensajes de error
+CompiledPart = Tuple[str, Template]
+
+
+@dataclass
+class CompiledParts:
+    body: CompiledPart
+    headers: Dict[str, Tuple[str, CompiledPart]] = field(default_factory=dict)   # rId -> (encoding, parte)
+    footers: Dict[str, Tuple[str, CompiledPart]] = field(default_factory=dict)
+    footnotes: Dict[str, CompiledPart] = field(default_factory=dict)             # partname -> parte
+    properties: Dict[str, Template] = field(default_factory=dict)
+    variables: FrozenSet[str] = frozenset()   # variables de nivel superior que usa la plantilla
+    compile_ms: float = 0.0
+
+
+def _compile_xml(tpl: DocxTemplate, xml: str, jinja_env: Environment) -> CompiledPart:
+    # Mismo preprocesado que DocxTemplate.build_xml + render_xml_part, sin renderizar
+    src = re.sub(r"<w:p([ >])", r"\n<w:p\1", tpl.patch_xml(xml))
+    return src, jinja_env.from_string(src)
+
+
+def compile_document(template_path: str, parsed, jinja_env: Environment) -> CompiledParts:
+    """
+    Compila todas las partes de un Document de python-docx sin modificarlo.
+    'parsed' debe ser el documento original (nunca renderizado) de la caché de plantillas.
+    """
+    t0 = time.perf_counter()
+    tpl = DocxTemplate(template_path)
+    tpl.docx = parsed  # solo lectura: get_xml / get_part_xml / rels
+    compiled = CompiledParts(body=_compile_xml(tpl, tpl.get_xml(), jinja_env))
+    sources = [compiled.body[0]]
+    for uri, target in ((tpl.HEADER_URI, compiled.headers), (tpl.FOOTER_URI, compiled.footers)):
+        for rel_key, part in tpl.get_headers_footers(uri):
+            xml = tpl.get_part_xml(part)
+            target[rel_key] = (tpl.get_headers_footers_encoding(xml), _compile_xml(tpl, xml, jinja_env))
+            sources.append(target[rel_key][1][0])
+    for part in parsed.part.package.parts:
+        if part.content_type == _FOOTNOTES_CONTENT_TYPE:
+            blob = part.blob.decode("utf-8") if isinstance(part.blob, bytes) else part.blob
+            compiled.footnotes[str(part.partname)] = _compile_xml(tpl, blob, jinja_env)
+            sources.append(compiled.footnotes[str(part.partname)][0])
+    for prop in _CORE_PROPERTIES:
+        compiled.properties[prop] = jinja_env.from_string(getattr(parsed.core_properties, prop))
+        sources.append(getattr(parsed.core_properties, prop))
+    # Mismo análisis que DocxTemplate.get_undeclared_template_variables, sobre todas las partes
+    compiled.variables = frozenset().union(*(meta.find_undeclared_variables(jinja_env.parse(src)) for src in sources))
+    compiled.compile_ms = (time.perf_counter() - t0) * 1000.0
+    return compiled
+
+
+class CompiledDocxTemplate(DocxTemplate):
+    """
+    DocxTemplate que renderiza con las partes precompiladas: el flujo de render() de
+    docxtpl no cambia (fix_tables, ids, cabeceras, pies, propiedades, notas), solo se
+    sustituye la obtención del XML y la compilación Jinja de cada parte.
+    Las partes sin entrada precompilada siguen el camino normal de docxtpl.
+    """
+
+    def __init__(self, template_file, docx, compiled: CompiledParts):
+        super().__init__(template_file)
+        self.docx = docx
+        self.compiled = compiled
+
+    def _render_compiled(self, compiled_part: CompiledPart, part, context: Dict[str, Any]) -> str:
+        src, template = compiled_part
+        self.current_rendering_part = part
+        try:
+            dst_xml = template.render(context)
+        except TemplateError as exc:
+            # Mismo contexto de error que DocxTemplate.render_xml_part
+            if getattr(exc, "lineno", None) is not None:
+                line_number = max(exc.lineno - 4, 0)
+                exc.docx_context = map(lambda x: re.sub(r"<[^>]+>", "", x),
+                                       src.splitlines()[line_number:line_number + 7])
+            raise
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = dst_xml.replace("{_{", "{{").replace("}_}", "}}").replace("{_%", "{%").replace("%_}", "%}")
+        return self.resolve_listing(dst_xml)
+
+    def build_xml(self, context, jinja_env=None):
+        return self._render_compiled(self.compiled.body, self.docx._part, context)
+
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        compiled = self.compiled.headers if uri == self.HEADER_URI else self.compiled.footers
+        for rel_key, part in self.get_headers_footers(uri):
+            entry = compiled.get(rel_key)
+            if entry is None:
+                xml = self.get_part_xml(part)
+                encoding = self.get_headers_footers_encoding(xml)
+                yield rel_key, self.render_xml_part(self.patch_xml(xml), part, context, jinja_env).encode(encoding)
+            else:
+                encoding, compiled_part = entry
+                yield rel_key, self._render_compiled(compiled_part, part, context).encode(encoding)
+
+    def render_footnotes(self, context, jinja_env=None):
+        # Mismo recorrido que docxtpl (por sección y por parte del paquete)
+        for section in self.docx.sections:
+            for part in section.part.package.parts:
+                if part.content_type != _FOOTNOTES_CONTENT_TYPE:
+                    continue
+                entry = self.compiled.footnotes.get(str(part.partname))
+                if entry is None:
+                    blob = part.blob.decode("utf-8") if isinstance(part.blob, bytes) else part.blob
+                    xml = self.render_xml_part(self.patch_xml(blob), part, context, jinja_env)
+                else:
+                    xml = self._render_compiled(entry, part, context)
+                part._blob = xml.encode("utf-8")
+
+    def render_properties(self, context, jinja_env=None):
+        for prop, template in self.compiled.properties.items():
+            setattr(self.docx.core_properties, prop, template.render(context))
+
+
+def main(argv: Optional[list] = None) -> int:
+    from pathlib import Path
+    from app.services.doc_generation.generation_service import TEMPLATES_ROOT, doc_generator_service
+
+    paths = [Path(p).resolve() for p in (argv if argv is not None else sys.argv[1:])] or None
+    report = doc_generator_service.precompile_templates(paths)
+    for item in report:
+        status = f"{item['compile_ms']:8.1f} ms" if item["ok"] else f"ERROR: {item['error']}"
+        print(f"{item['template']}: {status}")
+    failed = sum(1 for item in report if not item["ok"])
+    print(f"{len(report) - failed}/{len(report)} plantillas compiladas (TEMPLATES_ROOT={TEMPLATES_ROOT})")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
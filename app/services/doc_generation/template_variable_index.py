@@ -0,0 +1,87 @@
+# app/services/doc_generation/template_variable_index.py
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, Tuple
+
+from app.services.doc_generation.template_cache import _stamp, template_cache
+
+
+class TemplateVariableIndex:
+    """
+    Variables de nivel superior que referencia cada plantilla, por ruta absoluta.
+    Se extraen al compilar la plantilla (template_compiler) y aquí solo se guarda el
+    conjunto, validado con (mtime_ns, tamaño): no depende de que la plantilla siga en
+    la LRU de template_cache. Con el índice, comprobar un contexto contra una plantilla
+    es una diferencia de conjuntos, sin parsear ni renderizar nada.
+    """
+
+    def __init__(self):
+        # ruta -> (stamp, variables o el error de compilación, que también se recuerda hasta que cambie el fichero)
+        self._data: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def variables(self, template_path, jinja_env) -> FrozenSet[str]:
+        """Variables de la plantilla; FileNotFoundError / TemplateSyntaxError como al renderizar."""
+        path = os.path.abspath(str(template_path))
+        stamp = _stamp(path)
+        with self._lock:
+            entry = self._data.get(path)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                if isinstance(entry[1], Exception):
+                    raise entry[1].with_traceback(None)
+                return entry[1]
+            self.misses += 1
+        try:
+            variables = template_cache.variables(path, jinja_env)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            with self._lock:
+                self._data[path] = (stamp, e)
+            raise
+        with self._lock:
+            self._data[path] = (stamp, variables)
+        return variables
+
+    def index(self, template_paths: Iterable, jinja_env) -> None:
+        """Rellena el índice (tras precompilar); las plantillas con errores se omiten."""
+        for template_path in template_paths:
+            try:
+                self.variables(template_path, jinja_env)
+            except Exception:
+                pass
+
+    def check(self, context: Dict[str, Any], template_path, jinja_env) -> Dict[str, Any]:
+        """
+        'missing': variables que la plantilla usa y no están en el contexto (con StrictUndefined
+        harían fallar el render). 'empty': presentes pero None o "" (saldrían en blanco o "None").
+        """
+        ignored = set(jinja_env.globals)
+        used = self.variables(template_path, jinja_env) - ignored
+        missing = sorted(k for k in used if k not in context)
+        empty = sorted(k for k in used if k in context and (context[k] is None or context[k] == ""))
+        return {"ok": not missing, "missing": missing, "empty": empty, "variables": len(used)}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "templates": len(self._data),
+                "errors": sum(1 for _, v in self._data.values() if isinstance(v, Exception)),
+                "variables": sum(len(v) for _, v in self._data.values() if not isinstance(v, Exception)),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# instancia global: la rellena la precompilación y la consultan el preflight y el cálculo perezoso del contexto
+template_variable_index = TemplateVariableIndex()
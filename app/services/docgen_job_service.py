@@ -0,0 +1,304 @@
+# app/services/docgen_job_service.py
+
+import os
+import json
+import time
+import logging
+import zipfile
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app import database
+from app.models import instalacion_model, docgen_job_model
+from app.services.catalog_index_service import catalog_index
+from app.services.doc_generation.generation_service import doc_generator_service
+
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Hilos que procesan la cola por proceso (0 = este proceso no consume trabajos)
+DOCGEN_JOB_WORKERS = int(os.getenv("DOCGEN_JOB_WORKERS", "2"))
+# Espera máxima entre sondeos de la cola cuando no hay aviso local
+DOCGEN_JOB_POLL_S = float(os.getenv("DOCGEN_JOB_POLL_S", "2"))
+# Un trabajo 'running' sin latido (progreso) durante este tiempo se considera abandonado (worker caído)
+DOCGEN_JOB_STALE_S = float(os.getenv("DOCGEN_JOB_STALE_S", "600"))
+DOCGEN_JOB_MAX_ATTEMPTS = int(os.getenv("DOCGEN_JOB_MAX_ATTEMPTS", "3"))
+# Tiempo que se conservan los resultados antes de borrarlos
+DOCGEN_JOB_RETENTION_S = float(os.getenv("DOCGEN_JOB_RETENTION_S", str(24 * 3600)))
+_EXPIRE_EVERY_S = 300
+
+
+# =====================================
+# Generación de la documentación (dossier)
+# =====================================
+
+def load_dossier_context(conn, instalacion_id: int, user_id) -> Dict[str, Any]:
+    """Única parte que usa la BD: instalación completa enriquecida con el índice de catálogos."""
+    instalacion_completa = instalacion_model.get_instalacion_completa(conn, instalacion_id, user_id)
+    if not instalacion_completa:
+        raise LookupError("Instalación no encontrada o no pertenece a este usuario")
+    contexto_base = dict(instalacion_completa)
+    # Enriquecer contexto con datos de catálogo desde el índice en memoria
+    # (panel, inversor, batería y tipo de estructura) sin consultas por ítem.
+    catalog_index.enrich_context(conn, contexto_base)
+
+    # DEBUG opcional (DOCGEN_DEBUG=1): ver el contexto que sale de BD + catálogo
+    if os.getenv("DOCGEN_DEBUG", "").lower() in ("1", "true", "yes", "on"):
+        try:
+            logging.info("DOCGEN endpoint: TEMPLATES_ROOT=%s", os.getenv("TEMPLATES_ROOT"))
+            logging.info("DOCGEN contexto_base (endpoint)\n%s",
+                         json.dumps(contexto_base, ensure_ascii=False, sort_keys=True, indent=2, default=str))
+        except Exception as e:
+            logging.info("DOCGEN contexto_base (endpoint) keys=%d err=%s", len(contexto_base or {}), e)
+    return contexto_base
+
+
+def prepare_dossier_context(contexto_base: Dict[str, Any], documentos: List[str],
+                            community_slug: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Contexto final común a todos los documentos (validación de requeridos y calculados).
+    Con 'community_slug' solo se calculan las variables que usan las plantillas seleccionadas.
+    """
+    logging.info(
+        ".............--------------........... contexto_base.emplazamiento_provincia: %s ------ selected_doc_files: %s",
+        contexto_base.get('emplazamiento_provincia'), documentos,
+    )
+    template_paths = [os.path.join(community_slug, name) for name in documentos] if community_slug else None
+    return doc_generator_service.prepare_document_context(
+        contexto_base, str(contexto_base.get('emplazamiento_provincia')).lower(), documentos[0],
+        template_paths=template_paths)
+
+
+def dossier_file_name(instalacion_id: int, template_file_name: str) -> str:
+    base_name = os.path.splitext(template_file_name)[0].replace("_", " ").title()
+    return f"{base_name} - Inst {instalacion_id}.docx"
+
+
+def iter_dossier_files(instalacion_id: int, contexto_final: Dict[str, Any], community_slug: str,
+                       documentos: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Renderiza los documentos seleccionados (sin BD ni contexto de Flask) y los entrega
+    según se generan. Las plantillas que no existen o fallan se registran y se omiten.
+    """
+    # Render de todas las plantillas (en serie o en el pool de procesos, según DOCGEN_RENDER_BACKEND)
+    template_paths = [os.path.join(community_slug, name) for name in documentos]
+    results = doc_generator_service.iter_generate_documents(template_paths, contexto_final)
+    generated = 0
+    for template_file_name, (template_path, file_bytes, error) in zip(documentos, results):
+        if isinstance(error, FileNotFoundError):
+            logging.warning(f"Plantilla no encontrada, se omite: {template_path}")
+            continue
+        if error is not None:
+            logging.error(f"Error procesando plantilla {template_file_name}: {error}", exc_info=error)
+            continue
+        generated += 1
+        yield {
+            "name": dossier_file_name(instalacion_id, template_file_name),
+            "bytes": file_bytes,
+            "mimetype": DOCX_MIMETYPE,
+        }
+    logging.info(f"Generados {generated} documentos.")
+
+
+def render_dossier(instalacion_id: int, contexto_base: Dict[str, Any], community_slug: str,
+                   documentos: List[str]) -> List[Dict[str, Any]]:
+    """Prepara el contexto y devuelve todos los documentos generados en una lista."""
+    contexto_final = prepare_dossier_context(contexto_base, documentos, community_slug)
+    return list(iter_dossier_files(instalacion_id, contexto_final, community_slug, documentos))
+
+
+def dossier_zip_filename(instalacion_id: int, first_name: str, count: int) -> str:
+    if count == 1:
+        # Usamos el nombre del propio documento como nombre del zip (sin la extensión .docx).
+        return f"{os.path.splitext(first_name)[0]}.zip"
+    return f"Documentacion Inst {instalacion_id}.zip"
+
+
+class _ChunkSink:
+    """Destino no buscable para ZipFile: acumula lo escrito hasta que se recoge."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> List[bytes]:
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def iter_zip_stored(files: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    ZIP en streaming: cada miembro se emite en cuanto llega, sin comprimir (ZIP_STORED; un
+    .docx ya es un zip deflactado) y con descriptor de datos, así que no hace falta volver
+    atrás en la salida. En memoria solo está el documento en curso.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for file_info in files:
+            zf.writestr(file_info["name"], file_info["bytes"])
+            yield from sink.take()
+    # Directorio central
+    yield from sink.take()
+
+
+def build_zip(files: List[Dict[str, Any]]) -> bytes:
+    return b"".join(iter_zip_stored(files))
+
+
+# =========================
+# Cola de trabajos (Postgres)
+# =========================
+
+def _run_generate_docs(conn, job: Dict[str, Any], progress: Callable[[int, int], None]) -> Tuple[str, bytes]:
+    payload = job["payload"] or {}
+    documentos = payload.get("documentos") or []
+    contexto_base = load_dossier_context(conn, job["instalacion_id"], job["app_user_id"])
+    # Cerramos la transacción de lectura antes del render (idle_in_transaction_session_timeout)
+    conn.commit()
+    progress(0, len(documentos))
+    files = render_dossier(job["instalacion_id"], contexto_base, payload.get("community_slug"), documentos)
+    if not files:
+        raise RuntimeError("No se pudieron generar los documentos. Las plantillas podrían no existir para la comunidad seleccionada.")
+    progress(len(files), len(documentos))
+    return dossier_zip_filename(job["instalacion_id"], files[0]["name"], len(files)), build_zip(files)
+
+
+# tipo de trabajo -> función(conn, job, progress) que devuelve (nombre del fichero, bytes o fichero binario)
+JOB_HANDLERS: Dict[str, Callable] = {
+    "generate_docs": _run_generate_docs,
+}
+
+
+class DocgenJobQueue:
+    """
+    Cola de generación de documentos sobre la tabla docgen_jobs. Cada proceso arranca
+    DOCGEN_JOB_WORKERS hilos que reservan trabajos con FOR UPDATE SKIP LOCKED, de modo
+    que varios workers de gunicorn (o máquinas) pueden consumir la misma cola. Los
+    trabajos sobreviven a desconexiones del cliente y a reinicios: un trabajo 'running'
+    sin latido durante DOCGEN_JOB_STALE_S se vuelve a tomar (el progreso renueva el latido).
+    """
+
+    def __init__(self, workers: int = DOCGEN_JOB_WORKERS):
+        self.workers = workers
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._schema_ready = False
+        self._last_expire = 0.0
+
+    # ---- API usada por las rutas ----
+
+    def ensure_schema(self, conn):
+        if not self._schema_ready:
+            docgen_job_model.ensure_schema(conn)
+            conn.commit()
+            self._schema_ready = True
+
+    def enqueue(self, conn, user_id, instalacion_id, payload: Dict[str, Any], kind: str = "generate_docs",
+                progress_total: int = 0) -> str:
+        """Encola y confirma el trabajo (para que un worker pueda verlo ya) y avisa a los hilos locales."""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        self.ensure_schema(conn)
+        job_id = docgen_job_model.create_job(conn, user_id, instalacion_id, payload, kind, progress_total)
+        conn.commit()
+        self._wake.set()
+        return job_id
+
+    def start(self, app):
+        """Arranca los hilos consumidores de este proceso (idempotente; por PID, seguro tras fork)."""
+        if self.workers <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            for n in range(self.workers):
+                threading.Thread(target=self._loop, args=(app,), name=f"docgen-job-{n}", daemon=True).start()
+            self._pid = os.getpid()
+        logging.info(f"[JOBS] {self.workers} workers de generación de documentos arrancados (pid {os.getpid()}).")
+
+    # ---- Workers ----
+
+    def _loop(self, app):
+        backoff = 1.0
+        with app.app_context():
+            while True:
+                try:
+                    processed = self._run_once()
+                    backoff = 1.0
+                except Exception as e:
+                    logging.warning(f"[JOBS] Error en el worker: {e.__class__.__name__}: {e} → reintento en {backoff:.0f}s")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+                    continue
+                if not processed:
+                    self._wake.wait(DOCGEN_JOB_POLL_S)
+                    self._wake.clear()
+
+    def _run_once(self) -> bool:
+        conn = database.get_conn()
+        try:
+            self.ensure_schema(conn)
+            if time.monotonic() - self._last_expire > _EXPIRE_EVERY_S:
+                self._last_expire = time.monotonic()
+                deleted, abandoned = docgen_job_model.expire_jobs(
+                    conn, DOCGEN_JOB_RETENTION_S, DOCGEN_JOB_STALE_S, DOCGEN_JOB_MAX_ATTEMPTS)
+                conn.commit()
+                if deleted or abandoned:
+                    logging.info(f"[JOBS] Limpieza: {deleted} trabajos caducados borrados, {abandoned} abandonados.")
+            job = docgen_job_model.claim_next_job(conn, DOCGEN_JOB_STALE_S, DOCGEN_JOB_MAX_ATTEMPTS)
+            conn.commit()
+            if not job:
+                return False
+            self._process(conn, job)
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            database.release_conn(conn)
+
+    def _process(self, conn, job: Dict[str, Any]):
+        job_id = str(job["id"])
+        t0 = time.perf_counter()
+        logging.info(f"[JOBS] Trabajo {job_id} ({job['kind']}) intento {job['attempts']} iniciado.")
+
+        def progress(done: int, total: int):
+            docgen_job_model.update_progress(conn, job_id, done, total)
+            conn.commit()
+
+        data = None
+        try:
+            filename, data = JOB_HANDLERS[job["kind"]](conn, job, progress)
+            size = len(data) if isinstance(data, bytes) else data.seek(0, os.SEEK_END)
+            if not docgen_job_model.mark_done(conn, job_id, filename, data, attempt=job["attempts"]):
+                # Otro worker lo reclamó (sin latido durante DOCGEN_JOB_STALE_S): su resultado manda
+                conn.rollback()
+                logging.warning(f"[JOBS] Trabajo {job_id} reclamado por otro worker; se descarta el intento {job['attempts']}.")
+                return
+            conn.commit()
+            logging.info(f"[JOBS] Trabajo {job_id} terminado en {time.perf_counter() - t0:.2f}s ({size} bytes).")
+        except (LookupError, ValueError, RuntimeError) as e:
+            # Errores de datos: reintentar no cambia el resultado
+            conn.rollback()
+            docgen_job_model.mark_failed(conn, job_id, e)
+            conn.commit()
+            logging.warning(f"[JOBS] Trabajo {job_id} fallido: {e}")
+        except Exception as e:
+            conn.rollback()
+            retry = job["attempts"] < DOCGEN_JOB_MAX_ATTEMPTS
+            docgen_job_model.mark_failed(conn, job_id, e, retry=retry)
+            conn.commit()
+            logging.error(f"[JOBS] Error inesperado en trabajo {job_id} (reintento: {retry}): {e}", exc_info=True)
+        finally:
+            if data is not None and not isinstance(data, bytes):
+                data.close()
+
+
+# instancia global: la usan las rutas (encolar) y create_app (arrancar los workers)
+docgen_jobs = DocgenJobQueue()
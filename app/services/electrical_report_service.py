@@ -0,0 +1,235 @@
+# app/services/electrical_report_service.py
+
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services import calculator_kernels as kernels
+from app.services.calculator_service import ElectricalCalculator, PROTECTION_TABLES
+from app.services.catalog_index_service import catalog_index
+
+# Límites de caída de tensión (ITC-BT-40: 1,5 % entre generador y punto de conexión)
+MAX_CAIDA_DC_PCT = 1.5
+MAX_CAIDA_AC_PCT = 1.5
+# Tensión en el punto de máxima potencia estimada como fracción de Voc (sin dato de Vmp en catálogo)
+VMP_VOC_RATIO = 0.8
+# Factor de seguridad sobre la corriente del string para dimensionar cable y protección CC
+FACTOR_CORRIENTE_DC = 1.25
+TENSION_AC_MONOFASICA = 230.0
+TENSION_AC_TRIFASICA = 400.0
+
+DEFAULTS = {
+    'metodo_instalacion_dc': 'B1',
+    'aislamiento_dc': 'XLPE/EPR',
+    'metodo_instalacion_ac': 'B1',
+    'aislamiento_ac': 'PVC',
+    'temp_ambiente': 30,
+    'circuitos_agrupados': 1,
+}
+
+
+def _num(value, default=None) -> Optional[float]:
+    if value is None or value == '':
+        return default
+    try:
+        return float(str(value).replace(',', '.'))
+    except (TypeError, ValueError):
+        raise ValueError(f"Valor numérico no válido: {value!r}")
+
+
+def _material(value) -> str:
+    return str(value or 'cobre').strip().lower()
+
+
+def _default_strings(inst: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Un string por inversor con los paneles repartidos a partes iguales."""
+    num_paneles = int(_num(inst.get('numero_paneles'), 0))
+    num_inversores = max(1, int(_num(inst.get('numero_inversores'), 1)))
+    if num_paneles <= 0:
+        return []
+    longitud = _num(inst.get('longitud_cable_cc_string1')) or _num(inst.get('longitud_cable_dc_m'))
+    base, extra = divmod(num_paneles, num_inversores)
+    return [
+        {
+            'paneles_serie': base + (1 if i < extra else 0),
+            'longitud_m': longitud,
+            'seccion_mm2': inst.get('seccion_cable_dc_mm2'),
+            'material': inst.get('material_cable_dc'),
+        }
+        for i in range(num_inversores) if base + (1 if i < extra else 0) > 0
+    ]
+
+
+def _iz_checks(runs: List[Dict[str, Any]], currents: np.ndarray, params: Dict[str, Any]):
+    """Iz, Iz' y calibre In >= Ib para cada tramo; usa las tablas precompiladas."""
+    iz = np.full(len(runs), np.nan)
+    iz_corr = np.full(len(runs), np.nan)
+    for i, run in enumerate(runs):
+        value = PROTECTION_TABLES.iz_for(
+            run['seccion_mm2'], run['material'], run['metodo_instalacion'].upper(),
+            run['aislamiento'].upper(), run['conductores_cargados'],
+        )
+        if value:
+            kt = PROTECTION_TABLES.kt_for(run['aislamiento'], params['temp_ambiente'])
+            ka = PROTECTION_TABLES.ka_for(params['circuitos_agrupados'])
+            iz[i], iz_corr[i] = value, value * kt * ka
+    calibres = np.asarray(ElectricalCalculator.CALIBRES_MAGNETOTERMICO, dtype=np.float64)
+    pos = np.searchsorted(calibres, currents, side='left')
+    breaker = np.where(pos < len(calibres), calibres[np.minimum(pos, len(calibres) - 1)], np.nan)
+    return iz, iz_corr, breaker
+
+
+def build_electrical_report(conn, instalacion: Dict[str, Any], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Evalúa todos los strings CC y la línea CA de una instalación en una sola pasada
+    de los kernels vectorizados: caídas de tensión, comprobación de Iz' y protecciones.
+
+    'options' permite sobrescribir los strings (lista de {paneles_serie, longitud_m,
+    seccion_mm2, material}), las condiciones de instalación y los límites de caída.
+    """
+    options = options or {}
+    inst = catalog_index.enrich_context(conn, dict(instalacion))
+    if not isinstance(options, dict):
+        raise ValueError("Las opciones del informe deben ser un objeto.")
+    params = {k: options.get(k, v) for k, v in DEFAULTS.items()}
+    for key in ('metodo_instalacion_dc', 'aislamiento_dc', 'metodo_instalacion_ac', 'aislamiento_ac'):
+        if not isinstance(params[key], str) or not params[key].strip():
+            raise ValueError(f"'{key}' debe ser un texto no vacío.")
+    params['temp_ambiente'] = int(_num(params['temp_ambiente'], DEFAULTS['temp_ambiente']))
+    params['circuitos_agrupados'] = int(_num(params['circuitos_agrupados'], DEFAULTS['circuitos_agrupados']))
+    max_dc = _num(options.get('max_caida_dc_pct'), MAX_CAIDA_DC_PCT)
+    max_ac = _num(options.get('max_caida_ac_pct'), MAX_CAIDA_AC_PCT)
+
+    voc = _num(inst.get('tension_circuito_abierto_voc', inst.get('panel_tension_voc')))
+    pmax = _num(inst.get('potencia_pico_w'))
+    potencia_inversor = _num(inst.get('potencia_salida_va', inst.get('inversor_potencia_salida_va')))
+    num_inversores = max(1, int(_num(inst.get('numero_inversores'), 1)))
+    trifasico = bool(kernels.is_three_phase(inst.get('monofasico_trifasico') or 'monofasico'))
+
+    faltan = [name for name, v in (('tensión Voc del panel', voc), ('potencia pico del panel', pmax),
+                                   ('potencia de salida del inversor', potencia_inversor)) if not v]
+    if faltan:
+        raise ValueError(f"Faltan datos de catálogo para el informe eléctrico: {', '.join(faltan)}.")
+
+    strings = options.get('strings') or _default_strings(inst)
+    if not isinstance(strings, list):
+        raise ValueError("'strings' debe ser una lista.")
+
+    runs: List[Dict[str, Any]] = []
+    for i, s in enumerate(strings):
+        if not isinstance(s, dict):
+            raise ValueError(f"String {i + 1}: debe ser un objeto con 'paneles_serie', 'longitud_m', 'seccion_mm2' y 'material'.")
+        n_serie = int(_num(s.get('paneles_serie'), 0))
+        if n_serie <= 0:
+            raise ValueError(f"String {i + 1}: 'paneles_serie' debe ser mayor que cero.")
+        tension = n_serie * VMP_VOC_RATIO * voc
+        runs.append({
+            'tramo': f"string_{i + 1}",
+            'paneles_serie': n_serie,
+            'tension_v': tension,
+            'corriente_a': pmax / (VMP_VOC_RATIO * voc),
+            'corriente_diseno_a': FACTOR_CORRIENTE_DC * pmax / (VMP_VOC_RATIO * voc),
+            'longitud_m': _num(s.get('longitud_m'), 0.0),
+            'seccion_mm2': _num(s.get('seccion_mm2')),
+            'material': _material(s.get('material')),
+            'trifasico': False,
+            'cos_phi': 1.0,
+            'metodo_instalacion': params['metodo_instalacion_dc'],
+            'aislamiento': params['aislamiento_dc'],
+            'conductores_cargados': 2,
+            'max_caida_pct': max_dc,
+        })
+
+    tension_ac = TENSION_AC_TRIFASICA if trifasico else TENSION_AC_MONOFASICA
+    corriente_ac = potencia_inversor * num_inversores / (kernels.SQRT3 * tension_ac if trifasico else tension_ac)
+    runs.append({
+        'tramo': 'ac',
+        'tension_v': tension_ac,
+        'corriente_a': corriente_ac,
+        'corriente_diseno_a': corriente_ac,
+        'longitud_m': _num(inst.get('longitud_cable_ac_m'), 0.0),
+        'seccion_mm2': _num(inst.get('seccion_cable_ac_mm2')),
+        'material': _material(inst.get('material_cable_ac')),
+        'trifasico': trifasico,
+        'cos_phi': 1.0,
+        'metodo_instalacion': params['metodo_instalacion_ac'],
+        'aislamiento': params['aislamiento_ac'],
+        'conductores_cargados': 3 if trifasico else 2,
+        'max_caida_pct': max_ac,
+    })
+
+    sin_seccion = [r['tramo'] for r in runs if not r['seccion_mm2']]
+    if sin_seccion:
+        raise ValueError(f"Falta la sección de cable en: {', '.join(sin_seccion)}.")
+
+    # --- Una sola pasada vectorizada para todos los tramos ---
+    col = lambda key, dtype=np.float64: np.asarray([r[key] for r in runs], dtype=dtype)
+    diseno = col('corriente_diseno_a')
+    drop_v, drop_pct, _ = kernels.voltage_drop_kernel(
+        col('corriente_a'), col('longitud_m'), col('seccion_mm2'), kernels.resistivity_for(col('material', str)),
+        col('trifasico', bool), col('tension_v'), col('cos_phi'),
+    )
+    iz, iz_corr, breaker = _iz_checks(runs, diseno, params)
+
+    calculator = ElectricalCalculator()
+    avisos = []
+    tramos = []
+    for i, run in enumerate(runs):
+        cumple_caida = bool(drop_pct[i] <= run['max_caida_pct'])
+        cumple_iz = bool(not np.isnan(iz_corr[i]) and not np.isnan(breaker[i]) and breaker[i] <= iz_corr[i])
+        if np.isnan(iz[i]):
+            avisos.append(f"{run['tramo']}: sección {run['seccion_mm2']} mm² fuera de la tabla UNE para {run['material']}/{run['metodo_instalacion']}/{run['aislamiento']}.")
+        result = {
+            'tramo': run['tramo'],
+            'tension_v': round(run['tension_v'], 2),
+            'corriente_a': round(run['corriente_a'], 2),
+            'corriente_diseno_a': round(run['corriente_diseno_a'], 2),
+            'longitud_m': run['longitud_m'],
+            'seccion_mm2': run['seccion_mm2'],
+            'material': run['material'],
+            'caida_tension_v': round(float(drop_v[i]), 3),
+            'caida_tension_pct': round(float(drop_pct[i]), 3),
+            'cumple_caida': cumple_caida,
+            'iz_a': None if np.isnan(iz[i]) else round(float(iz[i]), 2),
+            'iz_corregida_a': None if np.isnan(iz_corr[i]) else round(float(iz_corr[i]), 2),
+            'cumple_iz': cumple_iz,
+            'proteccion_in_a': None if np.isnan(breaker[i]) else int(breaker[i]),
+        }
+        if 'paneles_serie' in run:
+            result['paneles_serie'] = run['paneles_serie']
+        if not (cumple_caida and cumple_iz):
+            # Sección que sí cumple ambos criterios, con el mismo motor que /optimal-section
+            try:
+                optima = calculator.calculate_optimal_section({
+                    'system_type': 'trifasico' if run['trifasico'] else 'monofasico',
+                    'voltage': run['tension_v'],
+                    'corriente_empleo_ib': run['corriente_diseno_a'],
+                    'cos_phi': run['cos_phi'],
+                    'length': run['longitud_m'],
+                    'max_voltage_drop_percent': run['max_caida_pct'],
+                    'conductor': run['material'],
+                    'aislamiento': run['aislamiento'],
+                    'metodo_instalacion': run['metodo_instalacion'],
+                    'temp_ambiente': params['temp_ambiente'],
+                    'circuitos_agrupados': params['circuitos_agrupados'],
+                    'conductores_cargados': run['conductores_cargados'],
+                })
+                result['seccion_recomendada_mm2'] = optima['seccion_comercial']['value']
+            except ValueError as e:
+                logging.info(f"Sin sección recomendada para {run['tramo']}: {e}")
+                result['seccion_recomendada_mm2'] = None
+        tramos.append(result)
+
+    peor_string = max((t['caida_tension_pct'] for t in tramos[:-1]), default=0.0)
+    return {
+        'instalacion_id': inst.get('id'),
+        'sistema_ac': 'trifasico' if trifasico else 'monofasico',
+        'parametros': dict(params, max_caida_dc_pct=max_dc, max_caida_ac_pct=max_ac),
+        'strings': tramos[:-1],
+        'ac': tramos[-1],
+        'caida_total_pct': round(peor_string + tramos[-1]['caida_tension_pct'], 3),
+        'polos_ac': 4 if trifasico else 2,
+        'cumple': all(t['cumple_caida'] and t['cumple_iz'] for t in tramos),
+        'avisos': avisos,
+    }
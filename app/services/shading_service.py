@@ -0,0 +1,182 @@
+# app/services/shading_service.py
+"""
+Simulación anual de sombras entre filas de paneles.
+
+Posición solar vectorizada para las 8760 horas de un año de referencia (hora solar,
+fórmula de Cooper para la declinación) y pérdida por sombreado ponderada por la
+irradiancia directa de cielo despejado sobre el plano del panel (modelo de Meinel).
+
+Geometría (filas orientadas al ecuador, lado inclinado L, inclinación β, paso D entre
+filas): con el ángulo de perfil tan αp = tan(α) / cos(γ), la fracción sombreada del
+lado inclinado de la fila posterior es
+    fs = clip(1 − (D / L) · sin αp / sin(β + αp), 0, 1)
+D se mide entre bordes inferiores de filas consecutivas: D = L·cos β + d2, con 'd2'
+la distancia horizontal de calculate_panel_separation.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Constante solar aparente y transmitancia del modelo de Meinel para cielo despejado
+_DNI_SOLAR_CONSTANT = 1353.0
+_DNI_TRANSMITTANCE = 0.7
+# Límites de la rejilla de barrido (combinaciones inclinación × paso × latitud)
+MAX_SWEEP_POINTS = 5000
+_BISECT_TOL_M = 0.001
+
+
+@lru_cache(maxsize=64)
+def _sun_positions(latitude_deg: float):
+    """
+    Altura solar y acimut (respecto al ecuador) de las horas diurnas del año, y la
+    irradiancia directa normal de cielo despejado. Para latitudes sur se usa la simetría
+    (filas orientadas al norte). Devuelve arrays de solo lectura.
+    """
+    day = np.repeat(np.arange(1, 366), 24)
+    hour = np.tile(np.arange(24) + 0.5, 365)
+    phi = np.radians(abs(latitude_deg))
+    dec = np.radians(23.45 * np.sin(np.radians(360.0 / 365.0 * (284 + day))))
+    if latitude_deg < 0:
+        dec = -dec
+    omega = np.radians(15.0 * (hour - 12.0))
+
+    sin_alt = np.sin(phi) * np.sin(dec) + np.cos(phi) * np.cos(dec) * np.cos(omega)
+    alt = np.arcsin(np.clip(sin_alt, -1.0, 1.0))
+    azimuth = np.arctan2(np.sin(omega), np.cos(omega) * np.sin(phi) - np.tan(dec) * np.cos(phi))
+
+    up = alt > np.radians(0.5)
+    alt, azimuth = alt[up], azimuth[up]
+    air_mass = 1.0 / np.sin(alt)
+    dni = _DNI_SOLAR_CONSTANT * _DNI_TRANSMITTANCE ** (air_mass ** 0.678)
+    for a in (alt, azimuth, dni):
+        a.setflags(write=False)
+    return alt, azimuth, dni
+
+
+def _loss_grid(side_m: float, tilts_deg: np.ndarray, pitches_m: np.ndarray, latitude_deg: float) -> np.ndarray:
+    """Pérdida anual (fracción de la irradiación directa) con forma (n_inclinaciones, n_pasos)."""
+    alt, azimuth, dni = _sun_positions(round(float(latitude_deg), 2))
+    beta = np.radians(np.asarray(tilts_deg, dtype=np.float64))[:, None]
+    cos_az = np.cos(azimuth)[None, :]
+    # Irradiancia directa sobre el plano del panel (solo sol por delante del panel)
+    cos_inc = np.sin(alt)[None, :] * np.cos(beta) + np.cos(alt)[None, :] * np.sin(beta) * cos_az
+    weight = dni[None, :] * np.clip(cos_inc, 0.0, None)  # (n_tilt, n_horas)
+    total = weight.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profile = np.arctan2(np.tan(alt), np.cos(azimuth))  # en (0, π) para sol por encima del horizonte
+        ratio = np.sin(profile)[None, :] / np.sin(beta + profile[None, :])  # (n_tilt, n_horas)
+    # Sin sol útil no importa el valor; con el sol detrás de la fila (cos γ <= 0) la fila
+    # anterior no proyecta sombra sobre la cara activa: razón infinita -> fs = 0
+    ratio = np.where(weight > 0, np.where(cos_az > 0, ratio, np.inf), 0.0)
+
+    losses = np.empty((beta.shape[0], len(pitches_m)))
+    for j, pitch in enumerate(np.asarray(pitches_m, dtype=np.float64)):
+        fs = np.clip(1.0 - (pitch / side_m) * ratio, 0.0, 1.0)
+        losses[:, j] = (weight * fs).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total[:, None] > 0, losses / total[:, None], 0.0)
+
+
+def _validate(side_m: float, tilt_deg: float, latitude_deg: float):
+    if side_m <= 0:
+        raise ValueError("El lado vertical del panel debe ser mayor que cero.")
+    if not 0 <= tilt_deg < 90:
+        raise ValueError("La inclinación debe estar entre 0 y 90 grados.")
+    if not -90 < latitude_deg < 90:
+        raise ValueError("La latitud debe estar entre -90 y 90 grados.")
+
+
+def annual_shading_loss(side_m: float, tilt_deg: float, pitch_m: float, latitude_deg: float,
+                        num_filas: Optional[int] = None) -> float:
+    """
+    Pérdida anual por sombreado entre filas (%) sobre la irradiación directa.
+    Con 'num_filas' se promedia sobre el campo (la primera fila no recibe sombra).
+    """
+    _validate(side_m, tilt_deg, latitude_deg)
+    if pitch_m <= 0:
+        raise ValueError("El paso entre filas debe ser mayor que cero.")
+    loss = float(_loss_grid(side_m, np.array([tilt_deg]), np.array([pitch_m]), latitude_deg)[0, 0])
+    if num_filas:
+        loss *= (int(num_filas) - 1) / int(num_filas)
+    return loss * 100.0
+
+
+def minimal_pitch(side_m: float, tilt_deg: float, latitude_deg: float, target_loss_pct: float) -> float:
+    """Menor paso entre filas (m) cuya pérdida anual no supera el objetivo; bisección sobre D."""
+    _validate(side_m, tilt_deg, latitude_deg)
+    if target_loss_pct < 0:
+        raise ValueError("La pérdida objetivo no puede ser negativa.")
+    loss = lambda d: float(_loss_grid(side_m, np.array([tilt_deg]), np.array([d]), latitude_deg)[0, 0]) * 100.0
+
+    low = side_m * np.cos(np.radians(tilt_deg))  # filas tocándose
+    if loss(low) <= target_loss_pct:
+        return float(low)
+    high = max(low, side_m) * 2.0
+    while loss(high) > target_loss_pct:
+        high *= 2.0
+        if high > side_m * 1000:
+            raise ValueError("No se alcanza la pérdida objetivo con un paso razonable (¿latitud polar?).")
+    while high - low > _BISECT_TOL_M:
+        mid = 0.5 * (low + high)
+        if loss(mid) > target_loss_pct:
+            low = mid
+        else:
+            high = mid
+    return float(high)
+
+
+def sweep(side_m: float, tilts_deg: Sequence[float], pitches_m: Sequence[float],
+          latitudes_deg: Sequence[float]) -> List[Dict[str, Any]]:
+    """
+    Barrido de pérdidas anuales (%) sobre la rejilla inclinación × paso para cada latitud:
+    [{"latitude_deg", "losses_percent": [[por paso] por inclinación]}].
+    """
+    tilts, pitches = np.asarray(tilts_deg, dtype=np.float64), np.asarray(pitches_m, dtype=np.float64)
+    if tilts.size == 0 or pitches.size == 0 or len(latitudes_deg) == 0:
+        raise ValueError("Las listas de inclinaciones, pasos y latitudes no pueden estar vacías.")
+    if tilts.size * pitches.size * len(latitudes_deg) > MAX_SWEEP_POINTS:
+        raise ValueError(f"Demasiadas combinaciones en el barrido. Máximo: {MAX_SWEEP_POINTS}.")
+    if (pitches <= 0).any():
+        raise ValueError("Los pasos entre filas deben ser mayores que cero.")
+    results = []
+    for lat in latitudes_deg:
+        for tilt in tilts:
+            _validate(side_m, float(tilt), float(lat))
+        grid = _loss_grid(side_m, tilts, pitches, float(lat)) * 100.0
+        results.append({"latitude_deg": float(lat), "losses_percent": np.round(grid, 3).tolist()})
+    return results
+
+
+def shading_analysis(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Punto de entrada de la ruta: según los datos presentes calcula la pérdida anual
+    para un paso ('pitch_m'), el paso mínimo para una pérdida objetivo
+    ('target_loss_percent') y/o un barrido ('sweep': {tilts_deg, pitches_m, latitudes_deg}).
+    """
+    try:
+        side = float(params['panel_vertical_side_m'])
+        tilt = float(params.get('panel_inclination_deg', 30))
+        lat = float(params.get('latitude_deg', 40))
+    except KeyError as e:
+        raise ValueError(f"Falta el dato {e}.")
+
+    result: Dict[str, Any] = {}
+    if params.get('pitch_m') not in (None, ''):
+        loss = annual_shading_loss(side, tilt, float(params['pitch_m']), lat, params.get('num_filas'))
+        result["annual_shading_loss"] = {"value": round(loss, 3), "unit": "%", "info": "Pérdida anual por sombreado entre filas (irradiación directa)."}
+    if params.get('target_loss_percent') not in (None, ''):
+        pitch = minimal_pitch(side, tilt, lat, float(params['target_loss_percent']))
+        result["minimal_pitch_m"] = {"value": round(pitch, 3), "unit": "m", "info": "Paso mínimo entre filas para la pérdida objetivo."}
+    if params.get('sweep'):
+        grid = params['sweep']
+        result["sweep"] = {
+            "tilts_deg": list(grid.get('tilts_deg', [tilt])),
+            "pitches_m": list(grid.get('pitches_m', [])),
+            "results": sweep(side, grid.get('tilts_deg', [tilt]), grid.get('pitches_m', []), grid.get('latitudes_deg', [lat])),
+        }
+    if not result:
+        raise ValueError("Indique 'pitch_m', 'target_loss_percent' o 'sweep'.")
+    return result
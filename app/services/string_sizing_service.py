@@ -0,0 +1,146 @@
+# app/services/string_sizing_service.py
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.services.catalog_index_service import catalog_index
+
+# Coeficiente de temperatura de Voc por defecto (%/°C); el catálogo no lo incluye
+COEF_VOC_PCT_DEFAULT = -0.30
+# Sobretemperatura de la célula respecto al ambiente a plena irradiancia (°C)
+INCREMENTO_TEMP_CELULA = 25.0
+# Vmp estimada como fracción de Voc (el catálogo solo tiene Voc)
+VMP_VOC_RATIO = 0.8
+# Sobredimensionado DC/AC admitido si el inversor no tiene potencia máxima de paneles
+RATIO_DC_AC_MAX = 1.3
+DEFAULT_LIMIT = 10
+
+
+def _num(value, name: str, default=None) -> Optional[float]:
+    if value is None or value == '':
+        if default is None:
+            raise ValueError(f"Falta el dato '{name}'.")
+        return default
+    try:
+        return float(str(value).replace(',', '.'))
+    except (TypeError, ValueError):
+        raise ValueError(f"Valor numérico no válido para '{name}': {value!r}")
+
+
+def voc_at(voc_stc, temp_c, coef_voc_pct=COEF_VOC_PCT_DEFAULT):
+    """Voc corregida por temperatura de célula: Voc(T) = Voc_stc · (1 + β·(T − 25))."""
+    return np.asarray(voc_stc, dtype=np.float64) * (1.0 + coef_voc_pct / 100.0 * (np.asarray(temp_c, dtype=np.float64) - 25.0))
+
+
+def size_strings(panel: Dict[str, Any], inversor: Dict[str, Any], numero_paneles: int,
+                 numero_inversores: int = 1, temp_min: float = -10.0, temp_max: float = 40.0,
+                 coef_voc_pct: float = COEF_VOC_PCT_DEFAULT, tension_min_mppt_v: Optional[float] = None,
+                 max_strings_paralelo: Optional[int] = None, limit: int = DEFAULT_LIMIT) -> Dict[str, Any]:
+    """
+    Enumera las configuraciones serie/paralelo válidas por inversor y las ordena.
+
+    - Voc a la temperatura mínima (peor caso) <= tensión máxima de entrada del inversor.
+    - Vmp a la temperatura máxima de célula >= tensión mínima MPPT (si se indica).
+    - Potencia DC por inversor <= potencia máxima de paneles del inversor.
+
+    Poda: el número de paneles en serie queda acotado por las tensiones, y para cada
+    número en serie solo se evalúa el mayor número de strings en paralelo que cabe
+    (cualquier valor menor usa menos paneles con la misma serie y queda dominado).
+    El coste es O(rango de paneles en serie), independiente del tamaño del campo.
+    """
+    voc = _num(panel.get('tension_circuito_abierto_voc'), 'tension_circuito_abierto_voc')
+    pmax = _num(panel.get('potencia_pico_w'), 'potencia_pico_w')
+    v_max = _num(inversor.get('tension_max_entrada_v'), 'tension_max_entrada_v')
+    p_inv = inversor.get('potencia_max_paneles_w')
+    if p_inv in (None, ''):
+        p_inv = _num(inversor.get('potencia_salida_va'), 'potencia_max_paneles_w') * RATIO_DC_AC_MAX
+    else:
+        p_inv = _num(p_inv, 'potencia_max_paneles_w')
+    numero_paneles, numero_inversores = int(numero_paneles), int(numero_inversores)
+    if voc <= 0 or pmax <= 0 or v_max <= 0 or p_inv <= 0:
+        raise ValueError("Voc, potencia del panel y límites del inversor deben ser mayores que cero.")
+    if numero_paneles < 1 or numero_inversores < 1:
+        raise ValueError("El número de paneles e inversores debe ser 1 o mayor.")
+    if temp_min > temp_max:
+        raise ValueError("La temperatura mínima no puede ser mayor que la máxima.")
+
+    voc_frio = float(voc_at(voc, temp_min, coef_voc_pct))
+    vmp_calor = float(voc_at(voc, temp_max + INCREMENTO_TEMP_CELULA, coef_voc_pct)) * VMP_VOC_RATIO
+    paneles_por_inversor = numero_paneles // numero_inversores
+
+    # Rango de paneles en serie acotado por las tensiones del inversor
+    ns_max = min(int(v_max // voc_frio), paneles_por_inversor)
+    ns_min = max(1, int(np.ceil(tension_min_mppt_v / vmp_calor))) if tension_min_mppt_v else 1
+    result = {
+        "voc_frio_v": round(voc_frio, 2),
+        "vmp_calor_v": round(vmp_calor, 2),
+        "serie_min": ns_min,
+        "serie_max": ns_max,
+        "configuraciones": [],
+    }
+    if ns_max < ns_min:
+        return result
+
+    ns = np.arange(ns_min, ns_max + 1)
+    np_max = np.minimum(paneles_por_inversor // ns, np.floor(p_inv / (ns * pmax)).astype(np.int64))
+    if max_strings_paralelo:
+        np_max = np.minimum(np_max, int(max_strings_paralelo))
+    valid = np_max >= 1
+    ns, np_max = ns[valid], np_max[valid]
+    if ns.size == 0:
+        return result
+
+    usados = ns * np_max * numero_inversores
+    sin_usar = numero_paneles - usados
+    potencia_dc = ns * np_max * pmax
+    voc_string = ns * voc_frio
+    # Orden: más paneles aprovechados, después mayor tensión de string (menos corriente y pérdidas)
+    order = np.lexsort((np_max, -ns, sin_usar))[:max(1, int(limit))]
+
+    result["configuraciones"] = [
+        {
+            "paneles_serie": int(ns[i]),
+            "strings_paralelo": int(np_max[i]),
+            "numero_inversores": numero_inversores,
+            "paneles_usados": int(usados[i]),
+            "paneles_sin_usar": int(sin_usar[i]),
+            "potencia_dc_por_inversor_w": round(float(potencia_dc[i]), 1),
+            "carga_inversor_pct": round(float(potencia_dc[i] / p_inv * 100.0), 1),
+            "voc_string_frio_v": round(float(voc_string[i]), 1),
+            "margen_tension_pct": round(float((v_max - voc_string[i]) / v_max * 100.0), 1),
+            "vmp_string_calor_v": round(float(ns[i] * vmp_calor), 1),
+        }
+        for i in order
+    ]
+    return result
+
+
+def size_strings_for_request(conn, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Resuelve panel e inversor (por id o nombre a través del índice de catálogos, o
+    datos en línea en 'panel'/'inversor') y ejecuta size_strings con los parámetros del cuerpo.
+    """
+    panel = data.get('panel') or catalog_index.get_panel(conn, data.get('panel_id'), data.get('panel_nombre'))
+    inversor = data.get('inversor') or catalog_index.get_inversor(conn, data.get('inversor_id'), data.get('inversor_nombre'))
+    if not panel:
+        raise ValueError("Panel no encontrado en el catálogo.")
+    if not inversor:
+        raise ValueError("Inversor no encontrado en el catálogo.")
+
+    max_paralelo = data.get('max_strings_paralelo')
+    mppt = data.get('tension_min_mppt_v')
+    result = size_strings(
+        panel, inversor,
+        numero_paneles=int(_num(data.get('numero_paneles'), 'numero_paneles')),
+        numero_inversores=int(_num(data.get('numero_inversores'), 'numero_inversores', 1)),
+        temp_min=_num(data.get('temp_min'), 'temp_min', -10.0),
+        temp_max=_num(data.get('temp_max'), 'temp_max', 40.0),
+        coef_voc_pct=_num(data.get('coef_voc_pct'), 'coef_voc_pct', COEF_VOC_PCT_DEFAULT),
+        tension_min_mppt_v=_num(mppt, 'tension_min_mppt_v') if mppt not in (None, '') else None,
+        max_strings_paralelo=int(_num(max_paralelo, 'max_strings_paralelo')) if max_paralelo not in (None, '') else None,
+        limit=int(_num(data.get('limit'), 'limit', DEFAULT_LIMIT)),
+    )
+    result["panel"] = panel.get('nombre_panel')
+    result["inversor"] = inversor.get('nombre_inversor')
+    return result
@@ -0,0 +1,288 @@
+# benchmarks/run_benchmarks.py
+"""
+Microbenchmarks de la calculadora eléctrica y de los calculadores de docgen.
+
+Uso (desde la raíz del repositorio, sin red ni base de datos):
+    python benchmarks/run_benchmarks.py                 # ejecuta y compara con baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline # guarda los resultados como nueva referencia
+    python benchmarks/run_benchmarks.py --filter iz --sizes 1,1000 --fail-on-regression
+
+Cada caso se mide sobre N entradas sintéticas deterministas (semilla fija) para cada
+tamaño de --sizes; se repite --repeat veces y se guarda el mínimo y la mediana del
+tiempo por llamada. Los resultados van a benchmarks/results/ (ignorado por git).
+La caché de la calculadora se desactiva para medir el cálculo real.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import datetime
+import statistics
+from typing import Any, Callable, Dict, List
+
+os.environ.setdefault("CALC_CACHE_ENABLED", "0")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from app.services import calculator_kernels as kernels  # noqa: E402
+from app.services.calculator_service import CURRENT_METHODS, ElectricalCalculator  # noqa: E402
+from app.services.doc_generation.generation.calculators.structural_calculations import calculate_structural_data  # noqa: E402
+from app.services.doc_generation.generation.calculators.electrical_calculations import calculate_electrical_data  # noqa: E402
+from app.services.doc_generation.generation.calculators.common_calculations import calculate_format_addresses  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_SIZES = (1, 100, 1000)
+SEED = 1234
+
+
+# --- Generadores de entradas sintéticas ---
+
+def _voltage_drop_inputs(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    return [{
+        "current": {"value": rng.uniform(1, 60), "unit": rng.choice(["A", "mA"])},
+        "length": {"value": rng.uniform(1, 150), "unit": rng.choice(["m", "ft"])},
+        "wire_cross_section": {"value": rng.choice([1.5, 2.5, 4, 6, 10, 16]), "unit": "mm²"},
+        "material": rng.choice(["cobre", "aluminio"]),
+        "system_type": rng.choice(["monofasico", "trifasico"]),
+        "source_voltage": {"value": rng.choice([230, 400]), "unit": "V"},
+    } for _ in range(n)]
+
+
+def _wire_section_inputs(rng, n):
+    return [{
+        "system_type": rng.choice(["monofasico", "trifasico"]),
+        "voltage": rng.choice([230, 400]),
+        "power": rng.uniform(500, 40000),
+        "cos_phi": rng.uniform(0.8, 1.0),
+        "length": rng.uniform(1, 150),
+        "max_voltage_drop_percent": rng.choice([1.5, 3, 5]),
+        "material": rng.choice(["cobre", "aluminio"]),
+    } for _ in range(n)]
+
+
+def _protections_inputs(rng, n):
+    return [{
+        "corriente_empleo_ib": rng.uniform(2, 60),
+        "seccion_fase_cable": rng.choice([2.5, 4, 6, 10, 16, 25]),
+        "conductor": "cobre",
+        "aislamiento": rng.choice(["PVC", "XLPE/EPR"]),
+        "metodo_instalacion": rng.choice(["B1", "B2", "C"]),
+        "temp_ambiente": rng.choice([25, 30, 40, 50]),
+        "circuitos_agrupados": rng.randint(1, 6),
+    } for _ in range(n)]
+
+
+def _optimal_section_inputs(rng, n):
+    return [{
+        "system_type": rng.choice(["monofasico", "trifasico"]),
+        "voltage": rng.choice([230, 400]),
+        "corriente_empleo_ib": rng.uniform(2, 90),
+        "length": rng.uniform(1, 100),
+        "max_voltage_drop_percent": rng.choice([1.5, 3]),
+        "conductor": "cobre",
+        "aislamiento": rng.choice(["PVC", "XLPE/EPR"]),
+        "metodo_instalacion": rng.choice(["B1", "C"]),
+        "temp_ambiente": rng.choice([30, 40]),
+    } for _ in range(n)]
+
+
+def _iz_inputs(rng, n):
+    return [(rng.choice([1.5, 2.5, 4, 6, 10, 16, 20, 35]), "cobre", rng.choice(["B1", "B2", "C"]),
+             rng.choice(["PVC", "XLPE/EPR"]), rng.choice([2, 3])) for _ in range(n)]
+
+
+def _current_inputs(rng, n):
+    methods = CURRENT_METHODS
+    return [(rng.choice(methods), {
+        "power_p": rng.uniform(100, 10000), "voltage_u": rng.choice([230, 400]), "cos_phi": rng.uniform(0.8, 1),
+        "resistance_r": rng.uniform(1, 50), "impedance_z": rng.uniform(1, 50), "apparent_power_s": rng.uniform(100, 10000),
+        "reactive_power_q": rng.uniform(100, 5000), "sin_phi": rng.uniform(0.2, 0.6),
+    }) for _ in range(n)]
+
+
+def _voltage_inputs(rng, n):
+    methods = ["Potencia (P), Corriente (I), cos φ", "Corriente (I) y Impedancia (Z)"]
+    return [(rng.choice(methods), {
+        "current_i": rng.uniform(1, 50), "resistance_r": rng.uniform(1, 50),
+        "impedance_z": rng.uniform(1, 50), "power_p": rng.uniform(100, 10000), "cos_phi": 1.0,
+    }) for _ in range(n)]
+
+
+def _separation_inputs(rng, n):
+    return [(rng.uniform(1.0, 2.5), rng.uniform(10, 45), rng.uniform(27, 44)) for _ in range(n)]
+
+
+def _docgen_contexts(rng, n):
+    ctxs = []
+    for _ in range(n):
+        direccion = {"nombre_via": "Calle Mayor", "numero_via": str(rng.randint(1, 200)), "piso_puerta": "2B",
+                     "localidad": "Madrid", "provincia": "Madrid"}
+        ctxs.append({
+            "numero_paneles": rng.randint(4, 40),
+            "paneles": [{"largo_mm": 1722, "ancho_mm": 1134, "peso_kg": 21.5, "potencia_pico_w": rng.choice([400, 450, 500]),
+                         "corriente_maxima_funcionamiento_a": 10.5, "tension_maximo_funcionamiento_v": 41.0}],
+            "inversor": {"corriente_maxima_salida_a": rng.uniform(10, 30), "monofasico_trifasico": rng.choice(["Monofásico", "Trifásico"])},
+            "cableado": {"longitud_cable_cc_string1": rng.uniform(5, 50), "seccion_cable_dc_mm2": 6.0, "material_cable_dc": "Cobre",
+                         "longitud_cable_ac_m": rng.uniform(5, 50), "seccion_cable_ac_mm2": 6.0, "material_cable_ac": "Cobre"},
+            "protecciones": {"fusible_cc_a": 15, "protector_sobretensiones_v": "1000V", "magnetotermico_ac_a": 25,
+                             "diferencial_a": 40, "sensibilidad_ma": 30},
+            "emplazamiento": direccion, "promotor": dict(direccion), "instalador": dict(direccion),
+            "fecha_finalizacion": datetime.date(2024, 5, 17),
+        })
+    return ctxs
+
+
+def _batch_inputs(rng, n):
+    """
+    Lotes completos de 100 operaciones de caída de tensión (al menos uno), para que el
+    tiempo por llamada sea siempre el de un lote de 100 sea cual sea N.
+    """
+    batches = []
+    for _ in range(max(1, -(-n // 100))):
+        batches.append([{"operation": "voltage-drop", "data": d} for d in _voltage_drop_inputs(rng, 100)])
+    return batches
+
+
+def _call_each(fn: Callable, inputs: List[Any]) -> Callable[[], None]:
+    def run():
+        for item in inputs:
+            fn(item)
+    return run
+
+
+# --- Definición de casos: nombre -> (generador de entradas, función que consume una entrada) ---
+
+def build_cases() -> Dict[str, Any]:
+    calc = ElectricalCalculator()
+
+    def tolerant(fn):
+        # Algunas entradas sintéticas son inválidas a propósito (p. ej. Iz fuera de tabla)
+        def wrapped(item):
+            try:
+                fn(item)
+            except ValueError:
+                pass
+        return wrapped
+
+    cases = {
+        "calculator.voltage_drop": (_voltage_drop_inputs, lambda d: calc.calculate_voltage_drop(**d)),
+        "calculator.wire_section": (_wire_section_inputs, lambda d: calc.calculate_wire_section(**d)),
+        "calculator.current": (_current_inputs, tolerant(lambda a: calc.calculate_current(*a))),
+        "calculator.voltage": (_voltage_inputs, tolerant(lambda a: calc.calculate_voltage(*a))),
+        "calculator.protections": (_protections_inputs, tolerant(calc.calculate_protections)),
+        "calculator.optimal_section": (_optimal_section_inputs, tolerant(calc.calculate_optimal_section)),
+        "calculator.panel_separation": (_separation_inputs, lambda a: calc.calculate_panel_separation(*a)),
+        "calculator.get_iz_from_table": (_iz_inputs, tolerant(lambda a: calc.get_iz_from_table(*a))),
+        "calculator.voltage_drop_tolerance_2k": (
+            _voltage_drop_inputs, lambda d: calc.calculate_voltage_drop_tolerance(dict(d, samples=2000))),
+        # Lotes de hasta 100 operaciones; el tiempo es por lote
+        "calculator.run_batch_x100": (
+            _batch_inputs, calc.run_batch),
+        "docgen.calculate_structural_data": (_docgen_contexts, calculate_structural_data),
+        "docgen.calculate_electrical_data": (_docgen_contexts, calculate_electrical_data),
+        "docgen.calculate_format_addresses": (_docgen_contexts, calculate_format_addresses),
+    }
+    # Kernels vectorizados: una única llamada con arrays de tamaño N
+    cases["kernels.voltage_drop_kernel"] = (
+        lambda rng, n: [(np.random.default_rng(SEED).uniform(1, 60, n), np.full(n, 30.0), np.full(n, 6.0))],
+        lambda a: kernels.voltage_drop_kernel(a[0], a[1], a[2], kernels.RESISTIVIDAD_COBRE, False, 230.0),
+    )
+    return cases
+
+
+def measure(fn: Callable[[], None], calls: int, repeat: int) -> Dict[str, float]:
+    """Tiempo por llamada (µs): mínimo y mediana de 'repeat' repeticiones, tras un calentamiento."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) / calls * 1e6)
+    return {"min_us": round(min(samples), 3), "median_us": round(statistics.median(samples), 3)}
+
+
+def run(sizes, repeat: int, name_filter: str = "") -> Dict[str, Any]:
+    results = {}
+    for name, (gen, fn) in build_cases().items():
+        if name_filter and name_filter not in name:
+            continue
+        for n in sizes:
+            inputs = gen(random.Random(SEED), n)
+            stats = measure(_call_each(fn, inputs), max(len(inputs), 1), repeat)
+            results[f"{name}[{n}]"] = stats
+            print(f"{name + '[' + str(n) + ']':<50} min {stats['min_us']:>12.3f} µs   mediana {stats['median_us']:>12.3f} µs")
+    return {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold_pct: float) -> List[str]:
+    """Casos cuya mediana empeora más de 'threshold_pct' respecto a la referencia."""
+    regressions = []
+    for key, stats in current["results"].items():
+        ref = baseline.get("results", {}).get(key)
+        if not ref or not ref.get("median_us"):
+            continue
+        change = (stats["median_us"] - ref["median_us"]) / ref["median_us"] * 100.0
+        marker = "REGRESIÓN" if change > threshold_pct else ""
+        print(f"{key:<50} {ref['median_us']:>12.3f} -> {stats['median_us']:>12.3f} µs  {change:+7.1f}% {marker}")
+        if marker:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Tamaños de entrada separados por comas.")
+    parser.add_argument("--repeat", type=int, default=7, help="Repeticiones por caso.")
+    parser.add_argument("--filter", default="", help="Solo casos cuyo nombre contenga este texto.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Fichero de referencia para comparar.")
+    parser.add_argument("--save-baseline", action="store_true", help="Guarda los resultados como referencia.")
+    parser.add_argument("--threshold", type=float, default=25.0, help="Empeoramiento (%%) que cuenta como regresión.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Sale con código 1 si hay regresiones.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    current = run(sizes, args.repeat, args.filter)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out_path = os.path.join(RESULTS_DIR, f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {out_path}")
+
+    if args.save_baseline:
+        # baseline.json está versionado: CRLF como el resto del repositorio
+        with open(args.baseline, "w", encoding="utf-8", newline="\r\n") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"Referencia actualizada: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No hay referencia; use --save-baseline para crearla.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nComparación con {args.baseline} (umbral {args.threshold}%):")
+    regressions = compare(current, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regresiones detectadas.")
+        return 1 if args.fail_on_regression else 0
+    print("\nSin regresiones.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())